@@ -0,0 +1,470 @@
+# ai_client_async.py
+"""
+Asyncio client for Ollama /api/chat, for services that generate tests for
+many repos concurrently without a thread per request.
+
+- AsyncOllamaClient: keep-alive connections, a semaphore bounding in-flight
+  requests, per-request deadlines, and clean cancellation (a cancelled
+  request's connection is dropped, never reused).
+- generate_many(): fan out many (diff_summary, spec_snippet) jobs at once.
+- Requests update the same metrics as the blocking client (metrics.py).
+
+Uses only the standard library: a minimal HTTP/1.1 client over asyncio
+streams (Content-Length and chunked bodies), so no extra dependency is
+needed next to requests.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import ssl
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlsplit
+
+from ai_client_ollama import (
+    CONNECT_TIMEOUT_SECONDS,
+    OllamaError,
+    OllamaUnavailableError,
+    build_test_generation_messages,
+    default_model,
+    default_url,
+)
+from metrics import LLM_REQUESTS_IN_FLIGHT, observe_llm_request
+from token_budget import Usage, UsageLog, estimate_message_tokens, usage_from_response
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+def _status_error(status: int, text: bytes) -> OllamaError:
+    error = OllamaUnavailableError if status >= 500 else OllamaError
+    return error(f"Ollama returned HTTP {status}: {text[:500]!r}")
+
+
+class _Response:
+    """Status, headers and body reader of one HTTP/1.1 response."""
+
+    def __init__(
+        self,
+        status: int,
+        headers: Dict[str, str],
+        reader: asyncio.StreamReader,
+        idle_timeout: Optional[float],
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        self._idle_timeout = idle_timeout
+        self._complete = False
+
+    @property
+    def keep_alive(self) -> bool:
+        """True if the body was read to its end and the server keeps the connection."""
+        if not self._complete or self.headers.get("connection", "").lower() == "close":
+            return False
+        return "content-length" in self.headers or self._chunked
+
+    @property
+    def _chunked(self) -> bool:
+        return "chunked" in self.headers.get("transfer-encoding", "").lower()
+
+    async def _read(self, coro: Any) -> Any:
+        return await asyncio.wait_for(coro, self._idle_timeout)
+
+    async def iter_body(self) -> AsyncIterator[bytes]:
+        """Yield body bytes as they arrive; each read obeys the idle timeout."""
+        reader = self._reader
+        if self._chunked:
+            while True:
+                size_line = await self._read(reader.readline())
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the blank line.
+                    while (await self._read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass
+                    self._complete = True
+                    return
+                yield await self._read(reader.readexactly(size))
+                await self._read(reader.readline())
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining > 0:
+                data = await self._read(reader.read(min(remaining, 65536)))
+                if not data:
+                    raise OllamaError("Connection closed before the response ended")
+                remaining -= len(data)
+                yield data
+            self._complete = True
+        else:
+            while True:
+                data = await self._read(reader.read(65536))
+                if not data:
+                    return
+                yield data
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_body()])
+
+    async def iter_lines(self) -> AsyncIterator[bytes]:
+        # A bytearray, scanned only past what was already searched, keeps
+        # very long lines linear in their length.
+        pending = bytearray()
+        body = self.iter_body()
+        try:
+            async for chunk in body:
+                scanned = len(pending)
+                pending += chunk
+                start = 0
+                while True:
+                    end = pending.find(b"\n", scanned)
+                    if end < 0:
+                        break
+                    yield bytes(pending[start:end])
+                    start = scanned = end + 1
+                if start:
+                    del pending[:start]
+        finally:
+            await body.aclose()
+        if pending:
+            yield bytes(pending)
+
+
+class AsyncOllamaClient:
+    """
+    Asyncio client for one Ollama host.
+
+    At most max_concurrency requests are in flight; further callers wait on
+    the semaphore. Idle keep-alive connections are reused. Completed
+    requests are recorded in usage (a UsageLog). Use as an async context
+    manager or call aclose().
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        model: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        usage: Optional[UsageLog] = None,
+    ) -> None:
+        self.url = url or default_url()
+        self.model = model or default_model()
+        self.usage = usage if usage is not None else UsageLog()
+
+        parts = urlsplit(self.url)
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname or "localhost"
+        self._port = parts.port or (443 if self._https else 80)
+        self._target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._idle: List[_Connection] = []
+
+    async def __aenter__(self) -> "AsyncOllamaClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def _connect(self) -> _Connection:
+        ssl_ctx = ssl.create_default_context() if self._https else None
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(self._host, self._port, ssl=ssl_ctx),
+                CONNECT_TIMEOUT_SECONDS,
+            )
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise OllamaUnavailableError(
+                f"Failed to reach Ollama at {self.url}: {exc}"
+            ) from exc
+
+    async def _send(
+        self, conn: _Connection, body: bytes, idle_timeout: Optional[float]
+    ) -> Optional[_Response]:
+        """Send the request; None means the server closed the connection unanswered."""
+        reader, writer = conn
+        head = (
+            f"POST {self._target} HTTP/1.1\r\n"
+            f"Host: {self._host}:{self._port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), idle_timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return None
+        if not status_line:
+            return None
+
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError) as exc:
+            raise OllamaError(f"Malformed HTTP status line: {status_line[:200]!r}") from exc
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), idle_timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return _Response(status, headers, reader, idle_timeout)
+
+    def _take_idle(self) -> Optional[_Connection]:
+        """An idle connection the server has not closed yet, if any."""
+        while self._idle:
+            conn = self._idle.pop()
+            if conn[0].at_eof() or conn[1].is_closing():
+                conn[1].close()
+                continue
+            return conn
+        return None
+
+    @asynccontextmanager
+    async def _post(
+        self, payload: Dict[str, Any], idle_timeout: Optional[float]
+    ) -> AsyncIterator[_Response]:
+        """
+        POST payload and yield the response. The connection goes back to the
+        idle pool only if the body was fully consumed without error; on
+        cancellation or a deadline it is closed.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        conn = self._take_idle() or await self._connect()
+        response = await self._send(conn, body, idle_timeout)
+        if response is None:
+            # The request may already have been processed, so it is not
+            # resent here; stale connections are weeded out before writing.
+            conn[1].close()
+            raise OllamaUnavailableError(f"Ollama at {self.url} closed the connection")
+
+        reusable = False
+        try:
+            yield response
+            reusable = response.keep_alive
+        finally:
+            if reusable:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+
+    def _payload(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        stream: bool,
+        options: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream,
+        }
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def _chat(
+        self, payload: Dict[str, Any], timeout_seconds: Optional[float]
+    ) -> Tuple[str, Usage]:
+        async with self._post(payload, timeout_seconds) as resp:
+            text = await resp.read()
+            if resp.status != 200:
+                raise _status_error(resp.status, text)
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise OllamaError(f"Invalid JSON from Ollama: {text[:500]!r}") from exc
+
+        content = (data.get("message") or {}).get("content")
+        if not isinstance(content, str):
+            raise OllamaError(f"Ollama response missing 'message.content': {data}")
+        usage = usage_from_response(
+            data, payload["model"], estimate_message_tokens(payload["messages"])
+        )
+        self.usage.record(usage)
+        return content, usage
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        timeout_seconds: float = 60,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Call /api/chat and return the assistant's content.
+
+        timeout_seconds is the request deadline, counted from when a
+        concurrency slot is acquired (time spent queued does not count).
+        Cancelling the awaiting task aborts the request.
+        """
+        payload = self._payload(messages, model, False, options)
+        async with self._semaphore:
+            start = time.perf_counter()
+            usage: Optional[Usage] = None
+            LLM_REQUESTS_IN_FLIGHT.inc()
+            try:
+                content, usage = await asyncio.wait_for(
+                    self._chat(payload, None), timeout_seconds
+                )
+                return content
+            except asyncio.TimeoutError as exc:
+                raise OllamaError(
+                    f"Ollama request exceeded its {timeout_seconds}s deadline"
+                ) from exc
+            finally:
+                LLM_REQUESTS_IN_FLIGHT.dec()
+                observe_llm_request(
+                    payload["model"], time.perf_counter() - start, usage is not None, usage
+                )
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        idle_timeout_seconds: float = 30,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield content chunks as they arrive; idle_timeout bounds the gap between them."""
+        payload = self._payload(messages, model, True, options)
+        async with self._semaphore:
+            start = time.perf_counter()
+            usage: Optional[Usage] = None
+            LLM_REQUESTS_IN_FLIGHT.inc()
+            try:
+                async with self._post(payload, idle_timeout_seconds) as resp:
+                    if resp.status != 200:
+                        raise _status_error(resp.status, await resp.read())
+                    lines = resp.iter_lines()
+                    try:
+                        async for line in lines:
+                            if not line.strip():
+                                continue
+                            try:
+                                data = json.loads(line)
+                            except ValueError as exc:
+                                raise OllamaError(
+                                    f"Invalid JSON chunk from Ollama: {line[:500]!r}"
+                                ) from exc
+                            if "error" in data:
+                                raise OllamaError(f"Ollama stream error: {data['error']}")
+                            content = (data.get("message") or {}).get("content")
+                            if content:
+                                yield content
+                            if data.get("done"):
+                                usage = usage_from_response(
+                                    data, payload["model"], estimate_message_tokens(messages)
+                                )
+                                self.usage.record(usage)
+                                # Read this body to its end so the connection
+                                # can be reused.
+                                async for _ in lines:
+                                    pass
+                                return
+                    finally:
+                        await lines.aclose()
+            except asyncio.TimeoutError as exc:
+                raise OllamaUnavailableError(
+                    f"Ollama stream stalled (idle timeout {idle_timeout_seconds}s)"
+                ) from exc
+            finally:
+                LLM_REQUESTS_IN_FLIGHT.dec()
+                observe_llm_request(
+                    payload["model"], time.perf_counter() - start, usage is not None, usage
+                )
+        raise OllamaError("Ollama stream ended before the final 'done' chunk")
+
+    async def generate_test_code(
+        self,
+        diff_summary: str,
+        spec_snippet: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        timeout_seconds: float = 60,
+    ) -> str:
+        """Async counterpart of ai_client_ollama.generate_test_code_from_diff()."""
+        messages = build_test_generation_messages(diff_summary, spec_snippet)
+        return await self.chat(
+            messages, model=model, timeout_seconds=timeout_seconds, options=options
+        )
+
+
+async def generate_many(
+    client: AsyncOllamaClient,
+    jobs: Sequence[Tuple[str, str]],
+    timeout_seconds: float = 60,
+) -> List[Union[str, OllamaError]]:
+    """
+    Generate test code for many (diff_summary, spec_snippet) jobs concurrently.
+
+    Concurrency is bounded by the client's semaphore. Each job has its own
+    deadline. Results come back in job order; a failed job yields its
+    OllamaError instead of cancelling the others.
+    """
+    results = await asyncio.gather(
+        *(
+            client.generate_test_code(diff, snippet, timeout_seconds=timeout_seconds)
+            for diff, snippet in jobs
+        ),
+        return_exceptions=True,
+    )
+    out: List[Union[str, OllamaError]] = []
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, OllamaError):
+            raise result
+        out.append(result)
+    return out
+
+
+async def call_ollama_async(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    timeout_seconds: float = 60,
+    options: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+) -> str:
+    """One-off async counterpart of ai_client_ollama.call_ollama()."""
+    async with AsyncOllamaClient(url, model) as client:
+        return await client.chat(
+            messages, timeout_seconds=timeout_seconds, options=options
+        )
+
+
+async def generate_test_code_from_diff_async(
+    diff_summary: str,
+    spec_snippet: str,
+    model: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+    timeout_seconds: float = 60,
+) -> str:
+    """
+    One-off async counterpart of generate_test_code_from_diff(). For many
+    requests, share one AsyncOllamaClient (or use generate_many()) so
+    connections are reused and concurrency stays bounded.
+    """
+    async with AsyncOllamaClient(url, model) as client:
+        return await client.generate_test_code(
+            diff_summary, spec_snippet, options=options, timeout_seconds=timeout_seconds
+        )
@@ -1,93 +1,408 @@
 # ai_client_ollama.py
 """
-Simple client for calling a local Ollama model via /api/chat.
+Client for calling Ollama models via /api/chat.
 
-- Exposes call_ollama() for flexible use.
-- Exposes generate_test_code_from_diff() for our contract-testing POC.
+- OllamaClient holds the host URL, model name and a pooled requests.Session
+  (keep-alive, bounded connection pool, retries with exponential backoff on
+  connection errors and 5xx responses). Create one per host and reuse it.
+- Exposes call_ollama() / stream_ollama() and generate_test_code_from_diff()
+  / stream_test_code_from_diff() as thin wrappers over a shared client per
+  URL, for our contract-testing POC.
+- Every completed request is recorded in the client's UsageLog (prompt and
+  completion tokens, prefill and generation time); estimate_prompt_size()
+  sizes a prompt before it is sent.
+- With profiling enabled, each request is a span ("ollama.chat" or
+  "ollama.stream") with the model's reported prefill and generation time
+  recorded inside it; the rest is network and queueing.
+- Each request also updates the metrics module: requests in flight, latency
+  by outcome, and token counts and tokens per second from Ollama's usage.
 
-Assumptions:
-- Ollama is running on localhost:11434
-- Model "llama3" is available (adjust MODEL_NAME if needed)
+Defaults:
+- URL: $OLLAMA_URL, else http://localhost:11434/api/chat
+- Model: $OLLAMA_MODEL, else "llama3"
 """
 
 from __future__ import annotations
 
-from typing import List, Dict, Any
+import json
+import os
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import profiling
+from metrics import LLM_REQUESTS_IN_FLIGHT, observe_llm_request
+from token_budget import (
+    PromptSize,
+    Usage,
+    UsageLog,
+    estimate_message_tokens,
+    estimate_tokens,
+    usage_from_response,
+)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434/api/chat"
+DEFAULT_MODEL_NAME = "llama3"
+PROMPT_VERSION = "v3"  # bump when the prompts below change (invalidates caches)
+CONNECT_TIMEOUT_SECONDS = 10
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
-MODEL_NAME = "llama3"  # change here if you prefer a different model
+_RETRY_STATUSES = (500, 502, 503, 504)
 
 
 class OllamaError(RuntimeError):
     """Raised when the Ollama API call fails."""
 
 
-def call_ollama(
-    messages: List[Dict[str, str]],
-    model: str = MODEL_NAME,
-    timeout_seconds: int = 60,
-) -> str:
+class OllamaUnavailableError(OllamaError):
     """
-    Call the local Ollama /api/chat endpoint with a list of messages.
+    Raised when the host itself failed (unreachable, timed out, 5xx after
+    retries), as opposed to a bad request or response. Another host may
+    succeed with the same request.
+    """
+
+
+def default_url() -> str:
+    """Ollama /api/chat URL from $OLLAMA_URL, falling back to localhost."""
+    return os.environ.get("OLLAMA_URL") or DEFAULT_OLLAMA_URL
+
+
+def default_model() -> str:
+    """Model name from $OLLAMA_MODEL, falling back to DEFAULT_MODEL_NAME."""
+    return os.environ.get("OLLAMA_MODEL") or DEFAULT_MODEL_NAME
 
-    messages = [
-        {"role": "system" | "user" | "assistant", "content": "..."},
-        ...
-    ]
 
-    Returns the assistant's full content string.
+def _status_error(resp: requests.Response) -> OllamaError:
+    error = OllamaUnavailableError if resp.status_code >= 500 else OllamaError
+    return error(f"Ollama returned HTTP {resp.status_code}: {resp.text[:500]}")
+
+
+def _record_model_time(usage: Usage) -> None:
+    """Record the prefill and generation time Ollama reports, ending now."""
+    if not profiling.enabled():
+        return
+    end = time.perf_counter()
+    generation = usage.eval_seconds or 0.0
+    profiling.record("ollama.generation", generation, end=end)
+    profiling.record("ollama.prefill", usage.prompt_eval_seconds or 0.0, end=end - generation)
+
+
+class OllamaClient:
     """
-    payload: Dict[str, Any] = {
-        "model": model,
-        "messages": messages,
-        "stream": False,  # easier to consume for our use case
-    }
+    Reusable client for one Ollama host.
+
+    The underlying requests.Session keeps connections alive across calls;
+    pool_size bounds concurrent connections (match it to the number of
+    threads sharing the client). Connection errors and 5xx responses are
+    retried up to `retries` times with exponential backoff starting at
+    backoff_seconds. Read timeouts are not retried, so a slow generation is
+    never silently run twice. Pass a shared UsageLog as usage to total token
+    counts across clients.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        model: Optional[str] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        usage: Optional[UsageLog] = None,
+    ) -> None:
+        self.url = url or default_url()
+        self.model = model or default_model()
+        self.usage = usage if usage is not None else UsageLog()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_seconds,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, pool_size), max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "OllamaClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _payload(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        stream: bool,
+        options: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream,
+        }
+        if options:
+            payload["options"] = options
+        return payload
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        timeout_seconds: float = 60,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Call /api/chat with a list of messages and return the assistant's
+        full content string.
+
+        messages = [
+            {"role": "system" | "user" | "assistant", "content": "..."},
+            ...
+        ]
+
+        options are passed through as Ollama model options (e.g. temperature).
+        """
+        payload = self._payload(messages, model, False, options)
+        start = time.perf_counter()
+        usage: Optional[Usage] = None
+        LLM_REQUESTS_IN_FLIGHT.inc()
+
+        try:
+            with profiling.span("ollama.chat", url=self.url, model=payload["model"]):
+                try:
+                    resp = self.session.post(self.url, json=payload, timeout=timeout_seconds)
+                except requests.RequestException as exc:
+                    raise OllamaUnavailableError(
+                        f"Failed to reach Ollama at {self.url}: {exc}"
+                    ) from exc
+
+                if resp.status_code != 200:
+                    raise _status_error(resp)
+
+                try:
+                    data = resp.json()
+                except ValueError as exc:
+                    raise OllamaError(f"Invalid JSON from Ollama: {resp.text[:500]}") from exc
+
+                message = data.get("message") or {}
+                content = message.get("content")
+                if not isinstance(content, str):
+                    raise OllamaError(f"Ollama response missing 'message.content': {data}")
+
+                usage = usage_from_response(
+                    data, payload["model"], estimate_message_tokens(messages)
+                )
+                self.usage.record(usage)
+                _record_model_time(usage)
+        finally:
+            LLM_REQUESTS_IN_FLIGHT.dec()
+            observe_llm_request(
+                payload["model"], time.perf_counter() - start, usage is not None, usage
+            )
+        return content
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        idle_timeout_seconds: float = 30,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """
+        Call /api/chat with "stream": true and yield content chunks as they arrive.
+
+        Ollama answers with one JSON object per line (NDJSON); each carries a
+        partial message.content and the last one has "done": true.
+
+        idle_timeout_seconds bounds the gap between chunks rather than the whole
+        generation, so long but steadily progressing completions do not fail.
+        """
+        payload = self._payload(messages, model, True, options)
+        # A span cannot stay open across yields; the stream is recorded when done.
+        start = time.perf_counter()
+        usage: Optional[Usage] = None
+        LLM_REQUESTS_IN_FLIGHT.inc()
+
+        try:
+            try:
+                resp = self.session.post(
+                    self.url,
+                    json=payload,
+                    stream=True,
+                    timeout=(CONNECT_TIMEOUT_SECONDS, idle_timeout_seconds),
+                )
+            except requests.RequestException as exc:
+                raise OllamaUnavailableError(
+                    f"Failed to reach Ollama at {self.url}: {exc}"
+                ) from exc
+
+            with resp:
+                if resp.status_code != 200:
+                    raise _status_error(resp)
+
+                try:
+                    for line in resp.iter_lines():
+                        if not line:
+                            continue
+                        try:
+                            data = json.loads(line)
+                        except ValueError as exc:
+                            raise OllamaError(
+                                f"Invalid JSON chunk from Ollama: {line[:500]!r}"
+                            ) from exc
+
+                        if "error" in data:
+                            raise OllamaError(f"Ollama stream error: {data['error']}")
+
+                        content = (data.get("message") or {}).get("content")
+                        if content:
+                            yield content
+                        if data.get("done"):
+                            usage = usage_from_response(
+                                data, payload["model"], estimate_message_tokens(messages)
+                            )
+                            self.usage.record(usage)
+                            profiling.record(
+                                "ollama.stream",
+                                time.perf_counter() - start,
+                                url=self.url,
+                                model=payload["model"],
+                            )
+                            _record_model_time(usage)
+                            return
+                except requests.RequestException as exc:
+                    raise OllamaUnavailableError(
+                        f"Ollama stream stalled or broke (idle timeout "
+                        f"{idle_timeout_seconds}s): {exc}"
+                    ) from exc
+
+            raise OllamaError("Ollama stream ended before the final 'done' chunk")
+        finally:
+            # Also runs when the caller stops iterating early (generator close).
+            LLM_REQUESTS_IN_FLIGHT.dec()
+            observe_llm_request(
+                payload["model"], time.perf_counter() - start, usage is not None, usage
+            )
+
+    def generate_test_code(
+        self,
+        diff_summary: str,
+        spec_snippet: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Given a human-readable diff summary and a JSON spec snippet, ask the
+        model to generate pytest tests as pure Python code.
 
-    try:
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=timeout_seconds)
-    except requests.RequestException as exc:
-        raise OllamaError(f"Failed to reach Ollama at {OLLAMA_URL}: {exc}") from exc
+        The result is intended to be written directly to a .py file under tests/.
+        """
+        messages = build_test_generation_messages(diff_summary, spec_snippet)
+        return self.chat(messages, model=model, options=options)
 
-    if resp.status_code != 200:
-        raise OllamaError(
-            f"Ollama returned HTTP {resp.status_code}: {resp.text[:500]}"
+    def stream_test_code(
+        self,
+        diff_summary: str,
+        spec_snippet: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        idle_timeout_seconds: float = 30,
+    ) -> Iterator[str]:
+        """Streaming variant of generate_test_code(): yields code chunks."""
+        messages = build_test_generation_messages(diff_summary, spec_snippet)
+        return self.stream_chat(
+            messages,
+            model=model,
+            idle_timeout_seconds=idle_timeout_seconds,
+            options=options,
         )
 
-    try:
-        data = resp.json()
-    except ValueError as exc:
-        raise OllamaError(f"Invalid JSON from Ollama: {resp.text[:500]}") from exc
 
-    message = data.get("message") or {}
-    content = message.get("content")
-    if not isinstance(content, str):
-        raise OllamaError(f"Ollama response missing 'message.content': {data}")
+_shared_clients: Dict[str, OllamaClient] = {}
+_shared_clients_lock = threading.Lock()
 
-    return content
 
+def get_client(url: Optional[str] = None) -> OllamaClient:
+    """Return the process-wide shared client for url (created on first use)."""
+    url = url or default_url()
+    with _shared_clients_lock:
+        client = _shared_clients.get(url)
+        if client is None:
+            client = _shared_clients[url] = OllamaClient(url=url)
+        return client
 
-def generate_test_code_from_diff(diff_summary: str, spec_snippet: str) -> str:
+
+def call_ollama(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    timeout_seconds: float = 60,
+    options: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+) -> str:
     """
-    High-level helper: given a human-readable diff summary and a JSON spec snippet,
-    ask the local model to generate pytest tests as pure Python code.
+    Call /api/chat on the shared client for url (default host if omitted).
 
-    The result is intended to be written directly to a .py file under tests/.
+    See OllamaClient.chat().
     """
-    system_msg = {
-        "role": "system",
-        "content": (
-            "You are an assistant that writes concise, deterministic pytest tests "
-            "for validating JSON response payloads against a simple API spec.\n\n"
-            "STRICT REQUIREMENTS:\n"
-            "- Use ONLY Python standard library and pytest\n"
-            "- NO external libraries (no jsonschema, no requests, no pydantic)\n"
-            "- NO markdown code fences (```) in your output\n"
-            "- NO explanatory text before or after the code\n"
-            "- Output ONLY valid Python code that can be saved directly to a .py file\n"
-            "- Assume tests will run against in-memory sample payloads, not real HTTP calls"
-        ),
-    }
+    return get_client(url).chat(
+        messages, model=model, timeout_seconds=timeout_seconds, options=options
+    )
+
+
+def stream_ollama(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    idle_timeout_seconds: float = 30,
+    options: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+) -> Iterator[str]:
+    """Streaming call on the shared client for url; see OllamaClient.stream_chat()."""
+    return get_client(url).stream_chat(
+        messages,
+        model=model,
+        idle_timeout_seconds=idle_timeout_seconds,
+        options=options,
+    )
+
+
+_SYSTEM_PROMPT = (
+    "You are an assistant that writes concise, deterministic pytest tests "
+    "for validating JSON response payloads against a simple API spec.\n\n"
+    "STRICT REQUIREMENTS:\n"
+    "- Use ONLY Python standard library and pytest\n"
+    "- NO external libraries (no jsonschema, no requests, no pydantic)\n"
+    "- NO markdown code fences (```) in your output\n"
+    "- NO explanatory text before or after the code\n"
+    "- Output ONLY valid Python code that can be saved directly to a .py file\n"
+    "- Assume tests will run against in-memory sample payloads, not real HTTP calls"
+)
+
+
+def build_test_generation_messages(
+    diff_summary: str, spec_snippet: str
+) -> List[Dict[str, str]]:
+    """
+    Build the system/user messages asking the model for a pytest module that
+    covers the given diff summary against the given JSON spec snippet.
+    """
+    system_msg = {"role": "system", "content": _SYSTEM_PROMPT}
 
     user_msg = {
         "role": "user",
@@ -118,4 +433,84 @@ def generate_test_code_from_diff(diff_summary: str, spec_snippet: str) -> str:
         ),
     }
 
-    return call_ollama([system_msg, user_msg])
+    return [system_msg, user_msg]
+
+
+def build_repair_messages(
+    function_source: str, error: str, shared_source: str
+) -> List[Dict[str, str]]:
+    """
+    Build the system/user messages asking the model to fix one generated test
+    function that failed to compile, collect or pass, given the error and the
+    module's shared code (imports, helpers, fixtures).
+    """
+    user_msg = {
+        "role": "user",
+        "content": (
+            "This pytest test function from a generated module fails validation.\n\n"
+            "Module code available to it (imports, helpers, fixtures):\n"
+            f"{shared_source or '(none)'}\n\n"
+            "Failing function:\n"
+            f"{function_source}\n\n"
+            "Error:\n"
+            f"{error}\n\n"
+            "Rewrite ONLY this function so it collects and passes under pytest:\n"
+            "- Keep the function name\n"
+            "- Do not use fixtures or parametrize arguments that are not defined above\n"
+            "- Build the sample payload dict inside the function\n"
+            "- Output ONLY the corrected function (plus any import it needs), "
+            "no markdown code fences, no explanations\n"
+        ),
+    }
+    return [{"role": "system", "content": _SYSTEM_PROMPT}, user_msg]
+
+
+def estimate_prompt_size(diff_summary: str, spec_snippet: str) -> PromptSize:
+    """Estimated token counts of the test-generation prompt for these inputs."""
+    system_msg, user_msg = build_test_generation_messages(diff_summary, spec_snippet)
+    return PromptSize(
+        total=estimate_message_tokens([system_msg, user_msg]),
+        system_tokens=estimate_tokens(system_msg["content"]),
+        user_tokens=estimate_tokens(user_msg["content"]),
+        spec_tokens=estimate_tokens(spec_snippet),
+        diff_tokens=estimate_tokens(diff_summary),
+    )
+
+
+def generate_test_code_from_diff(
+    diff_summary: str,
+    spec_snippet: str,
+    model: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+) -> str:
+    """
+    High-level helper: given a human-readable diff summary and a JSON spec snippet,
+    ask the local model to generate pytest tests as pure Python code.
+
+    The result is intended to be written directly to a .py file under tests/.
+    """
+    return get_client(url).generate_test_code(
+        diff_summary, spec_snippet, model=model, options=options
+    )
+
+
+def stream_test_code_from_diff(
+    diff_summary: str,
+    spec_snippet: str,
+    model: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    idle_timeout_seconds: float = 30,
+    url: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_test_code_from_diff(): yields code chunks
+    as the model produces them.
+    """
+    return get_client(url).stream_test_code(
+        diff_summary,
+        spec_snippet,
+        model=model,
+        options=options,
+        idle_timeout_seconds=idle_timeout_seconds,
+    )
@@ -0,0 +1,489 @@
+# benchmark.py
+"""
+Reproducible benchmarks for the diff engine and the generation pipeline.
+
+Synthetic spec pairs are generated from a seed with:
+- N endpoints (each with a random subset of GET/POST/PUT/DELETE)
+- M fields per object
+- nesting depth D (objects and arrays of objects inside responses)
+- change rate R (share of fields whose type changes, or that are removed
+  or gain a sibling; endpoints are removed and added at R/4)
+
+Cases:
+- load_spec: json load of the old spec from disk
+- diff_specs: full diff, formatted as the CLI prints it
+- json_snippet_for_model: the spec context sent with a prompt
+- generate_tests: the whole `cli.py generate-tests --generator llm` path,
+  run in-process against a local fake Ollama server with a configurable
+  latency (on a smaller pair, --generate-endpoints)
+- startup_compare: `cli.py compare` on the small pair as a fresh process,
+  i.e. interpreter startup plus imports
+
+The startup check also runs `cli.py compare` under `python -X importtime`.
+It fails the run when the CLI's own imports (everything after site) take
+longer than --startup-budget-ms, or when compare loads a module it never
+needs (COMPARE_FORBIDDEN_IMPORTS: the HTTP client, asyncio, ...).
+
+Each case is repeated and min/median/mean seconds are written as JSON.
+With --baseline, medians are compared against an earlier results file and
+the run fails when any case got slower than --threshold allows.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+    python benchmark.py --skip-generate --startup-budget-ms 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cli
+from diff_engine import diff_changes, diff_specs, load_spec
+
+TYPES = ("string", "number", "boolean")
+METHODS = ("GET", "POST", "PUT", "DELETE")
+# Parameters that change what is measured (unlike repeat or skip_generate)
+SHAPE_PARAMS = (
+    "endpoints", "fields", "depth", "change_rate", "seed", "generate_endpoints", "latency",
+)
+# Regressions smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.002
+CLI_PATH = Path(__file__).resolve().with_name("cli.py")
+DEFAULT_STARTUP_BUDGET_MS = 75.0
+# Modules `cli.py compare` must not import (they belong to other commands)
+COMPARE_FORBIDDEN_IMPORTS = (
+    "requests", "urllib3", "asyncio", "http.server", "sqlite3", "concurrent.futures",
+)
+
+# What the fake Ollama answers: a module that passes validation
+FAKE_TEST_MODULE = (
+    "import pytest\n\n\n"
+    "def test_generated_contract():\n"
+    '    response = {"id": "w1"}\n'
+    '    assert isinstance(response["id"], str)\n'
+)
+
+
+# -- synthetic specs ----------------------------------------------------------
+
+
+def _make_object(rng: random.Random, fields: int, depth: int) -> Dict[str, Any]:
+    obj: Dict[str, Any] = {}
+    for i in range(fields):
+        roll = rng.random()
+        if depth > 1 and roll < 0.15:
+            obj[f"obj{i}"] = _make_object(rng, max(2, fields // 2), depth - 1)
+        elif depth > 1 and roll < 0.2:
+            obj[f"list{i}"] = [_make_object(rng, max(2, fields // 2), depth - 1)]
+        else:
+            obj[f"f{i}"] = rng.choice(TYPES)
+    return obj
+
+
+def _mutate(rng: random.Random, obj: Dict[str, Any], rate: float) -> Dict[str, Any]:
+    """Copy of obj with about rate of its fields changed, removed or added to."""
+    out: Dict[str, Any] = {}
+    for name, node in obj.items():
+        if isinstance(node, dict):
+            out[name] = _mutate(rng, node, rate)
+            continue
+        if isinstance(node, list):
+            out[name] = [_mutate(rng, node[0], rate)]
+            continue
+        if rng.random() >= rate:
+            out[name] = node
+            continue
+        roll = rng.random()
+        if roll < 0.5:
+            out[name] = rng.choice([t for t in TYPES if t != node])
+        elif roll < 0.75:
+            out[name + "_new"] = node
+            out[name] = node
+        # else: removed
+    return out
+
+
+def make_spec_pair(
+    endpoints: int,
+    fields: int,
+    depth: int = 1,
+    change_rate: float = 0.1,
+    seed: int = 0,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(old, new) specs with the given shape; identical inputs give identical specs."""
+    rng = random.Random(seed)
+    old_paths: Dict[str, Any] = {}
+    for i in range(endpoints):
+        methods = [m for m in METHODS if rng.random() < 0.5] or ["GET"]
+        old_paths[f"/resource{i}"] = {
+            m: {"response": {"status": 200, "schema": _make_object(rng, fields, depth)}}
+            for m in methods
+        }
+
+    new_paths: Dict[str, Any] = {}
+    for path, methods in old_paths.items():
+        if rng.random() < change_rate / 4:
+            continue  # endpoint removed
+        new_paths[path] = {
+            m: {
+                "response": {
+                    "status": op["response"]["status"],
+                    "schema": _mutate(rng, op["response"]["schema"], change_rate),
+                }
+            }
+            for m, op in methods.items()
+        }
+    for i in range(int(endpoints * change_rate / 4)):
+        new_paths[f"/added{i}"] = {
+            "GET": {"response": {"status": 200, "schema": _make_object(rng, fields, depth)}}
+        }
+    return (
+        {"version": "1.0.0", "paths": old_paths},
+        {"version": "2.0.0", "paths": new_paths},
+    )
+
+
+# -- fake Ollama --------------------------------------------------------------
+
+
+class FakeOllama:
+    """
+    Local stand-in for Ollama's /api/chat and /api/tags. Each chat request
+    waits latency seconds (spread over the chunks when streaming) and
+    answers FAKE_TEST_MODULE with plausible token counts.
+    """
+
+    def __init__(self, latency: float = 0.05) -> None:
+        latency_seconds = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send_json(self, doc: Dict[str, Any]) -> None:
+                body = json.dumps(doc).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                self._send_json({"models": []})
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                final = {
+                    "done": True,
+                    "prompt_eval_count": len(json.dumps(request["messages"])) // 4,
+                    "eval_count": len(FAKE_TEST_MODULE) // 4,
+                    "prompt_eval_duration": int(latency_seconds * 0.2e9),
+                    "eval_duration": int(latency_seconds * 0.8e9),
+                }
+                if not request.get("stream"):
+                    time.sleep(latency_seconds)
+                    self._send_json(dict(final, message={"content": FAKE_TEST_MODULE}))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                lines = FAKE_TEST_MODULE.splitlines(keepends=True)
+                chunks = [{"message": {"content": line}, "done": False} for line in lines]
+                chunks.append(dict(final, message={"content": ""}))
+                for chunk in chunks:
+                    time.sleep(latency_seconds / len(chunks))
+                    data = (json.dumps(chunk) + "\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/chat"
+
+    def __enter__(self) -> "FakeOllama":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# -- runner -------------------------------------------------------------------
+
+
+def time_case(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Run fn repeat times (after one untimed warm-up) and summarize seconds."""
+    fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min": round(min(samples), 6),
+        "median": round(statistics.median(samples), 6),
+        "mean": round(statistics.fmean(samples), 6),
+    }
+
+
+def _generate_tests(old_path: str, new_path: str, output: str, url: str) -> None:
+    args = cli.build_parser().parse_args(
+        [
+            "generate-tests",
+            "--old", old_path,
+            "--new", new_path,
+            "--output", output,
+            "--generator", "llm",
+            "--no-cache",
+            "--ollama-url", url,
+        ]
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        args.func(args)
+
+
+def _compare_command(old_path: str, new_path: str) -> List[str]:
+    return [sys.executable, str(CLI_PATH), "compare", "--old", old_path, "--new", new_path]
+
+
+def _run_compare_process(old_path: str, new_path: str) -> None:
+    subprocess.run(_compare_command(old_path, new_path), check=True, stdout=subprocess.DEVNULL)
+
+
+def measure_startup_imports(old_path: str, new_path: str) -> Dict[str, Any]:
+    """
+    Run `cli.py compare` under -X importtime. Returns the milliseconds spent
+    importing after site (the CLI's own imports) and the top-level modules
+    imported then, slowest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + _compare_command(old_path, new_path)[1:],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    after_site = False
+    modules: Dict[str, float] = {}
+    imported: List[str] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # After the separator's space, nested imports are indented further.
+        top_level = not name[1:].startswith(" ")
+        name = name.strip()
+        if after_site:
+            imported.append(name)
+            if top_level:
+                modules[name] = int(cumulative) / 1000
+        elif top_level and name == "site":
+            after_site = True
+    return {
+        "import_ms": round(sum(modules.values()), 3),
+        "modules": dict(sorted(modules.items(), key=lambda kv: kv[1], reverse=True)),
+        "forbidden": [m for m in imported if m in COMPARE_FORBIDDEN_IMPORTS],
+    }
+
+
+def check_startup(startup: Dict[str, Any], budget_ms: float) -> List[str]:
+    """Problems with a measure_startup_imports() result; empty when within budget."""
+    problems = []
+    if startup["import_ms"] > budget_ms:
+        slowest = ", ".join(f"{m} {ms:.1f}ms" for m, ms in list(startup["modules"].items())[:3])
+        problems.append(
+            f"compare imports took {startup['import_ms']:.1f}ms, over the "
+            f"{budget_ms:g}ms budget (slowest: {slowest})"
+        )
+    for module in startup["forbidden"]:
+        problems.append(f"compare imported {module}, which it never uses")
+    return problems
+
+
+def run_benchmarks(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run every case for params (see build_parser) and return the results document."""
+    old, new = make_spec_pair(
+        params["endpoints"], params["fields"], params["depth"], params["change_rate"], params["seed"]
+    )
+    gen_old, gen_new = make_spec_pair(
+        params["generate_endpoints"], params["fields"], params["depth"], params["change_rate"], params["seed"]
+    )
+    repeat = params["repeat"]
+    results: Dict[str, Any] = {}
+
+    with tempfile.TemporaryDirectory(prefix="contract_ai_bench_") as tmp:
+        paths = {}
+        for name, spec in (("old", old), ("new", new), ("gen_old", gen_old), ("gen_new", gen_new)):
+            paths[name] = os.path.join(tmp, f"{name}.json")
+            Path(paths[name]).write_text(json.dumps(spec, indent=2), encoding="utf-8")
+
+        changes = diff_changes(old, new)
+        results["load_spec"] = time_case(lambda: load_spec(paths["old"]), repeat)
+        results["diff_specs"] = time_case(lambda: diff_specs(old, new), repeat)
+        results["json_snippet_for_model"] = time_case(
+            lambda: cli.json_snippet_for_model(new, changes, old_spec=old), repeat
+        )
+        if not params["skip_generate"]:
+            output = os.path.join(tmp, "test_generated.py")
+            with FakeOllama(params["latency"]) as fake:
+                results["generate_tests"] = time_case(
+                    lambda: _generate_tests(paths["gen_old"], paths["gen_new"], output, fake.url),
+                    max(1, repeat // 2),
+                )
+        results["startup_compare"] = time_case(
+            lambda: _run_compare_process(paths["gen_old"], paths["gen_new"]),
+            max(1, repeat // 2),
+        )
+        startup = measure_startup_imports(paths["gen_old"], paths["gen_new"])
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": params,
+            "changes": len(changes),
+            "startup": startup,
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    Print median ratios against baseline and return the cases that got
+    slower by more than threshold (0.2 = 20%).
+    """
+    base_params = baseline.get("meta", {}).get("params", {})
+    if any(base_params.get(k) != current["meta"]["params"][k] for k in SHAPE_PARAMS):
+        print("Warning: baseline was run with different spec or latency parameters.")
+    regressions: List[str] = []
+    print(f"{'case':<24} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for case, result in current["results"].items():
+        base = baseline.get("results", {}).get(case)
+        if base is None:
+            print(f"{case:<24} {'-':>10} {result['median']:>10.4f}")
+            continue
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        slower = result["median"] - base["median"] > MIN_REGRESSION_SECONDS
+        flag = ""
+        if ratio > 1 + threshold and slower:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print(f"{case:<24} {base['median']:>10.4f} {result['median']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the diff engine and generation pipeline on synthetic specs."
+    )
+    parser.add_argument("--endpoints", type=int, default=500, help="N: endpoints per spec (default: 500).")
+    parser.add_argument("--fields", type=int, default=20, help="M: fields per object (default: 20).")
+    parser.add_argument("--depth", type=int, default=3, help="D: nesting depth (default: 3).")
+    parser.add_argument(
+        "--change-rate", type=float, default=0.1, help="R: share of fields changed (default: 0.1)."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per case (default: 10).")
+    parser.add_argument(
+        "--generate-endpoints",
+        type=int,
+        default=5,
+        help="Endpoints in the pair used for generate_tests (default: 5).",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Fake Ollama seconds per request (default: 0.05).",
+    )
+    parser.add_argument("--skip-generate", action="store_true", help="Skip the generate_tests case.")
+    parser.add_argument("--output", help="Write the results JSON here (default: stdout).")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="With --baseline, fail when a median is this much slower (default: 0.2 = 20%%).",
+    )
+    parser.add_argument(
+        "--startup-budget-ms",
+        type=float,
+        default=DEFAULT_STARTUP_BUDGET_MS,
+        help="Fail when `cli.py compare` spends longer importing modules "
+        f"(default: {DEFAULT_STARTUP_BUDGET_MS:g}).",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    params = {
+        "endpoints": args.endpoints,
+        "fields": args.fields,
+        "depth": args.depth,
+        "change_rate": args.change_rate,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "generate_endpoints": args.generate_endpoints,
+        "latency": args.latency,
+        "skip_generate": args.skip_generate,
+    }
+    current = run_benchmarks(params)
+
+    text = json.dumps(current, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"Results written to: {args.output}")
+    elif not args.baseline:
+        print(text)
+
+    failed = False
+    problems = check_startup(current["meta"]["startup"], args.startup_budget_ms)
+    for problem in problems:
+        print(f"Startup: {problem}")
+        failed = True
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(current, baseline, args.threshold)
+        if regressions:
+            print(f"\nSlower than baseline: {', '.join(regressions)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
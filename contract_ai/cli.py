@@ -4,117 +4,1428 @@ Simple CLI for the AI contract testing POC.
 
 Commands:
 - compare:
-    Compare two spec JSON files and print detected changes.
+    Compare two spec JSON files and print detected changes, as text or
+    streamed as JSON, NDJSON or SARIF with a breaking/non-breaking
+    classification per change (--format); --fail-on breaking exits 1 for
+    a merge gate.
+
+- compare-history:
+    Diff every adjacent pair of an ordered series of spec versions in one
+    run (process pool, each file parsed once) and emit a JSON/NDJSON log.
+
+- scan:
+    Discover the spec files under a tree, pair them with a git ref or a
+    baseline directory, skip the unchanged ones by hash and diff the rest
+    on a process pool into one report (see scan.py).
+
+- snapshot:
+    Build a persisted index of a spec so later compares (--old-index) only
+    descend into paths and operations whose hashes changed.
+
+- check-payloads:
+    Validate recorded traffic (NDJSON, one exchange per line) against a spec
+    compiled into per-operation checkers, optionally across processes.
+
+- replay:
+    Send the requests of a HAR/NDJSON capture over HTTP (to a live service,
+    or to a local stand-in server serving the recorded responses) and check
+    each response's status and schema; reports violations and latency
+    percentiles per endpoint.
+
+- validate-tests:
+    Compile, collect and run each test function of generated modules in
+    isolation (in parallel) and report the broken ones; --repair re-prompts
+    the model with just the failing functions.
 
 - generate-tests:
-    Compare two specs, summarize the changes, call the local LLM via Ollama
-    to generate pytest tests, and write them to the specified output file.
+    Compare two specs, summarize the changes, generate pytest tests and write
+    them to the specified output file. Simple changes are covered by built-in
+    templates; the rest go to the local LLM via Ollama.
+    Results are cached on disk by content hash; use --no-cache or --refresh
+    to bypass. --stream writes the output incrementally as the model responds.
+    --per-endpoint sends one prompt per endpoint/method on a worker pool.
+    Fresh LLM output is validated and failing functions are repaired
+    (--repair-rounds, --no-validate).
+    With several --ollama-url hosts, requests are load balanced with health
+    checks and failover.
+
+- serve:
+    Run a long-lived HTTP service with /compare and /generate endpoints,
+    keeping parsed specs, Ollama connections and the cache warm between
+    requests (see service.py).
+
+Every command takes --profile (print a per-span time breakdown to stderr),
+--profile-stats FILE (dump cProfile stats) and --profile-trace FILE (write
+a Chrome trace), see profiling.py. --metrics-port PORT serves Prometheus
+metrics on http://127.0.0.1:PORT/metrics while the command runs and
+--metrics-file FILE keeps a node_exporter textfile up to date, see
+metrics.py.
 """
 
 from __future__ import annotations
 
 import argparse
 import json
+import os
+import sys
+import time
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Only what `compare` needs is imported here. Other commands import their
+# modules when they run, and their argument defaults when their parser is
+# built (see build_parser), so a compare never loads requests or asyncio.
+from diff_engine import (
+    Change,
+    load_spec,
+    diff_changes,
+    format_change,
+    iter_changes,
+    iter_diff_files,
+    iter_diff_snapshot,
+)
+from diff_report import FORMATS, DiffSummary, write_changes
+from spec_stream import SpecFormatError
+import metrics
+import profiling
+from spec_context import DEFAULT_CONTEXT_TOKENS, build_spec_context
+
+if TYPE_CHECKING:
+    from compatibility import RuleSet
+    from generation import Client, GenerationJob
+    from generation_cache import GenerationCache
+    from payload_validator import PayloadReport
+    from replay import ReplayReport
+    from template_generator import EndpointKey
+    from token_budget import UsageLog
+    from validation import RepairResult
+
+def json_snippet_for_model(
+    spec: Dict[str, Any],
+    changes: Optional[List[Change]] = None,
+    old_spec: Optional[Dict[str, Any]] = None,
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+) -> str:
+    """
+    Serialize the part of the spec the model needs: the operations touched by
+    changes (all operations if None) and the components they reference, as
+    compact JSON within max_tokens. See spec_context.build_spec_context().
+    """
+    return build_spec_context(changes, old_spec or {}, spec, max_tokens)
+
+
+def _partial_path(output_path: Path) -> Path:
+    """Where output is written before it replaces output_path."""
+    return output_path.with_name(output_path.name + ".partial")
+
 
-from diff_engine import load_spec, diff_specs
-from ai_client_ollama import generate_test_code_from_diff, OllamaError
+def _replace_file(output_path: Path, text: str) -> None:
+    """Write text to output_path via a temporary file, so it is never half written."""
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, output_path)
 
 
-def json_snippet_for_model(spec: Dict[str, Any], max_chars: int = 2000) -> str:
+def _stream_to_file(
+    client: Client,
+    diff_summary: str,
+    spec_snippet: str,
+    output_path: Path,
+    idle_timeout: float,
+) -> str:
     """
-    Serialize the spec to JSON, truncated to a reasonable size for the model.
+    Stream generated code into output_path's .partial file as chunks
+    arrive, printing a running progress line. Returns the complete generated
+    code; output_path itself is left for the caller to replace on success.
     """
-    s = json.dumps(spec, indent=2)
-    if len(s) > max_chars:
-        return s[:max_chars] + "\n... (truncated)"
-    return s
+    parts: List[str] = []
+    received = 0
+    start = time.monotonic()
+    with _partial_path(output_path).open("w", encoding="utf-8") as f:
+        for chunk in client.stream_test_code(
+            diff_summary, spec_snippet, idle_timeout_seconds=idle_timeout
+        ):
+            f.write(chunk)
+            f.flush()
+            parts.append(chunk)
+            received += len(chunk)
+            elapsed = time.monotonic() - start
+            print(f"\r  received {received} chars in {elapsed:.1f}s", end="", flush=True)
+    print()
+    return "".join(parts)
 
 
 def cmd_compare(args: argparse.Namespace) -> None:
-    old = load_spec(args.old)
-    new = load_spec(args.new)
-    changes = diff_specs(old, new)
-    if not changes:
-        print("No differences detected between the two specs.")
+    rules = _load_ruleset(args.rules)
+    if args.old_index:
+        summary = _compare_snapshot(args, rules)
+    elif args.streaming:
+        # Walk both files one path entry at a time, without loading either.
+        summary = _write_changes(args, iter_diff_files(args.old, args.new), args.old, rules)
+    else:
+        old = load_spec(args.old)
+        new = load_spec(args.new)
+        summary = _write_changes(args, iter_changes(old, new), args.old, rules)
+
+    if summary is not None:
+        _check_fail_on(args.fail_on, summary.breaking, summary.changes)
+
+
+def _check_fail_on(fail_on: Optional[str], breaking: int, changes: int) -> None:
+    """Exit with status 1 if --fail-on is set and matched."""
+    if not fail_on:
+        return
+    failing = breaking if fail_on == "breaking" else changes
+    if failing:
+        what = "breaking change(s)" if fail_on == "breaking" else "change(s)"
+        print(f"{failing} {what} found (--fail-on {fail_on})", file=sys.stderr)
+        sys.exit(1)
+
+
+def _load_ruleset(path: Optional[str]) -> RuleSet:
+    """DEFAULT_RULESET, or the rules in path in front of the defaults."""
+    from compatibility import DEFAULT_RULES, DEFAULT_RULESET, RuleSet, load_rules
+
+    if not path:
+        return DEFAULT_RULESET
+    try:
+        return RuleSet([*load_rules(path), *DEFAULT_RULES])
+    except (OSError, ValueError) as exc:
+        print(f"Error: invalid rules file: {exc}")
+        sys.exit(1)
+
+
+def _compare_snapshot(args: argparse.Namespace, rules: RuleSet) -> Optional[DiffSummary]:
+    """Diff the new spec against a snapshot index built by `snapshot`."""
+    from spec_index import SnapshotError, SpecSnapshot
+
+    try:
+        snapshot = SpecSnapshot(args.old_index)
+    except SnapshotError as exc:
+        print(f"Error: {exc}")
+        sys.exit(1)
+
+    with snapshot:
+        return _write_changes(
+            args, iter_diff_snapshot(snapshot, args.new), args.old_index, rules
+        )
+
+
+def _write_changes(
+    args: argparse.Namespace, changes: Iterable[Change], old: str, rules: RuleSet
+) -> Optional[DiffSummary]:
+    """
+    Write changes to stdout in --format as they are found. Returns None if
+    the reader went away before the end.
+    """
+    try:
+        return write_changes(changes, args.format, sys.stdout, old, args.new, rules)
+    except SpecFormatError as exc:
+        # The streaming and snapshot paths parse the spec while diffing. The
+        # error goes to stderr: stdout may hold a half-written JSON document.
+        sys.stdout.flush()
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        # The reader stopped early (e.g. `| head`); that is not an error here.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return None
+
+
+def cmd_snapshot(args: argparse.Namespace) -> None:
+    from spec_index import build_index
+
+    count = build_index(args.spec, args.output)
+    print(f"Snapshot index of {count} operation(s) written to: {args.output}")
+
+
+def cmd_compare_history(args: argparse.Namespace) -> None:
+    from history import iter_history, resolve_spec_files
+
+    files = resolve_spec_files(args.specs)
+    if len(files) < 2:
+        print(f"Need at least two spec files, found {len(files)} for: {args.specs}")
+        sys.exit(1)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            out.write("[\n")
+        for i, entry in enumerate(iter_history(files, workers=args.workers)):
+            if args.format == "json":
+                out.write((",\n" if i else "") + json.dumps(entry, indent=2))
+            else:
+                out.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        if args.format == "json":
+            out.write("\n]\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.output:
+        print(f"Change log for {len(files) - 1} version step(s) written to: {args.output}")
+
+
+def cmd_scan(args: argparse.Namespace) -> None:
+    from scan import DEFAULT_PATTERNS, DEFAULT_STAT_CACHE, ScanError, StatCache
+    from scan import iter_scan, plan_scan, write_scan
+
+    rules = _load_ruleset(args.rules)
+    if args.no_stat_cache:
+        stat_cache = StatCache()
+    else:
+        stat_cache = StatCache(args.stat_cache or os.path.join(args.root, DEFAULT_STAT_CACHE))
+
+    try:
+        plan = plan_scan(
+            args.root,
+            base_ref=args.base_ref,
+            baseline_dir=args.baseline_dir,
+            patterns=args.pattern or DEFAULT_PATTERNS,
+            stat_cache=stat_cache,
+        )
+    except ScanError as exc:
+        print(f"Error: {exc}")
+        sys.exit(1)
+    stat_cache.save()
+
+    baseline = args.base_ref or args.baseline_dir
+    results = iter_scan(plan.tasks, workers=args.workers)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        summary = write_scan(plan, results, args.format, out, baseline, rules)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.output:
+        print(f"Scan report for {summary.specs} spec(s) written to: {args.output}")
+    if summary.errors:
+        print(f"Error: {summary.errors} spec(s) could not be compared", file=sys.stderr)
+        sys.exit(1)
+    _check_fail_on(args.fail_on, summary.breaking, summary.changes)
+
+
+def cmd_check_payloads(args: argparse.Namespace) -> None:
+    from payload_validator import validate_ndjson
+
+    spec = load_spec(args.spec)
+    report = validate_ndjson(
+        spec,
+        args.payloads,
+        processes=args.processes,
+        strict=args.strict,
+        max_examples=args.max_examples,
+    )
+
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        _print_payload_report(report)
+
+    if not report.ok:
+        sys.exit(1)
+
+
+def _print_payload_report(
+    report: PayloadReport, replay: Optional[ReplayReport] = None
+) -> None:
+    """Print per-endpoint counts (with latencies for a replay) and violations."""
+    rate = report.records / report.elapsed_seconds if report.elapsed_seconds else 0
+    print(
+        f"Checked {report.records} record(s) in {report.elapsed_seconds:.1f}s "
+        f"({rate:,.0f}/s); {report.invalid_records} violate the spec."
+    )
+    for (path, method), count in sorted(report.operations.items()):
+        invalid = report.invalid_operations.get((path, method), 0)
+        line = f"- {method} {path}: {count} record(s), {invalid} invalid"
+        latency = replay.percentiles((path, method)) if replay is not None else {}
+        if latency:
+            line += " (" + ", ".join(f"{k} {v}ms" for k, v in latency.items()) + ")"
+        print(line)
+    if report.violations:
+        print("\nViolations:")
+    for v, count in report.violations.most_common():
+        where = f" {v.location} field '{v.field}'" if v.field else ""
+        detail = ""
+        if v.expected or v.actual:
+            detail = f" (expected {v.expected or '-'}, got {v.actual or '-'})"
+        lines = ", ".join(str(n) for n in report.examples.get(v, []))
+        print(f"- {v.method} {v.path}{where}: {v.kind}{detail} x{count} [lines {lines}]")
+
+
+def cmd_replay(args: argparse.Namespace) -> None:
+    import asyncio
+
+    from payload_validator import SpecValidator
+    from replay import load_capture, replay_capture, serve_capture
+
+    try:
+        exchanges = load_capture(args.capture)
+    except (OSError, ValueError) as exc:
+        print(f"Error: cannot read capture {args.capture}: {exc}")
+        sys.exit(1)
+    if args.serve:
+        try:
+            asyncio.run(serve_capture(list(exchanges), "127.0.0.1", args.port))
+        except KeyboardInterrupt:
+            pass
         return
 
-    print("Differences detected:")
-    for c in changes:
-        print(f"- {c}")
+    if not args.spec:
+        print("replay: --spec is required unless --serve is given")
+        sys.exit(1)
+    validator = SpecValidator(load_spec(args.spec), strict=args.strict)
+    report = asyncio.run(
+        replay_capture(
+            exchanges,
+            validator,
+            target=args.target,
+            concurrency=args.concurrency,
+            timeout_seconds=args.timeout,
+            max_examples=args.max_examples,
+        )
+    )
+
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        _print_payload_report(report.payloads, report)
+
+    if not report.ok:
+        sys.exit(1)
 
 
 def cmd_generate_tests(args: argparse.Namespace) -> None:
+    from generation import build_generation_jobs
+    from generation_cache import GenerationCache
+    from template_generator import generate_template_tests
+    from token_budget import UsageLog
+
     old = load_spec(args.old)
     new = load_spec(args.new)
-    changes: List[str] = diff_specs(old, new)
+    changes: List[Change] = diff_changes(old, new)
 
     if not changes:
         print("No differences detected. No tests to generate or update.")
         return
 
-    diff_summary = "\n".join(changes)
-    spec_snippet = json_snippet_for_model(new)
+    lines = [format_change(c) for c in changes]
 
     print("Changes detected between specs:")
-    for c in changes:
-        print(f"- {c}")
+    for line in lines:
+        print(f"- {line}")
 
-    print("\nCalling local LLM via Ollama to generate pytest contract tests...")
+    templated: Dict[EndpointKey, str] = {}
+    if args.generator != "llm":
+        with profiling.span("templates"):
+            templated, changes = generate_template_tests(changes, new)
+        print(
+            f"\nTemplates covered {len(lines) - len(changes)} change(s); "
+            f"{len(changes)} left for the LLM."
+        )
+        if args.generator == "template" or not changes:
+            if changes:
+                print("Skipped (need the LLM, see --generator):")
+                for c in changes:
+                    print(f"- {format_change(c)}")
+            _write_modules(args, templated)
+            return
+
+    cache = None if args.no_cache else GenerationCache(args.cache_dir)
+    usage = UsageLog(args.usage_log)
+    clients = _build_clients(args, usage)
     try:
-        test_code = generate_test_code_from_diff(diff_summary, spec_snippet)
-    except OllamaError as exc:
-        print(f"Error calling Ollama: {exc}")
-        return
+        if args.per_endpoint or args.split:
+            with profiling.span("prompt.build"):
+                jobs = build_generation_jobs(
+                    changes, old, new, args.context_tokens, args.max_prompt_tokens
+                )
+            print(
+                f"\nGenerating tests for {len(jobs)} endpoint group(s) with "
+                f"{args.workers} worker(s) across {len(args.ollama_url or [None])} "
+                "Ollama host(s)..."
+            )
+            _run_jobs(args, jobs, cache, templated, clients)
+        else:
+            _generate_single(args, changes, old, new, cache, templated, clients[0])
+    finally:
+        _print_usage(usage)
+
+
+def _generate_single(
+    args: argparse.Namespace,
+    changes: List[Change],
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    cache: Optional[GenerationCache],
+    templated: Dict[EndpointKey, str],
+    client: Client,
+) -> None:
+    """
+    Generate tests for the whole diff in one prompt, or in several if that
+    prompt would exceed --max-prompt-tokens.
+    """
+    from ai_client_ollama import OllamaError, PROMPT_VERSION, estimate_prompt_size
+    from generation import GenerationJob, merge_test_modules, split_changes
+    from generation_cache import cache_key
+    from validation import repair_module
+
+    with profiling.span("prompt.build"):
+        diff_summary = "\n".join(format_change(c) for c in changes)
+        spec_snippet = json_snippet_for_model(new, changes, old, args.context_tokens)
+        size = estimate_prompt_size(diff_summary, spec_snippet)
+    print(
+        f"\nPrompt size: ~{size.total} tokens (spec {size.spec_tokens}, "
+        f"diff {size.diff_tokens}; budget {args.max_prompt_tokens})"
+    )
+
+    if size.total > args.max_prompt_tokens:
+        batches = split_changes(changes, args.max_prompt_tokens, args.context_tokens)
+        if len(batches) > 1:
+            print(f"Prompt over budget; splitting the diff into {len(batches)} requests.")
+            if args.stream:
+                print("(--stream is not used for split requests.)")
+            with profiling.span("prompt.build"):
+                jobs = [
+                    GenerationJob(
+                        key=("", ""),
+                        diff_summary="\n".join(format_change(c) for c in batch),
+                        spec_snippet=json_snippet_for_model(
+                            new, batch, old, args.context_tokens
+                        ),
+                    )
+                    for batch in batches
+                ]
+            _run_jobs(args, jobs, cache, templated, [client])
+            return
+
+    key = cache_key(diff_summary, spec_snippet, PROMPT_VERSION, client.model)
+    test_code = None
+    if cache is not None and not args.refresh:
+        with profiling.span("cache.get"):
+            test_code = cache.get(key)
 
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text(test_code, encoding="utf-8")
+    prefix_modules = list(templated.values())
+
+    if test_code is not None:
+        print("\nUsing cached tests for unchanged specs (use --refresh to regenerate).")
+        _replace_file(output_path, merge_test_modules(prefix_modules + [test_code]))
+    else:
+        print("\nCalling local LLM via Ollama to generate pytest contract tests...")
+        try:
+            if args.stream:
+                with profiling.span("generate.stream"):
+                    test_code = _stream_to_file(
+                        client, diff_summary, spec_snippet, output_path, args.idle_timeout
+                    )
+            else:
+                test_code = client.generate_test_code(diff_summary, spec_snippet)
+        except OllamaError as exc:
+            print(f"Error calling Ollama: {exc}")
+            if args.stream:
+                print(f"Partial output left in: {_partial_path(output_path)}")
+            if templated:
+                # Keep what the templates covered, as _run_jobs() does.
+                _write_modules(args, templated)
+            sys.exit(1)
+        if not args.no_validate:
+            with profiling.span("validate"):
+                result = repair_module(test_code, client, max_rounds=args.repair_rounds)
+            _print_validation([result])
+            test_code = result.code
+        if cache is not None:
+            cache.put(key, test_code)
+        if prefix_modules:
+            test_code = merge_test_modules(prefix_modules + [test_code])
+        with profiling.span("write"):
+            _replace_file(output_path, test_code)
+        if args.stream:
+            _partial_path(output_path).unlink(missing_ok=True)
+
+    print(f"\nGenerated tests written to: {output_path}")
+
+
+def cmd_validate_tests(args: argparse.Namespace) -> None:
+    from token_budget import UsageLog
+    from validation import repair_modules, validate_modules
+
+    files: List[Path] = []
+    for target in args.tests:
+        path = Path(target)
+        files.extend(sorted(path.glob("test_*.py")) if path.is_dir() else [path])
+    if not files:
+        print("No test modules found.")
+        sys.exit(1)
+
+    modules = {f: f.read_text(encoding="utf-8") for f in files}
+    if not args.repair:
+        reports = validate_modules(modules, workers=args.workers)
+    else:
+        clients = _build_clients(args, UsageLog())
+        try:
+            results = repair_modules(
+                modules, clients[0], workers=args.workers, max_rounds=args.repair_rounds
+            )
+        finally:
+            for client in clients:
+                client.close()
+        for path, result in results.items():
+            if result.code != modules[path]:
+                path.write_text(result.code, encoding="utf-8")
+            if result.repaired or result.disabled:
+                print(
+                    f"{path}: repaired {', '.join(result.repaired) or '-'}; "
+                    f"disabled {', '.join(result.disabled) or '-'}"
+                )
+        reports = {path: r.report for path, r in results.items()}
+
+    failed = 0
+    for path, report in reports.items():
+        if report.ok:
+            print(f"OK     {path} ({report.tests} test(s))")
+            continue
+        failed += 1
+        print(f"BROKEN {path}")
+        if report.module_error:
+            print(f"  module: {report.module_error.splitlines()[0]}")
+        for failure in report.failures:
+            print(f"  {failure.name}: {failure.error.splitlines()[0] if failure.error else ''}")
+    if failed and not args.repair:
+        sys.exit(1)
+
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    import asyncio
+
+    from generation_cache import GenerationCache
+    from service import ContractService, run_service
+    from token_budget import UsageLog
 
+    cache = None if args.no_cache else GenerationCache(args.cache_dir)
+    usage = UsageLog(args.usage_log)
+    service = ContractService(
+        _build_clients(args, usage),
+        cache,
+        host=args.host,
+        port=args.port,
+        spec_cache_size=args.spec_cache_size,
+        workers=args.workers,
+        repair_rounds=None if args.no_validate else args.repair_rounds,
+        context_tokens=args.context_tokens,
+        max_prompt_tokens=args.max_prompt_tokens,
+    )
+    try:
+        asyncio.run(run_service(service))
+    except KeyboardInterrupt:
+        pass
+    except OSError as exc:
+        print(f"Error: cannot serve on {args.host}:{args.port}: {exc}")
+        sys.exit(1)
+    finally:
+        _print_usage(usage)
+
+
+def _build_clients(args: argparse.Namespace, usage: UsageLog) -> List[Client]:
+    """
+    One pooled client for a single host; with several --ollama-url hosts, a
+    HostPool that load balances over them with health checks and failover.
+    All clients record token usage into usage.
+    """
+    from ai_client_ollama import OllamaClient, default_url
+    from host_pool import HostPool
+
+    clients = [
+        OllamaClient(
+            url=url,
+            model=args.model,
+            pool_size=args.workers,
+            retries=args.retries,
+            usage=usage,
+        )
+        for url in (args.ollama_url or [default_url()])
+    ]
+    if len(clients) == 1:
+        return clients
+    return [HostPool(clients, probe_interval_seconds=args.probe_interval)]
+
+
+def _write_modules(args: argparse.Namespace, modules: Dict[EndpointKey, str]) -> None:
+    """Write per-endpoint modules to --output (merged, or one file each with --split)."""
+    from generation import endpoint_module_name, merge_test_modules
+
+    if not modules:
+        print("No tests generated.")
+        return
+
+    output_path = Path(args.output)
+    with profiling.span("write", files=len(modules) if args.split else 1):
+        if args.split:
+            output_path.mkdir(parents=True, exist_ok=True)
+            for key, code in modules.items():
+                (output_path / endpoint_module_name(key)).write_text(code, encoding="utf-8")
+        else:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            _replace_file(output_path, merge_test_modules(list(modules.values())))
     print(f"\nGenerated tests written to: {output_path}")
 
 
-def build_parser() -> argparse.ArgumentParser:
+def _run_jobs(
+    args: argparse.Namespace,
+    jobs: List[GenerationJob],
+    cache: Optional[GenerationCache],
+    templated: Dict[EndpointKey, str],
+    clients: List[Client],
+) -> None:
+    """
+    Run generation jobs on a worker pool, merging the results with any
+    template-generated modules for the same group. What was generated is
+    written even if some jobs failed; the run then exits with status 1.
+    """
+    from generation import merge_test_modules, run_generation_jobs
+
+    with profiling.span("generate.jobs", jobs=len(jobs)):
+        results = run_generation_jobs(
+            jobs,
+            clients,
+            workers=args.workers,
+            cache=cache,
+            refresh=args.refresh,
+            repair_rounds=None if args.no_validate else args.repair_rounds,
+        )
+
+    ok = [r for r in results if r.code is not None]
+    for r in results:
+        if r.error is not None:
+            print(f"Error generating tests for {r.key[0]} {r.key[1]}: {r.error}")
+
+    modules = dict(templated)
+    for r in ok:
+        previous = modules.get(r.key)
+        modules[r.key] = merge_test_modules([previous, r.code]) if previous else r.code
+
+    cached = sum(1 for r in ok if r.cached)
+    print(f"\n{len(ok)}/{len(results)} request(s) generated ({cached} from cache).")
+    _print_validation([r.validation for r in ok if r.validation is not None])
+    _write_modules(args, modules)
+    if len(ok) < len(results):
+        sys.exit(1)
+
+
+def _print_validation(results: List[RepairResult]) -> None:
+    """Summarize the validate/repair stage over generated modules."""
+    if not results:
+        return
+    tests = sum(r.report.tests for r in results)
+    repaired = [name for r in results for name in r.repaired]
+    disabled = [name for r in results for name in r.disabled]
+    print(
+        f"Validation: {tests} test(s) in {len(results)} module(s); "
+        f"{len(repaired)} repaired, {len(disabled)} disabled."
+    )
+    for name in disabled:
+        print(f"- disabled (still failing): {name}")
+    for r in results:
+        if r.report.module_error:
+            print(f"- module does not load: {r.report.module_error.splitlines()[0]}")
+
+
+def _print_usage(usage: UsageLog) -> None:
+    """Print token counts and model timings for the requests made this run."""
+    s = usage.summary()
+    if not s["requests"]:
+        return
+    print(
+        f"\nOllama usage: {s['requests']} request(s); "
+        f"prompt {s['prompt_tokens']} tokens (estimated "
+        f"{s['estimated_prompt_tokens']}), completion {s['completion_tokens']} tokens"
+    )
+    print(
+        f"  prefill {s['prompt_eval_seconds']}s "
+        f"({s['prompt_tokens_per_second'] or '-'} tok/s), "
+        f"generation {s['eval_seconds']}s "
+        f"({s['completion_tokens_per_second'] or '-'} tok/s)"
+    )
+    if usage.path:
+        print(f"  per-request usage appended to: {usage.path}")
+
+
+def build_parser(command: Optional[str] = None) -> argparse.ArgumentParser:
+    """
+    Build the argument parser. Every command is listed, but with command
+    set only that one gets its arguments, so only its defaults' modules are
+    imported (e.g. `compare` does not import requests).
+    """
     parser = argparse.ArgumentParser(
         description="AI contract testing tool using a local LLM via Ollama."
     )
     subparsers = parser.add_subparsers(dest="command")
 
-    # compare
-    p_compare = subparsers.add_parser(
-        "compare", help="Compare two spec JSON files and print differences."
+    # Profiling flags, accepted by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a breakdown of where the run spent its time (to stderr).",
+    )
+    common.add_argument(
+        "--profile-stats",
+        metavar="FILE",
+        help="Also run under cProfile and dump its stats to FILE (pstats format).",
+    )
+    common.add_argument(
+        "--profile-trace",
+        metavar="FILE",
+        help="Also write the spans as Chrome trace JSON (chrome://tracing, Perfetto).",
+    )
+    # Metrics export, accepted by every command
+    common.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve Prometheus/OpenMetrics metrics on http://127.0.0.1:PORT/metrics.",
+    )
+    common.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="Write metrics to FILE for node_exporter's textfile collector.",
+    )
+    common.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15.0,
+        metavar="SECONDS",
+        help="How often --metrics-file is rewritten while running (default: 15).",
     )
-    p_compare.add_argument("--old", required=True, help="Path to old spec (JSON).")
-    p_compare.add_argument("--new", required=True, help="Path to new spec (JSON).")
-    p_compare.set_defaults(func=cmd_compare)
 
-    # generate-tests
-    p_gen = subparsers.add_parser(
-        "generate-tests",
-        help="Generate pytest contract tests based on spec differences.",
+    for name, help_text, add_arguments in COMMANDS:
+        p = subparsers.add_parser(name, parents=[common], help=help_text)
+        if command is None or command == name:
+            add_arguments(p)
+
+    return parser
+
+
+def _compare_arguments(p: argparse.ArgumentParser) -> None:
+    old_source = p.add_mutually_exclusive_group(required=True)
+    old_source.add_argument("--old", help="Path to old spec (JSON).")
+    old_source.add_argument(
+        "--old-index",
+        help="Path to a snapshot index of the old spec (see `snapshot`); only "
+        "paths and operations whose hashes differ are diffed.",
+    )
+    p.add_argument("--new", required=True, help="Path to new spec (JSON).")
+    p.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Walk both files one path entry at a time (for very large specs); "
+        "changes are printed in file order as they are found.",
+    )
+    p.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="text",
+        help="Output format (default: text). json, ndjson and sarif mark each "
+        "change breaking or non-breaking; all formats are written as changes "
+        "are found.",
+    )
+    p.add_argument(
+        "--fail-on",
+        choices=("breaking", "any"),
+        help="Exit with status 1 if the diff has breaking changes (or any "
+        "change), e.g. to gate a merge in CI. No LLM is involved.",
+    )
+    p.add_argument(
+        "--rules",
+        help="JSON file of compatibility rules that override the built-in "
+        "ones (see compatibility.py).",
+    )
+    p.set_defaults(func=cmd_compare)
+
+
+def _compare_history_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--specs",
+        required=True,
+        help="Directory of spec JSON files or a glob, e.g. 'specs/spec_v*.json' "
+        "(naturally sorted: v2 before v10).",
+    )
+    p.add_argument(
+        "--format",
+        choices=("ndjson", "json"),
+        default="ndjson",
+        help="Change log format (default: ndjson, one version step per line).",
+    )
+    p.add_argument("--output", help="Write the change log here instead of stdout.")
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes (default: one per CPU).",
+    )
+    p.set_defaults(func=cmd_compare_history)
+
+
+def _scan_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--root", default=".", help="Tree to search for spec files (default: .)."
+    )
+    baseline = p.add_mutually_exclusive_group(required=True)
+    baseline.add_argument(
+        "--base-ref", help="Compare against the specs at this git ref, e.g. origin/main."
+    )
+    baseline.add_argument(
+        "--baseline-dir",
+        help="Compare against a directory with the same layout, e.g. a checkout of main.",
+    )
+    p.add_argument(
+        "--pattern",
+        action="append",
+        help="Glob (relative to --root) selecting spec files; repeatable. Default: "
+        "'specs/*.json' and '*/specs/*.json'.",
+    )
+    p.add_argument(
+        "--format",
+        choices=("text", "json", "ndjson"),
+        default="text",
+        help="Report format (default: text). ndjson writes one line per changed spec.",
+    )
+    p.add_argument("--output", help="Write the report here instead of stdout.")
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes (default: one per CPU).",
+    )
+    p.add_argument(
+        "--fail-on",
+        choices=("breaking", "any"),
+        help="Exit with status 1 if any spec has breaking changes (or any change).",
+    )
+    p.add_argument(
+        "--rules",
+        help="JSON file of compatibility rules that override the built-in "
+        "ones (see compatibility.py).",
+    )
+    stat_cache = p.add_mutually_exclusive_group()
+    stat_cache.add_argument(
+        "--stat-cache",
+        help="File hash cache, reused while mtime and size are unchanged "
+        "(default: <root>/.contract_ai_cache/scan-stat.json).",
+    )
+    stat_cache.add_argument(
+        "--no-stat-cache", action="store_true", help="Hash every file on every run."
+    )
+    p.set_defaults(func=cmd_scan)
+
+
+def _snapshot_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--spec", required=True, help="Path to spec (JSON).")
+    p.add_argument(
+        "--output", required=True, help="Output path for the index, e.g. main.idx"
+    )
+    p.set_defaults(func=cmd_snapshot)
+
+
+def _check_payloads_arguments(p: argparse.ArgumentParser) -> None:
+    from payload_validator import DEFAULT_MAX_EXAMPLES
+
+    p.add_argument("--spec", required=True, help="Path to spec (JSON).")
+    p.add_argument(
+        "--payloads",
+        required=True,
+        help='NDJSON capture, one {"path", "method", "status", "response", '
+        '"request"} object per line.',
+    )
+    p.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Worker processes, each checking a byte range of the file "
+        "(default: 1; 0 = one per CPU).",
+    )
+    p.add_argument(
+        "--strict",
+        action="store_true",
+        help="Also report fields the schema does not declare.",
+    )
+    p.add_argument(
+        "--max-examples",
+        type=int,
+        default=DEFAULT_MAX_EXAMPLES,
+        help=f"Line numbers kept per distinct violation (default: {DEFAULT_MAX_EXAMPLES}).",
+    )
+    p.add_argument(
+        "--json", action="store_true", help="Print the report as JSON."
+    )
+    p.set_defaults(func=cmd_check_payloads)
+
+
+def _http_url(value: str) -> str:
+    """argparse type for --target: replay speaks plain HTTP only."""
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(value)
+    try:
+        parts.port
+    except ValueError:
+        parts = parts._replace(scheme="")
+    if parts.scheme != "http" or not parts.hostname:
+        raise argparse.ArgumentTypeError(
+            f"expected an http:// URL such as http://localhost:8080, got {value!r}"
+        )
+    return value
+
+
+def _replay_arguments(p: argparse.ArgumentParser) -> None:
+    from payload_validator import DEFAULT_MAX_EXAMPLES
+    from replay import DEFAULT_CONCURRENCY
+
+    p.add_argument(
+        "--spec", help="Path to spec (JSON); required unless --serve."
+    )
+    p.add_argument(
+        "--capture",
+        required=True,
+        help="HAR archive (*.har) or NDJSON capture (as for check-payloads).",
+    )
+    p.add_argument(
+        "--target",
+        type=_http_url,
+        help="Base URL of a live service to send the requests to, e.g. "
+        "http://localhost:8080 or http://gateway/api (its path is put in front "
+        "of each recorded path; default: a local stand-in server serving the "
+        "recorded responses).",
+    )
+    p.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Requests in flight, one connection each (default: {DEFAULT_CONCURRENCY}).",
+    )
+    p.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="Per-request timeout in seconds (default: 30).",
+    )
+    p.add_argument(
+        "--strict",
+        action="store_true",
+        help="Also report fields the schema does not declare.",
+    )
+    p.add_argument(
+        "--max-examples",
+        type=int,
+        default=DEFAULT_MAX_EXAMPLES,
+        help=f"Capture line numbers kept per distinct violation (default: {DEFAULT_MAX_EXAMPLES}).",
+    )
+    p.add_argument(
+        "--json", action="store_true", help="Print the report as JSON."
+    )
+    p.add_argument(
+        "--serve",
+        action="store_true",
+        help="Only run the stand-in server for the capture, until interrupted.",
     )
-    p_gen.add_argument("--old", required=True, help="Path to old spec (JSON).")
-    p_gen.add_argument("--new", required=True, help="Path to new spec (JSON).")
-    p_gen.add_argument(
+    p.add_argument(
+        "--port",
+        type=int,
+        default=8099,
+        help="With --serve, port on 127.0.0.1 (default: 8099).",
+    )
+    p.set_defaults(func=cmd_replay)
+
+
+def _generate_tests_arguments(p: argparse.ArgumentParser) -> None:
+    from ai_client_ollama import DEFAULT_RETRIES, default_model
+    from generation_cache import DEFAULT_CACHE_DIR
+    from host_pool import DEFAULT_PROBE_INTERVAL_SECONDS
+    from spec_context import DEFAULT_CONTEXT_TOKENS
+    from token_budget import DEFAULT_MAX_PROMPT_TOKENS
+    from validation import DEFAULT_REPAIR_ROUNDS
+
+    p.add_argument("--old", required=True, help="Path to old spec (JSON).")
+    p.add_argument("--new", required=True, help="Path to new spec (JSON).")
+    p.add_argument(
         "--output",
         required=True,
         help="Output path for generated pytest file, e.g. tests/test_contract_generated.py",
     )
-    p_gen.set_defaults(func=cmd_generate_tests)
+    p.add_argument(
+        "--generator",
+        choices=("auto", "llm", "template"),
+        default="auto",
+        help="auto: built-in templates for simple changes, LLM for the rest "
+        "(default); llm: send everything to the LLM; template: templates only, "
+        "no LLM calls.",
+    )
+    p.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory for cached generations (default: {DEFAULT_CACHE_DIR}).",
+    )
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read from or write to the generation cache.",
+    )
+    p.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached results and regenerate (the cache is updated).",
+    )
+    p.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the model output to <output>.partial as it arrives; it "
+        "replaces --output once generation succeeds.",
+    )
+    p.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=30.0,
+        help="With --stream: max seconds to wait between chunks (default: 30).",
+    )
+    p.add_argument(
+        "--context-tokens",
+        type=int,
+        default=DEFAULT_CONTEXT_TOKENS,
+        help="Approximate token budget for the spec context in each prompt: "
+        "changed operations and the components they reference "
+        f"(default: {DEFAULT_CONTEXT_TOKENS}).",
+    )
+    p.add_argument(
+        "--max-prompt-tokens",
+        type=int,
+        default=DEFAULT_MAX_PROMPT_TOKENS,
+        help="Approximate token budget for a whole prompt; larger diffs are "
+        f"split into several requests (default: {DEFAULT_MAX_PROMPT_TOKENS}).",
+    )
+    p.add_argument(
+        "--usage-log",
+        metavar="PATH",
+        help="Append one NDJSON line per Ollama request with prompt/completion "
+        "tokens and prefill/generation durations.",
+    )
+    p.add_argument(
+        "--per-endpoint",
+        action="store_true",
+        help="Send one prompt per endpoint/method and generate them in parallel.",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="With --per-endpoint: number of concurrent generations (default: 4).",
+    )
+    p.add_argument(
+        "--ollama-url",
+        action="append",
+        metavar="URL",
+        help="Ollama /api/chat URL; repeat to load balance over hosts with "
+        "health checks and failover "
+        "(default: $OLLAMA_URL or http://localhost:11434/api/chat).",
+    )
+    p.add_argument(
+        "--probe-interval",
+        type=float,
+        default=DEFAULT_PROBE_INTERVAL_SECONDS,
+        help="With several --ollama-url hosts: seconds between health probes "
+        f"(default: {DEFAULT_PROBE_INTERVAL_SECONDS:g}; 0 disables).",
+    )
+    p.add_argument(
+        "--model",
+        default=default_model(),
+        help="Ollama model name (default: $OLLAMA_MODEL or llama3).",
+    )
+    p.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Retries with backoff on connection errors and 5xx responses "
+        f"(default: {DEFAULT_RETRIES}).",
+    )
+    p.add_argument(
+        "--split",
+        action="store_true",
+        help="Treat --output as a directory and write one module per "
+        "endpoint (implies --per-endpoint for LLM generation).",
+    )
+    p.add_argument(
+        "--repair-rounds",
+        type=int,
+        default=DEFAULT_REPAIR_ROUNDS,
+        help="Times to re-prompt the model with functions that fail to "
+        "compile, collect or pass; still-failing ones are commented out "
+        f"(default: {DEFAULT_REPAIR_ROUNDS}).",
+    )
+    p.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="Write LLM output as is, without validating it under pytest.",
+    )
+    p.set_defaults(func=cmd_generate_tests)
+
+
+def _serve_arguments(p: argparse.ArgumentParser) -> None:
+    from ai_client_ollama import DEFAULT_RETRIES, default_model
+    from generation_cache import DEFAULT_CACHE_DIR
+    from host_pool import DEFAULT_PROBE_INTERVAL_SECONDS
+    from service import DEFAULT_PORT, DEFAULT_SPEC_CACHE_SIZE
+    from spec_context import DEFAULT_CONTEXT_TOKENS
+    from token_budget import DEFAULT_MAX_PROMPT_TOKENS
+    from validation import DEFAULT_REPAIR_ROUNDS
+
+    p.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default: 127.0.0.1).",
+    )
+    p.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on (default: {DEFAULT_PORT}).",
+    )
+    p.add_argument(
+        "--spec-cache-size",
+        type=int,
+        default=DEFAULT_SPEC_CACHE_SIZE,
+        help=f"Parsed specs kept in memory, least recently used evicted first "
+        f"(default: {DEFAULT_SPEC_CACHE_SIZE}).",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Concurrent LLM generations, and Ollama connections per host (default: 4).",
+    )
+    p.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory for cached generations (default: {DEFAULT_CACHE_DIR}).",
+    )
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read from or write to the generation cache.",
+    )
+    p.add_argument(
+        "--context-tokens",
+        type=int,
+        default=DEFAULT_CONTEXT_TOKENS,
+        help=f"Approximate token budget for the spec context in each prompt "
+        f"(default: {DEFAULT_CONTEXT_TOKENS}).",
+    )
+    p.add_argument(
+        "--max-prompt-tokens",
+        type=int,
+        default=DEFAULT_MAX_PROMPT_TOKENS,
+        help=f"Approximate token budget for a whole prompt (default: {DEFAULT_MAX_PROMPT_TOKENS}).",
+    )
+    p.add_argument(
+        "--usage-log",
+        metavar="PATH",
+        help="Append one NDJSON line per Ollama request with token counts and durations.",
+    )
+    p.add_argument(
+        "--ollama-url",
+        action="append",
+        metavar="URL",
+        help="Ollama /api/chat URL; repeat to load balance over hosts "
+        "(default: $OLLAMA_URL or http://localhost:11434/api/chat).",
+    )
+    p.add_argument(
+        "--probe-interval",
+        type=float,
+        default=DEFAULT_PROBE_INTERVAL_SECONDS,
+        help="With several --ollama-url hosts: seconds between health probes "
+        f"(default: {DEFAULT_PROBE_INTERVAL_SECONDS:g}; 0 disables).",
+    )
+    p.add_argument(
+        "--model",
+        default=default_model(),
+        help="Ollama model name (default: $OLLAMA_MODEL or llama3).",
+    )
+    p.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Retries with backoff on connection errors and 5xx responses "
+        f"(default: {DEFAULT_RETRIES}).",
+    )
+    p.add_argument(
+        "--repair-rounds",
+        type=int,
+        default=DEFAULT_REPAIR_ROUNDS,
+        help=f"Times to re-prompt the model with failing functions "
+        f"(default: {DEFAULT_REPAIR_ROUNDS}).",
+    )
+    p.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="Return LLM output as is, without validating it under pytest.",
+    )
+    p.set_defaults(func=cmd_serve)
 
-    return parser
+
+def _validate_tests_arguments(p: argparse.ArgumentParser) -> None:
+    from ai_client_ollama import DEFAULT_RETRIES, default_model
+    from host_pool import DEFAULT_PROBE_INTERVAL_SECONDS
+    from validation import DEFAULT_REPAIR_ROUNDS
+
+    p.add_argument(
+        "--tests",
+        nargs="+",
+        required=True,
+        metavar="PATH",
+        help="Test modules, or directories of test_*.py modules.",
+    )
+    p.add_argument(
+        "--repair",
+        action="store_true",
+        help="Re-prompt the model with failing functions and rewrite the files.",
+    )
+    p.add_argument(
+        "--repair-rounds",
+        type=int,
+        default=DEFAULT_REPAIR_ROUNDS,
+        help=f"With --repair: max re-prompts per module (default: {DEFAULT_REPAIR_ROUNDS}).",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Modules validated concurrently, one pytest process each (default: 4).",
+    )
+    p.add_argument(
+        "--ollama-url",
+        action="append",
+        metavar="URL",
+        help="With --repair: Ollama /api/chat URL (repeatable).",
+    )
+    p.add_argument(
+        "--model",
+        default=default_model(),
+        help="With --repair: Ollama model name (default: $OLLAMA_MODEL or llama3).",
+    )
+    p.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"With --repair: retries on connection errors and 5xx (default: {DEFAULT_RETRIES}).",
+    )
+    p.add_argument(
+        "--probe-interval",
+        type=float,
+        default=DEFAULT_PROBE_INTERVAL_SECONDS,
+        help=argparse.SUPPRESS,
+    )
+    p.set_defaults(func=cmd_validate_tests)
+
+
+# (name, help, function adding the arguments), in --help order
+COMMANDS: List[Tuple[str, str, Callable[[argparse.ArgumentParser], None]]] = [
+    ("compare", "Compare two spec JSON files and print differences.", _compare_arguments),
+    (
+        "compare-history",
+        "Diff every adjacent pair in an ordered series of spec versions.",
+        _compare_history_arguments,
+    ),
+    (
+        "scan",
+        "Compare every spec under a tree against a git ref or baseline directory.",
+        _scan_arguments,
+    ),
+    (
+        "snapshot",
+        "Build a snapshot index of a spec for fast repeated compares.",
+        _snapshot_arguments,
+    ),
+    (
+        "check-payloads",
+        "Validate recorded request/response payloads (NDJSON) against a spec.",
+        _check_payloads_arguments,
+    ),
+    (
+        "replay",
+        "Replay a HAR/NDJSON capture over HTTP and check responses against a spec.",
+        _replay_arguments,
+    ),
+    (
+        "generate-tests",
+        "Generate pytest contract tests based on spec differences.",
+        _generate_tests_arguments,
+    ),
+    ("serve", "Run an HTTP service with /compare and /generate endpoints.", _serve_arguments),
+    (
+        "validate-tests",
+        "Check generated test modules function by function, optionally "
+        "repairing failures with the LLM.",
+        _validate_tests_arguments,
+    ),
+]
 
 
 def main() -> None:
-    parser = build_parser()
-    args = parser.parse_args()
+    argv = sys.argv[1:]
+    parser = build_parser(argv[0] if argv else None)
+    args = parser.parse_args(argv)
 
     if not getattr(args, "command", None):
         parser.print_help()
         return
 
-    args.func(args)
+    server = None
+    exporter = None
+    if args.metrics_port is not None:
+        try:
+            server = metrics.start_http_server(args.metrics_port)
+        except OSError as exc:
+            print(f"Error: cannot serve metrics on port {args.metrics_port}: {exc}")
+            sys.exit(1)
+    if args.metrics_file:
+        exporter = metrics.start_textfile_exporter(args.metrics_file, args.metrics_interval)
+    try:
+        _run(args)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+        if server is not None:
+            server.shutdown()
+
+
+def _run(args: argparse.Namespace) -> None:
+    """Run the selected command, under the profiler if asked to."""
+    profile = args.profile or args.profile_stats or args.profile_trace
+    if not profile:
+        args.func(args)
+        return
+
+    profiling.enable()
+    profiler = None
+    if args.profile_stats:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    try:
+        with profiling.span(f"cli.{args.command}"):
+            if profiler is not None:
+                profiler.runcall(args.func, args)
+            else:
+                args.func(args)
+    finally:
+        profiling.disable()
+        profiling.print_breakdown()
+        if profiler is not None:
+            profiler.dump_stats(args.profile_stats)
+            print(f"cProfile stats written to: {args.profile_stats}", file=sys.stderr)
+        if args.profile_trace:
+            profiling.write_chrome_trace(args.profile_trace)
+            print(f"Chrome trace written to: {args.profile_trace}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+# compatibility.py
+"""
+Breaking vs non-breaking classification of diff changes.
+
+A change is breaking when a client written against the old spec can fail
+against the new one:
+- an endpoint or method it calls is gone
+- a response field it reads is gone or changed type
+- the request needs a field it does not send, or accepts fewer values
+  for one it does (a narrowed type)
+
+Additions that old clients can ignore (endpoints, methods, response
+fields), request fields that are no longer read and request types that
+were widened are non-breaking.
+
+Classification is a rule engine. A Rule matches a change kind, optionally
+only in the request or response schema and only when its `when` predicate
+holds, and gives a severity. RuleSet compiles an ordered list of rules
+once into dispatch tables keyed by (kind, location), so classifying a
+change is a dict lookup, plus predicate calls only for the few kinds that
+have guarded rules. The first matching rule wins, so rules placed in front
+of DEFAULT_RULES (e.g. from a JSON file, load_rules()) override them.
+Changes no rule matches are breaking.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from diff_engine import (
+    ENDPOINT_ADDED,
+    ENDPOINT_REMOVED,
+    FIELD_ADDED,
+    FIELD_REMOVED,
+    FIELD_TYPE_CHANGED,
+    METHOD_ADDED,
+    METHOD_REMOVED,
+    REQUEST,
+    RESPONSE,
+    Change,
+)
+
+BREAKING = "breaking"
+NON_BREAKING = "non-breaking"
+SEVERITIES = (BREAKING, NON_BREAKING)
+
+KINDS = (
+    ENDPOINT_ADDED,
+    ENDPOINT_REMOVED,
+    METHOD_ADDED,
+    METHOD_REMOVED,
+    FIELD_ADDED,
+    FIELD_REMOVED,
+    FIELD_TYPE_CHANGED,
+)
+LOCATIONS = (REQUEST, RESPONSE)
+
+# (old type, new type) pairs where every old value is still a valid new value
+WIDENINGS = frozenset({("integer", "number")})
+
+
+class Rule(NamedTuple):
+    """
+    Severity for changes of kind. location limits the rule to request or
+    response fields (None: both, and endpoint/method changes); when, if
+    set, must also return True for the change.
+    """
+
+    name: str
+    kind: str
+    severity: str
+    location: Optional[str] = None
+    when: Optional[Callable[[Change], bool]] = None
+    description: str = ""
+
+
+def _widened(change: Change) -> bool:
+    return (change.old_type, change.new_type) in WIDENINGS
+
+
+DEFAULT_RULES: Tuple[Rule, ...] = (
+    Rule("endpoint-added", ENDPOINT_ADDED, NON_BREAKING, description="An endpoint was added."),
+    Rule("endpoint-removed", ENDPOINT_REMOVED, BREAKING, description="An endpoint was removed."),
+    Rule("method-added", METHOD_ADDED, NON_BREAKING, description="An HTTP method was added."),
+    Rule("method-removed", METHOD_REMOVED, BREAKING, description="An HTTP method was removed."),
+    Rule(
+        "response-field-added",
+        FIELD_ADDED,
+        NON_BREAKING,
+        RESPONSE,
+        description="A response field was added; old clients ignore it.",
+    ),
+    Rule(
+        "request-field-added",
+        FIELD_ADDED,
+        BREAKING,
+        REQUEST,
+        description="A request field was added; old clients do not send it.",
+    ),
+    Rule(
+        "response-field-removed",
+        FIELD_REMOVED,
+        BREAKING,
+        RESPONSE,
+        description="A response field was removed; old clients may read it.",
+    ),
+    Rule(
+        "request-field-removed",
+        FIELD_REMOVED,
+        NON_BREAKING,
+        REQUEST,
+        description="A request field is no longer read.",
+    ),
+    Rule(
+        "request-type-widened",
+        FIELD_TYPE_CHANGED,
+        NON_BREAKING,
+        REQUEST,
+        when=_widened,
+        description="A request field accepts more values than before.",
+    ),
+    Rule(
+        "type-changed",
+        FIELD_TYPE_CHANGED,
+        BREAKING,
+        description="A field changed or narrowed its type.",
+    ),
+)
+
+# What changes no rule matches get
+UNMATCHED = Rule("unmatched", "", BREAKING, description="No rule matched the change.")
+
+
+class RuleSet:
+    """
+    Rules compiled into dispatch tables. Rules are tried in order and the
+    first match wins.
+    """
+
+    def __init__(self, rules: Iterable[Rule] = DEFAULT_RULES) -> None:
+        self.rules: List[Rule] = list(rules)
+        for rule in self.rules:
+            if rule.severity not in SEVERITIES:
+                raise ValueError(f"Rule {rule.name}: unknown severity {rule.severity!r}")
+            if rule.location not in (None,) + LOCATIONS:
+                raise ValueError(f"Rule {rule.name}: unknown location {rule.location!r}")
+
+        # (kind, location) -> the rule, when the first candidate is unconditional
+        self._fixed: Dict[Tuple[str, str], Rule] = {}
+        # (kind, location) -> candidates to try in order, when one is guarded
+        self._guarded: Dict[Tuple[str, str], Tuple[Rule, ...]] = {}
+        for kind in {rule.kind for rule in self.rules}:
+            for location in LOCATIONS:
+                candidates = tuple(
+                    r for r in self.rules if r.kind == kind and r.location in (None, location)
+                )
+                if not candidates:
+                    continue
+                if candidates[0].when is None:
+                    self._fixed[(kind, location)] = candidates[0]
+                else:
+                    # Nothing after an unconditional rule can match.
+                    cut = next((i for i, r in enumerate(candidates) if r.when is None), None)
+                    self._guarded[(kind, location)] = (
+                        candidates if cut is None else candidates[: cut + 1]
+                    )
+
+    def match(self, change: Change) -> Rule:
+        """The rule deciding change's severity (UNMATCHED if none applies)."""
+        key = (change.kind, change.location)
+        rule = self._fixed.get(key)
+        if rule is not None:
+            return rule
+        for rule in self._guarded.get(key, ()):
+            if rule.when is None or rule.when(change):
+                return rule
+        return UNMATCHED
+
+    def classify(self, change: Change) -> str:
+        return self.match(change).severity
+
+
+DEFAULT_RULESET = RuleSet()
+
+
+def classify(change: Change) -> str:
+    """BREAKING or NON_BREAKING under DEFAULT_RULES."""
+    return DEFAULT_RULESET.match(change).severity
+
+
+def load_rules(path: str) -> List[Rule]:
+    """
+    Read rule overrides from a JSON file: a list of objects with "kind" and
+    "severity", and optionally "name", "location" and "description". Put
+    them in front of DEFAULT_RULES to override the defaults.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a JSON list of rules")
+
+    rules: List[Rule] = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or "kind" not in entry or "severity" not in entry:
+            raise ValueError(f"{path}: rule {i} needs at least 'kind' and 'severity'")
+        if entry["kind"] not in KINDS:
+            raise ValueError(f"{path}: rule {i}: unknown kind {entry['kind']!r}")
+        rules.append(
+            Rule(
+                name=entry.get("name") or f"custom-{i}",
+                kind=entry["kind"],
+                severity=entry["severity"],
+                location=entry.get("location"),
+                description=entry.get("description", ""),
+            )
+        )
+    return rules
@@ -5,24 +5,111 @@ API specification diff engine.
 Compares two simplified API specs and detects changes at:
 - Endpoint level (added/removed paths)
 - Method level (added/removed HTTP methods)
-- Field level (added/removed/type-changed fields in response.schema)
+- Field level (added/removed/type-changed fields in response.schema and
+  request.schema), including nested objects, arrays and $ref components
+
+Schemas are compared recursively. Nested fields are reported with dotted
+names ("customer.address.city") and array items with "[]" ("items[].sku").
+Every subtree gets a structural hash; equal hashes are skipped without
+descending, and the diff of each (old hash, new hash) pair is memoized,
+so a shared component is compared once no matter how many endpoints
+reference it.
+
+Changes are produced as compact Change records; rendering them as
+human-readable strings is a separate presentation step (format_change).
+ChangeIndex groups records by path, method, field and kind so callers can
+filter without parsing strings.
+
+iter_changes() yields changes lazily; iter_diff_files() does the same
+straight from two spec files via spec_stream.LazySpec, decoding one path
+entry at a time so very large specs are never fully loaded.
+iter_diff_snapshot() diffs a spec file against a persisted snapshot index
+(spec_index), descending only into paths and operations whose hashes differ.
+
+Every completed diff updates the contract_ai_diffs and contract_ai_changes
+counters in metrics.
 """
 
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import Dict, List, Any
+from collections import Counter
+from typing import Dict, List, Any, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import profiling
+from metrics import CHANGES, DIFFS
+from spec_index import REF_MARKER, SpecSnapshot, canonical_hash, raw_hash
+from spec_stream import LazySpec
+
+# Change kinds
+ENDPOINT_ADDED = "endpoint_added"
+ENDPOINT_REMOVED = "endpoint_removed"
+METHOD_ADDED = "method_added"
+METHOD_REMOVED = "method_removed"
+FIELD_ADDED = "field_added"
+FIELD_REMOVED = "field_removed"
+FIELD_TYPE_CHANGED = "field_type_changed"
+
+# Where a field-level change was found
+RESPONSE = "response"
+REQUEST = "request"
+
+_REF_PREFIX = "#/components/schemas/"
+
+
+class Change(NamedTuple):
+    """
+    One detected difference between two specs.
+
+    method is None for endpoint-level changes; field/old_type/new_type are
+    only set for field-level changes, and location tells whether the field
+    belongs to the response or the request schema. methods lists the HTTP
+    methods of an added or removed endpoint.
+    """
+
+    kind: str
+    path: str
+    method: Optional[str] = None
+    field: Optional[str] = None
+    old_type: Optional[str] = None
+    new_type: Optional[str] = None
+    methods: Tuple[str, ...] = ()
+    location: str = RESPONSE
+
+
+# (kind, field relative to the compared node, old_type, new_type)
+_FieldDiff = Tuple[str, str, Optional[str], Optional[str]]
 
 
 def load_spec(path: str) -> Dict[str, Any]:
     """Load API spec from JSON file."""
-    with open(path, "r", encoding="utf-8") as f:
+    with profiling.span("load_spec", path=path), open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def diff_specs(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> List[str]:
+def diff_changes(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> List[Change]:
+    """Compare two API specs and return a list of Change records."""
+    with profiling.span("diff_changes") as span:
+        changes = list(iter_changes(old_spec, new_spec))
+        span.set(changes=len(changes))
+    return changes
+
+
+def _counted(changes: Iterator[Change]) -> Iterator[Change]:
+    """Pass changes through, recording the diff metrics once exhausted."""
+    kinds: Counter = Counter()
+    for change in changes:
+        kinds[change.kind] += 1
+        yield change
+    DIFFS.inc()
+    for kind, count in kinds.items():
+        CHANGES.inc(count, kind=kind)
+
+
+def iter_changes(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> Iterator[Change]:
     """
-    Compare two API specs and return list of human-readable changes.
+    Compare two API specs and yield Change records as they are found.
 
     Expected spec structure:
     {
@@ -30,26 +117,34 @@ def diff_specs(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> List[str]:
         "paths": {
             "/widget": {
                 "GET": {
+                    "request": {"schema": {...}},  # optional
                     "response": {
                         "status": 200,
                         "schema": {
                             "id": "string",
                             "status": "string",
+                            "owner": {"name": "string"},  # nested object
+                            "tags": ["string"],  # array of strings
+                            "price": {"$ref": "#/components/schemas/Money"},
                             ...
                         }
                     }
                 }
             }
-        }
+        },
+        "components": {"schemas": {"Money": {...}}}  # optional
     }
 
-    Returns:
-        List of change descriptions (e.g., "Endpoint /widget GET: field 'amount' type changed from number to string")
+    Ordering: added endpoints, removed endpoints, then per common endpoint
+    (sorted) its method and field changes.
     """
-    changes = []
+    return _counted(_iter_changes(old_spec, new_spec))
 
+
+def _iter_changes(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> Iterator[Change]:
     old_paths = old_spec.get("paths", {})
     new_paths = new_spec.get("paths", {})
+    differ = _SchemaDiffer(old_spec.get("components"), new_spec.get("components"))
 
     # Detect endpoint-level changes
     old_path_names = set(old_paths.keys())
@@ -60,78 +155,433 @@ def diff_specs(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> List[str]:
     common_paths = old_path_names & new_path_names
 
     for path in sorted(added_paths):
-        methods = list(new_paths[path].keys())
-        changes.append(f"Endpoint added: {path} {methods}")
+        yield Change(ENDPOINT_ADDED, path, methods=tuple(new_paths[path].keys()))
 
     for path in sorted(removed_paths):
-        methods = list(old_paths[path].keys())
-        changes.append(f"Endpoint removed: {path} {methods}")
+        yield Change(ENDPOINT_REMOVED, path, methods=tuple(old_paths[path].keys()))
 
     # Detect method and field-level changes for common paths
     for path in sorted(common_paths):
-        old_methods = old_paths[path]
-        new_methods = new_paths[path]
+        yield from _diff_methods(path, old_paths[path], new_paths[path], differ)
+
+
+def iter_diff_files(old_path: str, new_path: str) -> Iterator[Change]:
+    """
+    Stream the diff of two spec files without loading either document.
+
+    The old spec is indexed by byte span (path name -> span) and the new spec
+    is walked entry by entry; the matching old entry is decoded only when
+    needed. Peak memory is bounded by the largest single path entry.
 
-        old_method_names = set(old_methods.keys())
-        new_method_names = set(new_methods.keys())
+    Top-level "components" are decoded whole, since any endpoint may
+    reference them.
 
-        added_methods = new_method_names - old_method_names
-        removed_methods = old_method_names - new_method_names
-        common_methods = old_method_names & new_method_names
+    Ordering differs from iter_changes(): changes for added and common
+    endpoints follow the new file's order, then removed endpoints follow
+    the old file's order.
+    """
+    return _counted(_iter_diff_files(old_path, new_path))
 
-        for method in sorted(added_methods):
-            changes.append(f"Endpoint {path}: method {method} added")
 
-        for method in sorted(removed_methods):
-            changes.append(f"Endpoint {path}: method {method} removed")
+def _iter_diff_files(old_path: str, new_path: str) -> Iterator[Change]:
+    with LazySpec(old_path) as old, LazySpec(new_path) as new:
+        differ = _SchemaDiffer(old.get("components"), new.get("components"))
+        old_spans = old.path_spans()
 
-        # Compare response schemas for common methods
-        for method in sorted(common_methods):
-            old_response = old_methods[method].get("response", {}).get("schema", {})
-            new_response = new_methods[method].get("response", {}).get("schema", {})
+        for path, new_methods in new.iter_paths():
+            span = old_spans.pop(path, None)
+            if span is None:
+                yield Change(ENDPOINT_ADDED, path, methods=tuple(new_methods.keys()))
+            else:
+                yield from _diff_methods(path, old.load_span(span), new_methods, differ)
 
-            field_changes = _diff_fields(path, method, old_response, new_response)
-            changes.extend(field_changes)
+        # Whatever was not matched by the new spec has been removed.
+        for path, span in old_spans.items():
+            old_methods = old.load_span(span)
+            yield Change(ENDPOINT_REMOVED, path, methods=tuple(old_methods.keys()))
 
-    return changes
 
+def iter_diff_snapshot(snapshot: SpecSnapshot, new_path: str) -> Iterator[Change]:
+    """
+    Diff a spec file against a snapshot index built by spec_index.build_index().
+
+    Paths whose raw bytes hash the same as in the snapshot are skipped
+    without being parsed. Other paths are decoded and only operations whose
+    canonical hash differs are diffed, using the operation stored in the
+    snapshot as the old side. If the components section changed, anything
+    that uses $ref is diffed as well.
+
+    Ordering matches iter_diff_files().
+    """
+    return _counted(_iter_diff_snapshot(snapshot, new_path))
+
+
+def _iter_diff_snapshot(snapshot: SpecSnapshot, new_path: str) -> Iterator[Change]:
+    with LazySpec(new_path) as new:
+        new_components = new.get("components") or {}
+        components_changed = canonical_hash(new_components) != snapshot.components_hash
+        differ = _SchemaDiffer(snapshot.components, new_components)
+        old_hashes = snapshot.path_hashes()
+
+        for path, span in new.path_spans().items():
+            old_hash = old_hashes.pop(path, None)
+            raw = new.raw(span)
+            if old_hash == raw_hash(raw) and not (
+                components_changed and REF_MARKER in raw
+            ):
+                continue
+
+            new_methods = new.load_span(span)
+            if old_hash is None:
+                yield Change(ENDPOINT_ADDED, path, methods=tuple(new_methods.keys()))
+                continue
+
+            old_ops = snapshot.operations(path)
+            old_subset: Dict[str, Any] = {}
+            new_subset: Dict[str, Any] = {}
+            for method, op in new_methods.items():
+                entry = old_ops.pop(method, None)
+                if entry is None:
+                    new_subset[method] = op
+                elif entry.hash != canonical_hash(op) or (
+                    components_changed and entry.has_ref
+                ):
+                    old_subset[method] = snapshot.load_operation(path, method)
+                    new_subset[method] = op
+            # Methods only in the snapshot were removed; their bodies are not needed.
+            for method in old_ops:
+                old_subset[method] = {}
+
+            yield from _diff_methods(path, old_subset, new_subset, differ)
 
-def _diff_fields(
+        # Whatever was not matched by the new spec has been removed.
+        for path in old_hashes:
+            methods = tuple(snapshot.operations(path).keys())
+            yield Change(ENDPOINT_REMOVED, path, methods=methods)
+
+
+def diff_specs(old_spec: Dict[str, Any], new_spec: Dict[str, Any]) -> List[str]:
+    """
+    Compare two API specs and return list of human-readable changes.
+
+    See diff_changes() for the expected spec structure.
+
+    Returns:
+        List of change descriptions (e.g., "Endpoint /widget GET: field 'amount' type changed from number to string")
+    """
+    return [format_change(c) for c in diff_changes(old_spec, new_spec)]
+
+
+def _diff_methods(
     path: str,
-    method: str,
-    old_fields: Dict[str, str],
-    new_fields: Dict[str, str],
-) -> List[str]:
-    """Compare response field schemas between old and new specs."""
-    changes = []
-
-    old_field_names = set(old_fields.keys())
-    new_field_names = set(new_fields.keys())
-
-    added_fields = new_field_names - old_field_names
-    removed_fields = old_field_names - new_field_names
-    common_fields = old_field_names & new_field_names
-
-    for field in sorted(added_fields):
-        field_type = new_fields[field]
-        changes.append(
-            f"Endpoint {path} {method}: field '{field}' added (type: {field_type})"
+    old_methods: Dict[str, Any],
+    new_methods: Dict[str, Any],
+    differ: "_SchemaDiffer",
+) -> List[Change]:
+    """Compare the methods of one endpoint present in both specs."""
+    changes: List[Change] = []
+
+    old_method_names = set(old_methods.keys())
+    new_method_names = set(new_methods.keys())
+
+    added_methods = new_method_names - old_method_names
+    removed_methods = old_method_names - new_method_names
+    common_methods = old_method_names & new_method_names
+
+    for method in sorted(added_methods):
+        changes.append(Change(METHOD_ADDED, path, method))
+
+    for method in sorted(removed_methods):
+        changes.append(Change(METHOD_REMOVED, path, method))
+
+    # Compare response (then request) schemas for common methods
+    for method in sorted(common_methods):
+        for location in (RESPONSE, REQUEST):
+            old_schema = old_methods[method].get(location, {}).get("schema", {})
+            new_schema = new_methods[method].get(location, {}).get("schema", {})
+
+            for kind, field, old_type, new_type in differ.diff(old_schema, new_schema):
+                changes.append(
+                    Change(
+                        kind,
+                        path,
+                        method,
+                        field or "$",
+                        old_type,
+                        new_type,
+                        location=location,
+                    )
+                )
+
+    return changes
+
+
+def _join_field(prefix: str, rel: str) -> str:
+    """Join a field name with a nested relative name ("a" + "b" -> "a.b")."""
+    if not rel:
+        return prefix
+    if rel.startswith("[]"):
+        return prefix + rel
+    return f"{prefix}.{rel}"
+
+
+class _SchemaIndex:
+    """
+    $ref resolution and memoized structural hashing for one spec's schemas.
+
+    Schema nodes are type names ("string"), objects ({field: node}), arrays
+    ([item_node]) or references ({"$ref": "#/components/schemas/Name"}).
+    """
+
+    __slots__ = ("schemas", "_ref_hashes", "_hashing")
+
+    def __init__(self, components: Optional[Dict[str, Any]]) -> None:
+        self.schemas: Dict[str, Any] = (components or {}).get("schemas") or {}
+        self._ref_hashes: Dict[str, str] = {}
+        self._hashing: set = set()
+
+    @staticmethod
+    def _ref_name(node: Any) -> Optional[str]:
+        if isinstance(node, dict) and len(node) == 1:
+            ref = node.get("$ref")
+            if isinstance(ref, str) and ref.startswith(_REF_PREFIX):
+                return ref[len(_REF_PREFIX):]
+        return None
+
+    def resolve(self, node: Any) -> Any:
+        """Follow $ref chains; unknown or cyclic references are returned as-is."""
+        seen = set()
+        name = self._ref_name(node)
+        while name is not None and name in self.schemas and name not in seen:
+            seen.add(name)
+            node = self.schemas[name]
+            name = self._ref_name(node)
+        return node
+
+    def type_name(self, node: Any) -> str:
+        """Type name used in change records: "object", "array" or the primitive."""
+        node = self.resolve(node)
+        if isinstance(node, dict):
+            ref = node.get("$ref") if len(node) == 1 else None
+            return ref if isinstance(ref, str) else "object"
+        if isinstance(node, list):
+            return "array"
+        return str(node)
+
+    def hash(self, node: Any) -> str:
+        """Structural hash: equal for schemas with the same shape and types."""
+        name = self._ref_name(node)
+        if name is not None and name in self.schemas:
+            cached = self._ref_hashes.get(name)
+            if cached is not None:
+                return cached
+            if name in self._hashing:
+                return f"cycle:{name}"
+            self._hashing.add(name)
+            try:
+                digest = self.hash(self.schemas[name])
+            finally:
+                self._hashing.discard(name)
+            self._ref_hashes[name] = digest
+            return digest
+
+        if isinstance(node, dict):
+            # Primitive leaves are inlined; they are the common case.
+            parts = [
+                f"{k}=t:{v}" if isinstance(v, str) else f"{k}={self.hash(v)}"
+                for k, v in sorted(node.items())
+            ]
+            text = "o{" + ",".join(parts) + "}"
+        elif isinstance(node, list):
+            text = "a[" + ",".join(self.hash(item) for item in node) + "]"
+        else:
+            return f"t:{node}"
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _SchemaDiffer:
+    """Recursive schema diff memoized by (old hash, new hash)."""
+
+    __slots__ = ("old", "new", "_memo")
+
+    def __init__(
+        self,
+        old_components: Optional[Dict[str, Any]],
+        new_components: Optional[Dict[str, Any]],
+    ) -> None:
+        self.old = _SchemaIndex(old_components)
+        self.new = _SchemaIndex(new_components)
+        self._memo: Dict[Tuple[str, str], Tuple[_FieldDiff, ...]] = {}
+
+    def diff(self, old_node: Any, new_node: Any) -> Tuple[_FieldDiff, ...]:
+        """
+        Return field diffs between two schema nodes, relative to those nodes.
+
+        Order per object level: added fields, removed fields, then common
+        fields (sorted) with their type changes and nested diffs.
+        """
+        old_hash = self.old.hash(old_node)
+        new_hash = self.new.hash(new_node)
+        if old_hash == new_hash:
+            return ()
+
+        key = (old_hash, new_hash)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        self._memo[key] = ()  # guards recursive schemas
+        result = tuple(
+            self._diff_nodes(self.old.resolve(old_node), self.new.resolve(new_node))
         )
+        self._memo[key] = result
+        return result
 
-    for field in sorted(removed_fields):
-        field_type = old_fields[field]
-        changes.append(
-            f"Endpoint {path} {method}: field '{field}' removed (type: {field_type})"
+    def _diff_nodes(self, old_node: Any, new_node: Any) -> Iterator[_FieldDiff]:
+        old_type = self.old.type_name(old_node)
+        new_type = self.new.type_name(new_node)
+
+        if old_type == "object" and new_type == "object":
+            yield from self._diff_objects(old_node, new_node)
+        elif old_type == "array" and new_type == "array":
+            old_item = old_node[0] if old_node else None
+            new_item = new_node[0] if new_node else None
+            yield from self._diff_child("[]", old_item, new_item)
+        elif old_type != new_type:
+            yield (FIELD_TYPE_CHANGED, "", old_type, new_type)
+
+    def _diff_objects(
+        self, old_fields: Dict[str, Any], new_fields: Dict[str, Any]
+    ) -> Iterator[_FieldDiff]:
+        old_field_names = set(old_fields.keys())
+        new_field_names = set(new_fields.keys())
+
+        added_fields = new_field_names - old_field_names
+        removed_fields = old_field_names - new_field_names
+        common_fields = old_field_names & new_field_names
+
+        for field in sorted(added_fields):
+            yield (FIELD_ADDED, field, None, self.new.type_name(new_fields[field]))
+
+        for field in sorted(removed_fields):
+            yield (FIELD_REMOVED, field, self.old.type_name(old_fields[field]), None)
+
+        # Detect type changes and nested changes
+        for field in sorted(common_fields):
+            yield from self._diff_child(field, old_fields[field], new_fields[field])
+
+    def _diff_child(
+        self, field: str, old_node: Any, new_node: Any
+    ) -> Iterator[_FieldDiff]:
+        for kind, rel, old_type, new_type in self.diff(old_node, new_node):
+            yield (kind, _join_field(field, rel), old_type, new_type)
+
+
+def format_change(change: Change) -> str:
+    """Render a Change as the human-readable line printed by the CLI."""
+    kind = change.kind
+    path = change.path
+    method = change.method
+    field = change.field
+    # Response fields keep the historical wording; others are qualified.
+    what = "field" if change.location == RESPONSE else f"{change.location} field"
+
+    if kind == ENDPOINT_ADDED:
+        return f"Endpoint added: {path} {list(change.methods)}"
+    if kind == ENDPOINT_REMOVED:
+        return f"Endpoint removed: {path} {list(change.methods)}"
+    if kind == METHOD_ADDED:
+        return f"Endpoint {path}: method {method} added"
+    if kind == METHOD_REMOVED:
+        return f"Endpoint {path}: method {method} removed"
+    if kind == FIELD_ADDED:
+        return f"Endpoint {path} {method}: {what} '{field}' added (type: {change.new_type})"
+    if kind == FIELD_REMOVED:
+        return f"Endpoint {path} {method}: {what} '{field}' removed (type: {change.old_type})"
+    if kind == FIELD_TYPE_CHANGED:
+        return (
+            f"Endpoint {path} {method}: {what} '{field}' type changed "
+            f"from {change.old_type} to {change.new_type}"
         )
+    return f"Endpoint {path}: {kind}"
 
-    # Detect type changes
-    for field in sorted(common_fields):
-        old_type = old_fields[field]
-        new_type = new_fields[field]
 
-        if old_type != new_type:
-            changes.append(
-                f"Endpoint {path} {method}: field '{field}' type changed from {old_type} to {new_type}"
-            )
+def change_to_dict(change: Change) -> Dict[str, Any]:
+    """
+    JSON-friendly form of a Change: set attributes only, plus the rendered
+    description.
+    """
+    data: Dict[str, Any] = {"kind": change.kind, "path": change.path}
+    if change.method is not None:
+        data["method"] = change.method
+    if change.field is not None:
+        data["field"] = change.field
+        data["location"] = change.location
+    if change.old_type is not None:
+        data["old_type"] = change.old_type
+    if change.new_type is not None:
+        data["new_type"] = change.new_type
+    if change.methods:
+        data["methods"] = list(change.methods)
+    data["description"] = format_change(change)
+    return data
 
-    return changes
+
+class ChangeIndex:
+    """
+    Lookup tables over a list of Change records.
+
+    Each index maps a key to positions in the original list, so filtered
+    results keep diff order and no change is copied.
+    """
+
+    __slots__ = (
+        "changes",
+        "_by_path",
+        "_by_method",
+        "_by_field",
+        "_by_kind",
+        "_by_endpoint",
+    )
+
+    def __init__(self, changes: Iterable[Change]) -> None:
+        self.changes: List[Change] = list(changes)
+        self._by_path: Dict[str, List[int]] = {}
+        self._by_method: Dict[str, List[int]] = {}
+        self._by_field: Dict[str, List[int]] = {}
+        self._by_kind: Dict[str, List[int]] = {}
+        self._by_endpoint: Dict[Tuple[str, str], List[int]] = {}
+
+        for i, c in enumerate(self.changes):
+            self._by_path.setdefault(c.path, []).append(i)
+            self._by_kind.setdefault(c.kind, []).append(i)
+            self._by_endpoint.setdefault((c.path, c.method or ""), []).append(i)
+            if c.method is not None:
+                self._by_method.setdefault(c.method, []).append(i)
+            if c.field is not None:
+                self._by_field.setdefault(c.field, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def _select(self, positions: Optional[List[int]]) -> List[Change]:
+        if not positions:
+            return []
+        changes = self.changes
+        return [changes[i] for i in positions]
+
+    def for_path(self, path: str) -> List[Change]:
+        return self._select(self._by_path.get(path))
+
+    def for_method(self, method: str) -> List[Change]:
+        return self._select(self._by_method.get(method))
+
+    def for_field(self, field: str) -> List[Change]:
+        return self._select(self._by_field.get(field))
+
+    def for_kind(self, kind: str) -> List[Change]:
+        return self._select(self._by_kind.get(kind))
+
+    def by_endpoint(self) -> Dict[Tuple[str, str], List[Change]]:
+        """Group changes by (path, method); method is "" for endpoint-level changes."""
+        return {key: self._select(pos) for key, pos in self._by_endpoint.items()}
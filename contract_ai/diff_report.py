@@ -0,0 +1,180 @@
+# diff_report.py
+"""
+Streaming diff output for `compare --format`.
+
+Each writer consumes changes as the diff engine yields them and writes
+them out one by one, so a large diff is never held in memory and a reader
+of the output can start before the diff is complete:
+
+- text: the "- <change>" lines the CLI has always printed
+- ndjson: one JSON object per change (change_to_dict() plus "severity"
+  and the "rule" that decided it)
+- json: one document, {"old", "new", "changes": [...], "summary"}
+- sarif: a SARIF 2.1.0 log with one result per change, for code scanning
+  tools; each compatibility rule is a SARIF rule, breaking changes are
+  errors and the rest notes
+
+Severity comes from a compatibility.RuleSet (DEFAULT_RULESET unless the
+caller passes its own). Every writer returns a DiffSummary with the
+change counts.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, TextIO, Tuple
+
+from compatibility import BREAKING, DEFAULT_RULESET, UNMATCHED, Rule, RuleSet
+from diff_engine import (
+    ENDPOINT_REMOVED,
+    FIELD_REMOVED,
+    METHOD_REMOVED,
+    Change,
+    change_to_dict,
+    format_change,
+)
+
+FORMATS = ("text", "json", "ndjson", "sarif")
+
+SARIF_VERSION = "2.1.0"
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+TOOL_NAME = "contract_ai"
+
+# Changes that only exist in the old spec point there in SARIF
+_OLD_SIDE = (ENDPOINT_REMOVED, METHOD_REMOVED, FIELD_REMOVED)
+
+
+class DiffSummary(NamedTuple):
+    changes: int
+    breaking: int
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "changes": self.changes,
+            "breaking": self.breaking,
+            "non_breaking": self.changes - self.breaking,
+        }
+
+
+class _Classified:
+    """Iterates (change, rule) pairs and counts them on the way."""
+
+    def __init__(self, changes: Iterable[Change], rules: RuleSet) -> None:
+        self._changes = changes
+        self.rules = rules
+        self.total = 0
+        self.breaking = 0
+
+    def __iter__(self) -> Iterator[Tuple[Change, Rule]]:
+        match = self.rules.match
+        for change in self._changes:
+            rule = match(change)
+            self.total += 1
+            if rule.severity == BREAKING:
+                self.breaking += 1
+            yield change, rule
+
+    def summary(self) -> DiffSummary:
+        return DiffSummary(self.total, self.breaking)
+
+
+def change_record(change: Change, rule: Rule) -> Dict[str, Any]:
+    """change_to_dict() plus the severity and name of the deciding rule."""
+    data = change_to_dict(change)
+    data["severity"] = rule.severity
+    data["rule"] = rule.name
+    return data
+
+
+def _write_text(items: _Classified, out: TextIO, old: str, new: str) -> None:
+    for i, (change, _) in enumerate(items):
+        if i == 0:
+            out.write("Differences detected:\n")
+        out.write(f"- {format_change(change)}\n")
+    if not items.total:
+        out.write("No differences detected between the two specs.\n")
+
+
+def _write_ndjson(items: _Classified, out: TextIO, old: str, new: str) -> None:
+    for change, rule in items:
+        out.write(json.dumps(change_record(change, rule), separators=(",", ":")) + "\n")
+
+
+def _write_json(items: _Classified, out: TextIO, old: str, new: str) -> None:
+    out.write(f'{{\n  "old": {json.dumps(old)},\n  "new": {json.dumps(new)},\n  "changes": [')
+    for i, (change, rule) in enumerate(items):
+        out.write(("," if i else "") + "\n    " + json.dumps(change_record(change, rule)))
+    out.write("\n  ],\n" if items.total else "],\n")
+    out.write(f'  "summary": {json.dumps(items.summary().to_dict())}\n}}\n')
+
+
+def _sarif_result(change: Change, rule: Rule, old: str, new: str) -> Dict[str, Any]:
+    spec = old if change.kind in _OLD_SIDE else new
+    name = " ".join(p for p in (change.method, change.path) if p)
+    if change.field:
+        name += f" {change.location}.{change.field}"
+    return {
+        "ruleId": rule.name,
+        "level": "error" if rule.severity == BREAKING else "note",
+        "message": {"text": format_change(change)},
+        "locations": [
+            {
+                "physicalLocation": {"artifactLocation": {"uri": Path(spec).as_posix()}},
+                "logicalLocations": [{"fullyQualifiedName": name, "kind": "member"}],
+            }
+        ],
+        "properties": change_record(change, rule),
+    }
+
+
+def _write_sarif(items: _Classified, out: TextIO, old: str, new: str) -> None:
+    # Rule ids must be unique; an override sharing a default's name shadows it
+    rules: Dict[str, Rule] = {}
+    for rule in (*items.rules.rules, UNMATCHED):
+        rules.setdefault(rule.name, rule)
+    driver = {
+        "name": TOOL_NAME,
+        "rules": [
+            {"id": rule.name, "shortDescription": {"text": rule.description or rule.name}}
+            for rule in rules.values()
+        ],
+    }
+    out.write(
+        f'{{\n  "$schema": "{SARIF_SCHEMA}",\n  "version": "{SARIF_VERSION}",\n'
+        f'  "runs": [\n    {{\n      "tool": {{"driver": {json.dumps(driver)}}},\n'
+        '      "results": ['
+    )
+    for i, (change, rule) in enumerate(items):
+        result = _sarif_result(change, rule, old, new)
+        out.write(("," if i else "") + "\n        " + json.dumps(result))
+    out.write("\n      ],\n" if items.total else "],\n")
+    out.write(
+        f'      "properties": {json.dumps(items.summary().to_dict())}\n    }}\n  ]\n}}\n'
+    )
+
+
+_WRITERS: Dict[str, Callable[[_Classified, TextIO, str, str], None]] = {
+    "text": _write_text,
+    "ndjson": _write_ndjson,
+    "json": _write_json,
+    "sarif": _write_sarif,
+}
+
+
+def write_changes(
+    changes: Iterable[Change],
+    fmt: str,
+    out: TextIO,
+    old: str,
+    new: str,
+    rules: RuleSet = DEFAULT_RULESET,
+) -> DiffSummary:
+    """
+    Write changes to out in fmt (one of FORMATS) as they arrive, classified
+    by rules. old and new name the compared specs in the json and sarif
+    output.
+    """
+    items = _Classified(changes, rules)
+    _WRITERS[fmt](items, out, old, new)
+    return items.summary()
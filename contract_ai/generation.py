@@ -0,0 +1,261 @@
+# generation.py
+"""
+Per-endpoint, parallel test generation.
+
+Instead of sending the whole diff to the model as one prompt, changes are
+grouped by endpoint and HTTP method. Each group becomes its own (smaller)
+prompt, and groups are generated concurrently by a bounded worker pool
+spread over one or more Ollama hosts (or a load-balancing HostPool).
+
+- group_changes_by_endpoint(): split diff_changes() output into groups
+- split_changes(): cut a diff into batches whose prompts fit a token budget
+- build_generation_jobs(): one prompt per group (more if a group is over
+  budget), with only the group's operations and referenced components as
+  spec context
+- run_generation_jobs(): thread pool over the jobs, cache-aware; fresh
+  generations can be validated and repaired (validation.repair_module).
+  run_generation_job() runs a single job, for callers with their own pool
+- merge_test_modules(): combine generated modules into one file
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ai_client_ollama import (
+    OllamaClient,
+    OllamaError,
+    PROMPT_VERSION,
+    estimate_prompt_size,
+)
+import profiling
+from host_pool import HostPool
+from diff_engine import Change, ChangeIndex, format_change
+from generation_cache import GenerationCache, cache_key
+from spec_context import DEFAULT_CONTEXT_TOKENS, build_spec_context
+from token_budget import DEFAULT_MAX_PROMPT_TOKENS, estimate_tokens
+from validation import RepairResult, repair_module
+
+# (path, method); method is "" for endpoint-level changes
+EndpointKey = Tuple[str, str]
+
+# Anything with .model and .generate_test_code()
+Client = Union[OllamaClient, HostPool]
+
+_TEST_DEF_RE = re.compile(r"^(?:async )?def (?P<name>test_\w+)\(")
+
+
+class GenerationJob(NamedTuple):
+    """One prompt to send to the model."""
+
+    key: EndpointKey
+    diff_summary: str
+    spec_snippet: str
+
+
+class GenerationResult(NamedTuple):
+    """
+    Outcome of one job: test code on success, error message otherwise.
+    validation is set when a fresh generation went through the repair loop.
+    """
+
+    key: EndpointKey
+    code: Optional[str]
+    error: Optional[str]
+    cached: bool
+    validation: Optional[RepairResult] = None
+
+
+def group_changes_by_endpoint(
+    changes: Sequence[Change],
+) -> Dict[EndpointKey, List[Change]]:
+    """Group changes by (path, method), preserving diff order."""
+    return ChangeIndex(changes).by_endpoint()
+
+
+def split_changes(
+    changes: Sequence[Change],
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+) -> List[List[Change]]:
+    """
+    Split changes, in order, into batches whose prompts stay within
+    max_prompt_tokens: fixed prompt text, a spec context of at most
+    context_tokens and the batch's diff lines. A single change that is over
+    budget on its own still gets a batch.
+    """
+    diff_budget = max_prompt_tokens - estimate_prompt_size("", "").total - context_tokens
+    batches: List[List[Change]] = []
+    batch: List[Change] = []
+    used = 0
+    for change in changes:
+        cost = estimate_tokens(format_change(change)) + 1
+        if batch and used + cost > diff_budget:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(change)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_generation_jobs(
+    changes: Sequence[Change],
+    old_spec: Dict[str, Any],
+    new_spec: Dict[str, Any],
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+) -> List[GenerationJob]:
+    """
+    Build one generation job per (path, method) group, split further where a
+    group's prompt would exceed max_prompt_tokens (the parts share the key).
+    """
+    return [
+        GenerationJob(
+            key=key,
+            diff_summary="\n".join(format_change(c) for c in batch),
+            spec_snippet=build_spec_context(batch, old_spec, new_spec, max_tokens),
+        )
+        for key, group in group_changes_by_endpoint(changes).items()
+        for batch in split_changes(group, max_prompt_tokens, max_tokens)
+    ]
+
+
+def run_generation_job(
+    job: GenerationJob,
+    client: Client,
+    cache: Optional[GenerationCache] = None,
+    refresh: bool = False,
+    repair_rounds: Optional[int] = None,
+) -> GenerationResult:
+    """Run one job on client: cache lookup, generation, optional repair, cache store."""
+    ck = cache_key(job.diff_summary, job.spec_snippet, PROMPT_VERSION, client.model)
+    if cache is not None and not refresh:
+        code = cache.get(ck)
+        if code is not None:
+            return GenerationResult(job.key, code, None, True)
+
+    try:
+        code = client.generate_test_code(job.diff_summary, job.spec_snippet)
+    except OllamaError as exc:
+        return GenerationResult(job.key, None, str(exc), False)
+
+    validation = None
+    if repair_rounds is not None:
+        with profiling.span("validate"):
+            validation = repair_module(code, client, max_rounds=repair_rounds)
+        code = validation.code
+
+    if cache is not None:
+        cache.put(ck, code)
+    return GenerationResult(job.key, code, None, False, validation)
+
+
+def run_generation_jobs(
+    jobs: Sequence[GenerationJob],
+    clients: Sequence[Client],
+    workers: int = 4,
+    cache: Optional[GenerationCache] = None,
+    refresh: bool = False,
+    repair_rounds: Optional[int] = None,
+) -> List[GenerationResult]:
+    """
+    Run jobs on a bounded thread pool, assigning clients (hosts) round-robin.
+    Pass a single HostPool instead to route by load and fail over between
+    hosts. With repair_rounds set, each fresh generation is validated and its
+    failing functions re-prompted up to that many times before caching.
+
+    Results are returned in job order regardless of completion order.
+    """
+    results: List[Optional[GenerationResult]] = [None] * len(jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(
+                run_generation_job,
+                job,
+                clients[i % len(clients)],
+                cache,
+                refresh,
+                repair_rounds,
+            ): i
+            for i, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    return [r for r in results if r is not None]
+
+
+def endpoint_module_name(key: EndpointKey) -> str:
+    """File name for a per-endpoint module, e.g. test_contract_widget_get.py."""
+    path, method = key
+    parts = [p for p in re.split(r"[^0-9A-Za-z]+", path) if p]
+    if method:
+        parts.append(method)
+    slug = "_".join(parts).lower() or "root"
+    return f"test_contract_{slug}.py"
+
+
+def _import_spans(module: str) -> List[Tuple[int, int]]:
+    """
+    (first, last) 0-based line spans of the top-level imports of module, so
+    parenthesized multi-line imports are taken whole. A module that does
+    not parse only gets its single-line imports hoisted.
+    """
+    try:
+        tree = ast.parse(module)
+    except SyntaxError:
+        return [
+            (i, i)
+            for i, line in enumerate(module.splitlines())
+            if line.startswith(("import ", "from ")) and not line.rstrip().endswith(("(", "\\"))
+        ]
+    return [
+        (node.lineno - 1, (node.end_lineno or node.lineno) - 1)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    ]
+
+
+def merge_test_modules(modules: Sequence[str]) -> str:
+    """
+    Merge generated test modules into one: top-level imports are hoisted and
+    de-duplicated, bodies are concatenated in order. Test functions whose
+    names collide with an earlier module get a numeric suffix so pytest does
+    not silently drop the shadowed one.
+    """
+    imports: List[str] = []
+    bodies: List[str] = []
+    seen_tests: Dict[str, int] = {}
+    for module in modules:
+        lines = module.splitlines()
+        hoisted = set()
+        for first, last in _import_spans(module):
+            statement = "\n".join(lines[first:last + 1])
+            if statement not in imports:
+                imports.append(statement)
+            hoisted.update(range(first, last + 1))
+
+        body_lines: List[str] = []
+        for i, line in enumerate(lines):
+            if i in hoisted:
+                continue
+            m = _TEST_DEF_RE.match(line)
+            if m:
+                name = m.group("name")
+                count = seen_tests.get(name, 0) + 1
+                seen_tests[name] = count
+                if count > 1:
+                    line = line.replace(name, f"{name}_{count}", 1)
+            body_lines.append(line)
+        body = "\n".join(body_lines).strip()
+        if body:
+            bodies.append(body)
+
+    header = "\n".join(imports)
+    return "\n\n\n".join(([header] if header else []) + bodies) + "\n"
@@ -0,0 +1,145 @@
+# generation_cache.py
+"""
+On-disk, content-addressed cache for LLM-generated test code.
+
+Entries are keyed by a SHA-256 hash of everything that influences the model
+output:
+- Diff summary and spec snippet sent in the prompt
+- Prompt version
+- Model name and generation options
+
+Reruns on unchanged specs therefore skip the Ollama call entirely.
+
+Eviction:
+- Entries older than max_age_seconds are treated as misses and removed
+- When the cache grows beyond max_bytes, least recently used entries go first
+
+An entry's mtime is its creation time and is never touched after put(), so
+age is measured from when it was generated. Hits record the access in atime,
+which is what the LRU order uses.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import CACHE_REQUESTS
+
+DEFAULT_CACHE_DIR = ".contract_ai_cache"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+_ENTRY_SUFFIX = ".py"
+
+
+def cache_key(
+    diff_summary: str,
+    spec_snippet: str,
+    prompt_version: str,
+    model: str,
+    options: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Return a stable hex digest identifying one generation request."""
+    payload = json.dumps(
+        {
+            "diff_summary": diff_summary,
+            "spec_snippet": spec_snippet,
+            "prompt_version": prompt_version,
+            "model": model,
+            "options": options or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Directory of generated test modules, one file per cache key."""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}{_ENTRY_SUFFIX}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached test code for key, or None on a miss."""
+        content = self._read(key)
+        CACHE_REQUESTS.inc(result="miss" if content is None else "hit")
+        return content
+
+    def _read(self, key: str) -> Optional[str]:
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if time.time() - stat.st_mtime > self.max_age_seconds:
+            path.unlink(missing_ok=True)
+            return None
+
+        try:
+            content = path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+        # Record the hit in atime for LRU order; keep mtime, which dates the entry.
+        try:
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+        return content
+
+    def put(self, key: str, content: str) -> None:
+        """Store content under key atomically, then enforce eviction limits."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+        self.prune()
+
+    def prune(self) -> int:
+        """Remove expired entries and trim to max_bytes. Returns entries removed."""
+        if not self.directory.is_dir():
+            return 0
+
+        now = time.time()
+        entries: List[Tuple[float, int, Path]] = []
+        removed = 0
+
+        for path in self.directory.glob(f"*{_ENTRY_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        # Least recently accessed first.
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        return removed
@@ -0,0 +1,95 @@
+# history.py
+"""
+Batch compare across a spec version history.
+
+Given an ordered list of spec files (v1, v2, ..., vN), compute the diff of
+every adjacent pair in one run instead of N-1 separate `cli.py compare`
+invocations.
+
+- The pairs are split into contiguous chunks, one chunk per task, so each
+  worker loads every file in its chunk exactly once and reuses the parsed
+  spec for both neighbouring diffs (only chunk boundaries are loaded twice).
+- Chunks run on a process pool across cores; results come back in order.
+"""
+
+from __future__ import annotations
+
+import glob
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+from diff_engine import change_to_dict, diff_changes, load_spec
+
+
+def _natural_key(path: str) -> List[Any]:
+    """Sort key that orders spec_v2 before spec_v10."""
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", path)]
+
+
+def resolve_spec_files(source: str) -> List[str]:
+    """
+    Expand a directory (all *.json inside) or a glob pattern into spec files,
+    naturally sorted so numbered versions come out in order.
+    """
+    if Path(source).is_dir():
+        files = [str(p) for p in Path(source).glob("*.json")]
+    else:
+        files = glob.glob(source)
+    return sorted(files, key=_natural_key)
+
+
+def _diff_chunk(files: Sequence[str]) -> List[Dict[str, Any]]:
+    """Diff each adjacent pair in files, loading every file once."""
+    entries: List[Dict[str, Any]] = []
+    prev_file = files[0]
+    prev_spec = load_spec(prev_file)
+    for next_file in files[1:]:
+        next_spec = load_spec(next_file)
+        changes = diff_changes(prev_spec, next_spec)
+        entries.append(
+            {
+                "from": prev_file,
+                "to": next_file,
+                "from_version": prev_spec.get("version"),
+                "to_version": next_spec.get("version"),
+                "change_count": len(changes),
+                "changes": [change_to_dict(c) for c in changes],
+            }
+        )
+        prev_file, prev_spec = next_file, next_spec
+    return entries
+
+
+def _chunks(files: Sequence[str], chunk_pairs: int) -> List[Sequence[str]]:
+    """Split files into overlapping runs of chunk_pairs + 1 files."""
+    return [
+        files[i:i + chunk_pairs + 1]
+        for i in range(0, len(files) - 1, chunk_pairs)
+    ]
+
+
+def iter_history(files: Sequence[str], workers: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one change-log entry per adjacent pair of files, in order.
+
+    workers <= 0 uses one process per CPU; with a single worker (or very few
+    files) everything runs in-process to avoid pool start-up cost.
+    """
+    if len(files) < 2:
+        return
+
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    pairs = len(files) - 1
+    if workers == 1 or pairs < 4:
+        yield from _diff_chunk(files)
+        return
+
+    # A few chunks per worker balances load while keeping boundary reloads rare.
+    chunk_pairs = max(1, math.ceil(pairs / (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for entries in pool.map(_diff_chunk, _chunks(files, chunk_pairs)):
+            yield from entries
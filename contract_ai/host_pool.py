@@ -0,0 +1,284 @@
+# host_pool.py
+"""
+Load balancing over several Ollama hosts.
+
+HostPool wraps one OllamaClient per node and has the same generation
+interface (model, chat(), generate_test_code(), stream_test_code()), so it
+can be passed wherever a client is expected.
+
+- Routing: each request goes to the healthy host with the lowest
+  (outstanding requests + 1) x recent latency, i.e. least-outstanding
+  requests weighted by how fast the host has been answering.
+- Failover: when a host fails (unreachable, timed out, 5xx after its own
+  retries) it is ejected and the request moves on to the next host, so a
+  node dying mid-batch only costs the requests that were running on it.
+- Health probes: a background thread polls GET /api/tags on every host and
+  brings ejected hosts back once they answer again.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, TypeVar
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from ai_client_ollama import (
+    CONNECT_TIMEOUT_SECONDS,
+    OllamaClient,
+    OllamaUnavailableError,
+    build_test_generation_messages,
+)
+
+DEFAULT_PROBE_INTERVAL_SECONDS = 15.0
+PROBE_TIMEOUT_SECONDS = 5.0
+# Weight of the newest sample in the per-host latency moving average
+LATENCY_ALPHA = 0.3
+
+T = TypeVar("T")
+
+
+def probe_url(chat_url: str) -> str:
+    """The /api/tags URL on the same host as an /api/chat URL."""
+    parts = urlsplit(chat_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/api/tags", "", ""))
+
+
+class _Host:
+    """Routing state of one node; guarded by the pool's lock."""
+
+    __slots__ = ("client", "outstanding", "latency", "healthy", "ejected_at", "failures")
+
+    def __init__(self, client: OllamaClient) -> None:
+        self.client = client
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # moving average, seconds
+        self.healthy = True
+        self.ejected_at = 0.0
+        self.failures = 0
+
+
+class HostPool:
+    """
+    Routes Ollama requests over several hosts with health checks and failover.
+
+    All clients should serve the same model. probe_interval_seconds <= 0
+    disables the background prober (ejected hosts then stay out until a
+    request finds every other host down). Call close() when done.
+    """
+
+    def __init__(
+        self,
+        clients: Sequence[OllamaClient],
+        probe_interval_seconds: float = DEFAULT_PROBE_INTERVAL_SECONDS,
+    ) -> None:
+        if not clients:
+            raise ValueError("HostPool needs at least one client")
+        self._hosts = [_Host(c) for c in clients]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        if probe_interval_seconds > 0:
+            self._prober = threading.Thread(
+                target=self._probe_loop,
+                args=(probe_interval_seconds,),
+                name="ollama-health-probe",
+                daemon=True,
+            )
+            self._prober.start()
+
+    @property
+    def model(self) -> str:
+        return self._hosts[0].client.model
+
+    @property
+    def urls(self) -> List[str]:
+        return [h.client.url for h in self._hosts]
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._prober is not None:
+            self._prober.join()
+        for host in self._hosts:
+            host.client.close()
+
+    def __enter__(self) -> "HostPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Snapshot of per-host routing state, for logging."""
+        with self._lock:
+            return [
+                {
+                    "url": h.client.url,
+                    "healthy": h.healthy,
+                    "outstanding": h.outstanding,
+                    "latency_seconds": h.latency,
+                    "failures": h.failures,
+                }
+                for h in self._hosts
+            ]
+
+    # -- routing --------------------------------------------------------------
+
+    def _acquire(self, tried: List[_Host]) -> Optional[_Host]:
+        """Pick the best untried host and count the request against it."""
+        with self._lock:
+            candidates = [h for h in self._hosts if h.healthy and h not in tried]
+            if candidates:
+                known = [h.latency for h in self._hosts if h.latency is not None]
+                default_latency = sum(known) / len(known) if known else 1.0
+                host = min(
+                    candidates,
+                    key=lambda h: (h.outstanding + 1)
+                    * (h.latency if h.latency is not None else default_latency),
+                )
+            else:
+                # Everything is ejected: the probe may just be lagging, so try
+                # the host that has been out longest rather than fail outright.
+                ejected = [h for h in self._hosts if h not in tried]
+                if not ejected:
+                    return None
+                host = min(ejected, key=lambda h: h.ejected_at)
+            host.outstanding += 1
+            return host
+
+    def _release(self, host: _Host, elapsed: Optional[float]) -> None:
+        """Finish a request; elapsed is None when the host failed."""
+        with self._lock:
+            host.outstanding -= 1
+            if elapsed is None:
+                host.failures += 1
+                if host.healthy:
+                    host.healthy = False
+                    host.ejected_at = time.monotonic()
+                return
+            host.healthy = True
+            if host.latency is None:
+                host.latency = elapsed
+            else:
+                host.latency += LATENCY_ALPHA * (elapsed - host.latency)
+
+    def _call(self, fn: Callable[[OllamaClient], T]) -> T:
+        """Run fn on the best host, failing over to the others on host errors."""
+        tried: List[_Host] = []
+        errors: List[str] = []
+        while True:
+            host = self._acquire(tried)
+            if host is None:
+                raise OllamaUnavailableError(
+                    "All Ollama hosts failed: " + "; ".join(errors)
+                )
+            tried.append(host)
+            start = time.monotonic()
+            try:
+                result = fn(host.client)
+            except OllamaUnavailableError as exc:
+                self._release(host, None)
+                errors.append(str(exc))
+                continue
+            except BaseException:
+                # Bad request or response: not the host's fault, don't fail over.
+                self._release(host, time.monotonic() - start)
+                raise
+            self._release(host, time.monotonic() - start)
+            return result
+
+    # -- client interface -----------------------------------------------------
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        timeout_seconds: float = 60,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """OllamaClient.chat() on the best available host."""
+        return self._call(
+            lambda c: c.chat(
+                messages, model=model, timeout_seconds=timeout_seconds, options=options
+            )
+        )
+
+    def generate_test_code(
+        self,
+        diff_summary: str,
+        spec_snippet: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """OllamaClient.generate_test_code() on the best available host."""
+        messages = build_test_generation_messages(diff_summary, spec_snippet)
+        return self.chat(messages, model=model, options=options)
+
+    def stream_test_code(
+        self,
+        diff_summary: str,
+        spec_snippet: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        idle_timeout_seconds: float = 30,
+    ) -> Iterator[str]:
+        """
+        OllamaClient.stream_test_code() on the best available host. Fails over
+        only until the first chunk arrives; after that a host failure is
+        raised, since the caller has already consumed partial output.
+        """
+        tried: List[_Host] = []
+        errors: List[str] = []
+        while True:
+            host = self._acquire(tried)
+            if host is None:
+                raise OllamaUnavailableError(
+                    "All Ollama hosts failed: " + "; ".join(errors)
+                )
+            tried.append(host)
+            start = time.monotonic()
+            started = failed = False
+            try:
+                for chunk in host.client.stream_test_code(
+                    diff_summary,
+                    spec_snippet,
+                    model=model,
+                    options=options,
+                    idle_timeout_seconds=idle_timeout_seconds,
+                ):
+                    started = True
+                    yield chunk
+                return
+            except OllamaUnavailableError as exc:
+                failed = True
+                if started:
+                    raise
+                errors.append(str(exc))
+            finally:
+                self._release(host, None if failed else time.monotonic() - start)
+
+    # -- health probes --------------------------------------------------------
+
+    def probe(self) -> None:
+        """Probe every host once, ejecting dead hosts and restoring live ones."""
+        for host in self._hosts:
+            try:
+                resp = host.client.session.get(
+                    probe_url(host.client.url),
+                    timeout=(CONNECT_TIMEOUT_SECONDS, PROBE_TIMEOUT_SECONDS),
+                )
+                alive = resp.status_code == 200
+            except requests.RequestException:
+                alive = False
+            with self._lock:
+                if alive:
+                    host.healthy = True
+                elif host.healthy:
+                    host.healthy = False
+                    host.ejected_at = time.monotonic()
+
+    def _probe_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.probe()
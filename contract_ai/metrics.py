@@ -0,0 +1,398 @@
+# metrics.py
+"""
+Prometheus/OpenMetrics counters and histograms for long-running use.
+
+Standard library only: a small thread-safe registry with counters, gauges
+and histograms, rendered in the Prometheus text format (0.0.4) or in
+OpenMetrics. Two ways to export:
+
+- start_http_server(port): serve GET /metrics from a daemon thread
+- write_textfile(path): atomically write the metrics for node_exporter's
+  textfile collector (start_textfile_exporter() repeats it periodically)
+
+The metrics below are updated by the diff engine (diffs and changes per
+kind), the Ollama client (latency, tokens, tokens per second, requests in
+flight), the generation path (cache hits, validation outcomes) and the
+serve command (requests, spec cache hits, coalesced generations).
+Updating a metric is a lock and an addition, cheap enough to leave on.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from token_budget import Usage
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640, 1280, 2560, 5120)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, formatted labels, value) triples."""
+        raise NotImplementedError
+
+    def render(self, openmetrics: bool) -> List[str]:
+        # Prometheus 0.0.4 names the counter family after its _total sample.
+        family = self.name
+        if self.kind == "counter" and not openmetrics:
+            family += "_total"
+        lines = [f"# HELP {family} {self.help}", f"# TYPE {family} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, exported as <name>_total."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        # Unlabelled metrics are exported as 0 before their first update.
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("_total", _format_labels(self.labelnames, k), v) for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, such as requests in flight."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", _format_labels(self.labelnames, k), v) for k, v in items]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out: List[Tuple[str, str, float]] = []
+        for key, state in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{float(bound)!r}"'
+                out.append(("_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            labels = _format_labels(self.labelnames, key)
+            out.append(("_sum", labels, state[-2]))
+            out.append(("_count", labels, state[-1]))
+        return out
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self, openmetrics: bool = False) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DIFFS = REGISTRY.register(Counter("contract_ai_diffs", "Spec pairs diffed."))
+CHANGES = REGISTRY.register(
+    Counter("contract_ai_changes", "Changes found by the diff engine, by kind.", ["kind"])
+)
+LLM_REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("contract_ai_llm_requests_in_flight", "Ollama requests in progress.")
+)
+LLM_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "contract_ai_llm_request_seconds",
+        "Ollama request latency, by model and outcome (ok, error).",
+        LATENCY_BUCKETS,
+        ["model", "outcome"],
+    )
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "contract_ai_llm_tokens",
+        "Tokens processed by Ollama, by model and type (prompt, completion).",
+        ["model", "type"],
+    )
+)
+LLM_TOKENS_PER_SECOND = REGISTRY.register(
+    Histogram(
+        "contract_ai_llm_tokens_per_second",
+        "Ollama throughput per request, by model and phase (prefill, generation).",
+        TOKENS_PER_SECOND_BUCKETS,
+        ["model", "phase"],
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "contract_ai_cache_requests",
+        "Generation cache lookups, by result (hit, miss).",
+        ["result"],
+    )
+)
+VALIDATED_FUNCTIONS = REGISTRY.register(
+    Counter(
+        "contract_ai_validated_functions",
+        "Generated test functions validated, by outcome (passed, repaired, disabled).",
+        ["outcome"],
+    )
+)
+VALIDATION_FAILURES = REGISTRY.register(
+    Counter(
+        "contract_ai_validation_failures",
+        "Generated test functions that failed validation before any repair.",
+    )
+)
+
+SERVICE_REQUESTS = REGISTRY.register(
+    Counter(
+        "contract_ai_service_requests",
+        "Requests handled by the serve command, by endpoint and status code.",
+        ["endpoint", "status"],
+    )
+)
+SPEC_CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "contract_ai_spec_cache_requests",
+        "Parsed-spec cache lookups in the serve command, by result (hit, miss).",
+        ["result"],
+    )
+)
+COALESCED_GENERATIONS = REGISTRY.register(
+    Counter(
+        "contract_ai_coalesced_generations",
+        "Generation requests answered by an identical one already in flight.",
+    )
+)
+
+
+# -- export -------------------------------------------------------------------
+
+
+def _wants_openmetrics(accept: str) -> bool:
+    return "application/openmetrics-text" in accept
+
+
+def start_http_server(
+    port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY
+) -> ThreadingHTTPServer:
+    """
+    Serve GET /metrics on a daemon thread; OpenMetrics when the scraper
+    asks for it in Accept. Call shutdown() on the returned server to stop.
+    """
+    # Imported here: http.server is slow to import and most runs never serve.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            openmetrics = _wants_openmetrics(self.headers.get("Accept", ""))
+            body = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header(
+                "Content-Type",
+                OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE,
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY) -> None:
+    """Write the metrics to path atomically (for node_exporter's textfile collector)."""
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(registry.render())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class TextfileExporter:
+    """Rewrites a metrics textfile every interval seconds until stop()."""
+
+    def __init__(self, path: str, interval_seconds: float = 15.0, registry: Registry = REGISTRY) -> None:
+        self.path = path
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval_seconds,), name="metrics-textfile", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            write_textfile(self.path, self.registry)
+
+    def stop(self) -> None:
+        """Stop the thread and write the final values."""
+        self._stop.set()
+        self._thread.join()
+        write_textfile(self.path, self.registry)
+
+
+def start_textfile_exporter(
+    path: str, interval_seconds: float = 15.0, registry: Registry = REGISTRY
+) -> TextfileExporter:
+    return TextfileExporter(path, interval_seconds, registry)
+
+
+def observe_llm_request(
+    model: str,
+    seconds: float,
+    ok: bool,
+    usage: Optional[Usage] = None,
+) -> None:
+    """
+    Record one finished Ollama request; usage holds the token counts and
+    durations Ollama reported for it.
+    """
+    LLM_REQUEST_SECONDS.observe(seconds, model=model, outcome="ok" if ok else "error")
+    if usage is None:
+        return
+    if usage.prompt_tokens:
+        LLM_TOKENS.inc(usage.prompt_tokens, model=model, type="prompt")
+        if usage.prompt_eval_seconds:
+            LLM_TOKENS_PER_SECOND.observe(
+                usage.prompt_tokens / usage.prompt_eval_seconds, model=model, phase="prefill"
+            )
+    if usage.completion_tokens:
+        LLM_TOKENS.inc(usage.completion_tokens, model=model, type="completion")
+        if usage.eval_seconds:
+            LLM_TOKENS_PER_SECOND.observe(
+                usage.completion_tokens / usage.eval_seconds, model=model, phase="generation"
+            )
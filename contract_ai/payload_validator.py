@@ -0,0 +1,502 @@
+# payload_validator.py
+"""
+Spec-compiled validation of real request/response payloads.
+
+The generated tests check a few hand-written dicts. To check recorded
+traffic against a spec, SpecValidator compiles every operation's schemas
+once into checking functions:
+
+- objects become a closure over a precomputed field set (for missing and,
+  in strict mode, unexpected fields) and flat lists of (field, type tuple)
+  and (field, nested checker) pairs
+- primitives become type tuples compared with `type(value) in types`, so
+  True is not accepted as a number
+- arrays check their items with the item checker; $ref components are
+  compiled once and shared by every operation that uses them
+
+validate_ndjson() runs a validator over an NDJSON file of recorded
+traffic, one exchange per line:
+
+    {"path": "/widget", "method": "GET", "status": 200, "response": {...}}
+
+"request" (a request body) is optional, and so is "status". With
+processes > 1 the file is split into byte ranges on line boundaries and
+each range is checked in its own process; the per-range reports are merged.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+_REF_PREFIX = "#/components/schemas/"
+
+# Violation kinds
+MISSING = "missing"
+UNEXPECTED = "unexpected"
+TYPE_MISMATCH = "type"
+STATUS_MISMATCH = "status"
+UNKNOWN_OPERATION = "unknown_operation"
+INVALID_RECORD = "invalid_record"
+
+# Schema type name -> accepted Python types (exact type, not isinstance)
+TYPE_TUPLES: Dict[str, Tuple[type, ...]] = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+}
+
+DEFAULT_MAX_EXAMPLES = 5
+# Byte ranges per process: enough to balance uneven lines, few enough to
+# keep per-task overhead negligible
+_CHUNKS_PER_PROCESS = 4
+
+_decode = json.JSONDecoder().decode
+_MISSING = object()
+
+# (field, kind, expected, actual)
+Problem = Tuple[str, str, Optional[str], Optional[str]]
+Checker = Callable[[Any, str, List[Problem]], None]
+OperationKey = Tuple[str, str]
+
+
+class Violation(NamedTuple):
+    """One contract violation found in one recorded exchange."""
+
+    path: str
+    method: str
+    location: str  # "response" or "request"
+    field: str  # dotted, with "[]" for array items, as in diff_engine
+    kind: str
+    expected: Optional[str]
+    actual: Optional[str]
+
+
+def _json_type(value: Any) -> str:
+    """Schema-style type name of a decoded JSON value."""
+    if value is None:
+        return "null"
+    if type(value) is bool:
+        return "boolean"
+    if type(value) in (int, float):
+        return "number"
+    if type(value) is str:
+        return "string"
+    if type(value) is list:
+        return "array"
+    return "object"
+
+
+def _child(prefix: str, name: str) -> str:
+    return f"{prefix}.{name}" if prefix else name
+
+
+def _accept(value: Any, prefix: str, problems: List[Problem]) -> None:
+    """Checker for unknown type names: anything goes."""
+
+
+class _Compiler:
+    """Compiles schema nodes of one spec into checkers, sharing $ref components."""
+
+    def __init__(self, spec: Dict[str, Any], strict: bool) -> None:
+        self.schemas: Dict[str, Any] = (spec.get("components") or {}).get("schemas") or {}
+        self.strict = strict
+        self._refs: Dict[str, Checker] = {}
+
+    def compile(self, node: Any) -> Checker:
+        if isinstance(node, str):
+            return self._primitive(node)
+        if isinstance(node, list):
+            return self._array(node[0] if node else None)
+        if isinstance(node, dict):
+            ref = node.get("$ref") if len(node) == 1 else None
+            if isinstance(ref, str) and ref.startswith(_REF_PREFIX):
+                return self._ref(ref[len(_REF_PREFIX):])
+            return self._object(node)
+        return _accept
+
+    def _ref(self, name: str) -> Checker:
+        checker = self._refs.get(name)
+        if checker is not None:
+            return checker
+        if name not in self.schemas:
+            return _accept
+
+        # Register an indirection before compiling so recursive schemas
+        # terminate; it is bound to the real checker right after.
+        target: List[Checker] = []
+
+        def check_ref(value: Any, prefix: str, problems: List[Problem]) -> None:
+            target[0](value, prefix, problems)
+
+        self._refs[name] = check_ref
+        compiled = self.compile(self.schemas[name])
+        target.append(compiled)
+        self._refs[name] = compiled
+        return compiled
+
+    @staticmethod
+    def _primitive(type_name: str) -> Checker:
+        types = TYPE_TUPLES.get(type_name)
+        if types is None:
+            return _accept
+
+        def check_primitive(value: Any, prefix: str, problems: List[Problem]) -> None:
+            if type(value) not in types:
+                problems.append((prefix, TYPE_MISMATCH, type_name, _json_type(value)))
+
+        return check_primitive
+
+    def _array(self, item: Any) -> Checker:
+        item_check = self.compile(item) if item is not None else _accept
+
+        def check_array(value: Any, prefix: str, problems: List[Problem]) -> None:
+            if type(value) is not list:
+                problems.append((prefix, TYPE_MISMATCH, "array", _json_type(value)))
+                return
+            if item_check is _accept:
+                return
+            item_prefix = prefix + "[]"
+            # Report each distinct item problem once per array, not per item.
+            mark = len(problems)
+            distinct: Dict[Problem, None] = {}
+            for element in value:
+                item_check(element, item_prefix, problems)
+                if len(problems) > mark:
+                    distinct.update(dict.fromkeys(problems[mark:]))
+                    del problems[mark:]
+            problems.extend(distinct)
+
+        return check_array
+
+    def _object(self, fields: Dict[str, Any]) -> Checker:
+        field_set = frozenset(fields)
+        primitives: List[Tuple[str, Tuple[type, ...], str]] = []
+        nested: List[Tuple[str, Checker]] = []
+        for name, node in fields.items():
+            if isinstance(node, str):
+                types = TYPE_TUPLES.get(node)
+                if types is not None:
+                    primitives.append((name, types, node))
+            else:
+                nested.append((name, self.compile(node)))
+        primitive_fields = tuple(primitives)
+        nested_fields = tuple(nested)
+        strict = self.strict
+
+        def check_object(value: Any, prefix: str, problems: List[Problem]) -> None:
+            if type(value) is not dict:
+                problems.append((prefix, TYPE_MISMATCH, "object", _json_type(value)))
+                return
+            keys = value.keys()
+            if field_set - keys:
+                for name in sorted(field_set - keys):
+                    problems.append((_child(prefix, name), MISSING, None, None))
+            if strict and keys - field_set:
+                for name in sorted(keys - field_set):
+                    problems.append(
+                        (_child(prefix, name), UNEXPECTED, None, _json_type(value[name]))
+                    )
+            for name, types, type_name in primitive_fields:
+                field_value = value.get(name, _MISSING)
+                if type(field_value) not in types and field_value is not _MISSING:
+                    problems.append(
+                        (_child(prefix, name), TYPE_MISMATCH, type_name, _json_type(field_value))
+                    )
+            for name, check in nested_fields:
+                if name in value:
+                    check(value[name], _child(prefix, name), problems)
+
+        return check_object
+
+
+class CompiledOperation(NamedTuple):
+    """Checkers of one operation; a checker is None when the spec has no schema."""
+
+    path: str
+    method: str
+    status: Optional[int]
+    response: Optional[Checker]
+    request: Optional[Checker]
+
+
+def _path_pattern(path: str) -> "re.Pattern[str]":
+    """Regex for a templated path: /users/{id} matches /users/42."""
+    parts = re.split(r"(\{[^}/]+\})", path)
+    return re.compile(
+        "".join("[^/]+" if p.startswith("{") else re.escape(p) for p in parts) + "$"
+    )
+
+
+class SpecValidator:
+    """
+    Validates payloads against a spec compiled once up front.
+
+    strict=True also reports fields the schema does not declare; by default
+    extra fields are allowed, as additive changes are not breaking.
+    """
+
+    def __init__(self, spec: Dict[str, Any], strict: bool = False) -> None:
+        compiler = _Compiler(spec, strict)
+        self.operations: Dict[OperationKey, CompiledOperation] = {}
+        self._templated: List[Tuple["re.Pattern[str]", str]] = []
+        for path, methods in spec.get("paths", {}).items():
+            for method, op in methods.items():
+                response = op.get("response") or {}
+                request = op.get("request") or {}
+                self.operations[(path, method.upper())] = CompiledOperation(
+                    path=path,
+                    method=method.upper(),
+                    status=response.get("status"),
+                    response=compiler.compile(response["schema"]) if "schema" in response else None,
+                    request=compiler.compile(request["schema"]) if "schema" in request else None,
+                )
+            if "{" in path:
+                self._templated.append((_path_pattern(path), path))
+        self._paths = frozenset(path for path, _ in self.operations)
+        # (request path, method) as recorded -> operation, memoized
+        self._lookup: Dict[OperationKey, Optional[CompiledOperation]] = {}
+
+    def _spec_path(self, path: str) -> Optional[str]:
+        """Spec path serving a concrete request path."""
+        if path in self._paths:
+            return path
+        for pattern, spec_path in self._templated:
+            if pattern.match(path):
+                return spec_path
+        return None
+
+    def find_operation(self, path: str, method: str) -> Optional[CompiledOperation]:
+        """The compiled operation for a request path (query string ignored)."""
+        key = (path, method)
+        try:
+            return self._lookup[key]
+        except KeyError:
+            pass
+        op = None
+        spec_path = self._spec_path(path.split("?", 1)[0])
+        if spec_path is not None:
+            op = self.operations.get((spec_path, method.upper()))
+        # Bounded: ids in paths could otherwise grow the memo without limit.
+        if len(self._lookup) < 100_000:
+            self._lookup[key] = op
+        return op
+
+    def validate(
+        self,
+        path: str,
+        method: str,
+        response: Any = None,
+        status: Optional[int] = None,
+        request: Any = None,
+    ) -> List[Violation]:
+        """
+        Violations of one exchange. A status other than the documented one
+        is reported on its own; the body is then not checked, since the
+        schema only describes the documented status.
+        """
+        op = self.find_operation(path, method)
+        if op is None:
+            return [Violation(path, method.upper(), "response", "", UNKNOWN_OPERATION, None, None)]
+        return self.validate_operation(op, response, status, request)
+
+    @staticmethod
+    def validate_operation(
+        op: CompiledOperation, response: Any, status: Optional[int], request: Any
+    ) -> List[Violation]:
+        """validate() for an operation already found with find_operation()."""
+        violations: List[Violation] = []
+        problems: List[Problem] = []
+        if request is not None and op.request is not None:
+            op.request(request, "", problems)
+            violations.extend(Violation(op.path, op.method, "request", *p) for p in problems)
+            problems = []
+
+        if status is not None and op.status is not None and status != op.status:
+            violations.append(
+                Violation(op.path, op.method, "response", "", STATUS_MISMATCH, str(op.status), str(status))
+            )
+        elif op.response is not None:
+            op.response(response, "", problems)
+            violations.extend(Violation(op.path, op.method, "response", *p) for p in problems)
+        return violations
+
+
+class PayloadReport:
+    """
+    Aggregated result of validating many exchanges.
+
+    violations counts each distinct Violation; examples keeps the line
+    numbers of the first few records showing it.
+    """
+
+    def __init__(self, max_examples: int = DEFAULT_MAX_EXAMPLES) -> None:
+        self.max_examples = max_examples
+        self.records = 0
+        self.invalid_records = 0
+        self.operations: Counter = Counter()  # (path, method) -> records
+        self.invalid_operations: Counter = Counter()
+        self.violations: Counter = Counter()  # Violation -> occurrences
+        self.examples: Dict[Violation, List[int]] = {}
+        self.elapsed_seconds = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.invalid_records == 0
+
+    def add(self, line_number: int, key: OperationKey, violations: List[Violation]) -> None:
+        self.records += 1
+        self.operations[key] += 1
+        if not violations:
+            return
+        self.invalid_records += 1
+        self.invalid_operations[key] += 1
+        for v in violations:
+            self.violations[v] += 1
+            lines = self.examples.setdefault(v, [])
+            if len(lines) < self.max_examples:
+                lines.append(line_number)
+
+    def merge(self, other: "PayloadReport", line_offset: int = 0) -> None:
+        """Add other's counts; its line numbers are shifted by line_offset."""
+        self.records += other.records
+        self.invalid_records += other.invalid_records
+        self.operations.update(other.operations)
+        self.invalid_operations.update(other.invalid_operations)
+        self.violations.update(other.violations)
+        for v, lines in other.examples.items():
+            mine = self.examples.setdefault(v, [])
+            room = self.max_examples - len(mine)
+            mine.extend(n + line_offset for n in lines[:room])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable summary, violations ordered by frequency."""
+        return {
+            "records": self.records,
+            "invalid_records": self.invalid_records,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "operations": [
+                {
+                    "path": path,
+                    "method": method,
+                    "records": count,
+                    "invalid": self.invalid_operations.get((path, method), 0),
+                }
+                for (path, method), count in self.operations.most_common()
+            ],
+            "violations": [
+                dict(v._asdict(), count=count, example_lines=self.examples.get(v, []))
+                for v, count in self.violations.most_common()
+            ],
+        }
+
+
+def _check_line(validator: SpecValidator, line: bytes, line_number: int, report: PayloadReport) -> None:
+    try:
+        record = _decode(line.decode("utf-8"))
+        path = record["path"]
+        method = record["method"]
+        if not isinstance(path, str) or not isinstance(method, str):
+            raise TypeError("path and method must be strings")
+        op = validator.find_operation(path, method)
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        reason = "not JSON" if isinstance(exc, ValueError) else "missing path or method"
+        report.add(line_number, ("", ""), [Violation("", "", "", "", INVALID_RECORD, None, reason)])
+        return
+    if op is None:
+        violation = Violation(path, method.upper(), "response", "", UNKNOWN_OPERATION, None, None)
+        report.add(line_number, (path, method.upper()), [violation])
+        return
+    violations = validator.validate_operation(
+        op, record.get("response"), record.get("status"), record.get("request")
+    )
+    report.add(line_number, (op.path, op.method), violations)
+
+
+def _validate_range(
+    validator: SpecValidator, file_path: str, start: int, end: int, report: PayloadReport
+) -> int:
+    """
+    Check the lines that begin in [start, end) and return how many lines
+    were read. A range that starts mid-line skips to the next line: the
+    previous range owns the line that spans the boundary.
+    """
+    line_number = 0
+    with open(file_path, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            line_number += 1
+            if line.strip():
+                _check_line(validator, line, line_number, report)
+    return line_number
+
+
+# Per-process validator, compiled once by the pool initializer
+_worker_validator: Optional[SpecValidator] = None
+
+
+def _init_worker(spec: Dict[str, Any], strict: bool) -> None:
+    global _worker_validator
+    _worker_validator = SpecValidator(spec, strict=strict)
+
+
+def _validate_range_task(
+    file_path: str, start: int, end: int, max_examples: int
+) -> Tuple[PayloadReport, int]:
+    assert _worker_validator is not None
+    report = PayloadReport(max_examples)
+    lines = _validate_range(_worker_validator, file_path, start, end, report)
+    return report, lines
+
+
+def validate_ndjson(
+    spec: Dict[str, Any],
+    file_path: str,
+    processes: int = 1,
+    strict: bool = False,
+    max_examples: int = DEFAULT_MAX_EXAMPLES,
+) -> PayloadReport:
+    """
+    Validate every exchange in an NDJSON capture against spec.
+
+    processes <= 0 uses one process per CPU. With one process (or a small
+    file) everything runs in-process to avoid pool start-up cost.
+    """
+    start_time = time.perf_counter()
+    report = PayloadReport(max_examples)
+    size = os.path.getsize(file_path)
+    processes = processes if processes > 0 else (os.cpu_count() or 1)
+
+    if processes == 1 or size < 1 << 20:
+        _validate_range(SpecValidator(spec, strict=strict), file_path, 0, size, report)
+    else:
+        chunks = processes * _CHUNKS_PER_PROCESS
+        bounds = [size * i // chunks for i in range(chunks + 1)]
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(spec, strict)
+        ) as pool:
+            futures = [
+                pool.submit(_validate_range_task, file_path, bounds[i], bounds[i + 1], max_examples)
+                for i in range(chunks)
+            ]
+            line_offset = 0
+            for future in futures:
+                part, lines = future.result()
+                report.merge(part, line_offset)
+                line_offset += lines
+
+    report.elapsed_seconds = time.perf_counter() - start_time
+    return report
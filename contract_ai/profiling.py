@@ -0,0 +1,194 @@
+# profiling.py
+"""
+Lightweight spans for finding where a CLI run spends its time.
+
+    with profiling.span("load_spec", path=path):
+        ...
+
+Spans are off by default: span() then returns a shared no-op context
+manager, so instrumented code pays one global check per call. enable()
+(the CLI's --profile flags) starts recording, per thread, the name, start
+and duration of every span. record() adds a span measured elsewhere, such
+as the prefill and generation times Ollama reports for a request.
+
+Nesting is not tracked at runtime. breakdown() derives it afterwards from
+the intervals: a span's self time is its duration minus that of the spans
+directly inside it on the same thread. That also works for spans recorded
+after the fact and for generators, which cannot hold a span open across
+yields.
+
+Output: print_breakdown() prints a table; write_chrome_trace() writes
+Trace Event JSON for chrome://tracing or Perfetto.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO
+
+
+class SpanEvent(NamedTuple):
+    """One finished span; start is perf_counter() seconds."""
+
+    name: str
+    start: float
+    duration: float
+    thread: int
+    args: Dict[str, Any]
+
+
+_enabled = False
+_events: List[SpanEvent] = []
+_enabled_at = 0.0
+
+
+class _NullSpan:
+    """What span() returns while profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+    def set(self, **args: Any) -> None:
+        """Attach arguments to the span (shown in the Chrome trace)."""
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: Dict[str, Any]) -> None:
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        end = time.perf_counter()
+        # list.append is atomic under the GIL; no lock needed across threads.
+        _events.append(
+            SpanEvent(self.name, self.start, end - self.start, threading.get_ident(), self.args)
+        )
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+
+def span(name: str, **args: Any) -> Any:
+    """Context manager timing the enclosed block as span `name` (no-op when disabled)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def record(name: str, duration: float, end: Optional[float] = None, **args: Any) -> None:
+    """Add a span of duration seconds that ended at end (perf_counter(); default now)."""
+    if not _enabled:
+        return
+    if end is None:
+        end = time.perf_counter()
+    _events.append(SpanEvent(name, end - duration, duration, threading.get_ident(), args))
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable() -> None:
+    """Start recording spans (clears earlier ones)."""
+    global _enabled, _enabled_at
+    _events.clear()
+    _enabled_at = time.perf_counter()
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def events() -> List[SpanEvent]:
+    return list(_events)
+
+
+def _self_times(spans: List[SpanEvent]) -> List[float]:
+    """Self time of each span: duration minus direct children on its thread."""
+    self_times = [e.duration for e in spans]
+    by_thread: Dict[int, List[int]] = {}
+    for i, e in enumerate(spans):
+        by_thread.setdefault(e.thread, []).append(i)
+    for indices in by_thread.values():
+        # Parents sort before the children they contain.
+        indices.sort(key=lambda i: (spans[i].start, -spans[i].duration))
+        stack: List[int] = []
+        for i in indices:
+            e = spans[i]
+            while stack and spans[stack[-1]].start + spans[stack[-1]].duration <= e.start:
+                stack.pop()
+            if stack:
+                parent = spans[stack[-1]]
+                overlap = min(e.start + e.duration, parent.start + parent.duration) - e.start
+                self_times[stack[-1]] -= max(0.0, overlap)
+            stack.append(i)
+    return [max(0.0, t) for t in self_times]
+
+
+def breakdown() -> List[Dict[str, Any]]:
+    """Per span name: calls, total and self seconds, largest self time first."""
+    spans = events()
+    rows: Dict[str, Dict[str, Any]] = {}
+    for e, self_time in zip(spans, _self_times(spans)):
+        row = rows.setdefault(e.name, {"name": e.name, "calls": 0, "total": 0.0, "self": 0.0})
+        row["calls"] += 1
+        row["total"] += e.duration
+        row["self"] += self_time
+    return sorted(rows.values(), key=lambda r: r["self"], reverse=True)
+
+
+def print_breakdown(out: TextIO = sys.stderr) -> None:
+    """Print the breakdown table; % is self time over wall time since enable()."""
+    wall = time.perf_counter() - _enabled_at
+    rows = breakdown()
+    threads = len({e.thread for e in _events})
+    print(f"\nProfile: {wall:.3f}s wall, {len(_events)} span(s)", file=out)
+    if threads > 1:
+        print(f"(spans from {threads} threads overlap, so % can add up to more than 100)", file=out)
+    print(f"{'span':<28} {'calls':>6} {'total s':>9} {'self s':>9} {'% wall':>7}", file=out)
+    for r in rows:
+        share = 100 * r["self"] / wall if wall else 0.0
+        print(
+            f"{r['name']:<28} {r['calls']:>6} {r['total']:>9.3f} {r['self']:>9.3f} {share:>6.1f}%",
+            file=out,
+        )
+
+
+def write_chrome_trace(path: str) -> None:
+    """Write the spans as Chrome Trace Event JSON (complete "X" events, in µs)."""
+    pid = os.getpid()
+    trace = [
+        {
+            "name": e.name,
+            "ph": "X",
+            "ts": round((e.start - _enabled_at) * 1e6, 1),
+            "dur": round(e.duration * 1e6, 1),
+            "pid": pid,
+            "tid": e.thread,
+            "args": {k: v if isinstance(v, (int, float, str, bool)) else str(v) for k, v in e.args.items()},
+        }
+        for e in events()
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,497 @@
+# replay.py
+"""
+Replay recorded traffic over HTTP and check every response against a spec.
+
+The generated contract tests never touch HTTP. replay_capture() takes a
+capture (HAR, or NDJSON in the format payload_validator reads), sends each
+recorded request over a real HTTP connection and validates the response it
+gets back against the spec's response.status and schema with a
+SpecValidator.
+
+- Without a target, a StandInServer on 127.0.0.1 serves the recorded
+  responses, so a capture can be checked against a new spec version without
+  the service. Requests carry an X-Replay-Id header naming the exchange to
+  serve; other clients are answered from the recordings for the same method
+  and URL, in rotation.
+- With a target base URL, the recorded requests go to a live service.
+- A fixed number of worker coroutines, each with one keep-alive connection,
+  pull exchanges from the capture, so concurrency and memory stay bounded
+  however long the capture is.
+
+The result is a ReplayReport: a PayloadReport of violations per endpoint
+plus latency percentiles per endpoint.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import time
+from collections import defaultdict, deque
+from typing import (
+    Any,
+    BinaryIO,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+from urllib.parse import urlsplit
+
+from payload_validator import (
+    DEFAULT_MAX_EXAMPLES,
+    INVALID_RECORD,
+    OperationKey,
+    PayloadReport,
+    SpecValidator,
+    Violation,
+)
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT_SECONDS = 30.0
+REPLAY_ID_HEADER = "x-replay-id"
+PERCENTILES = (50, 90, 99)
+
+# Violation kinds added on top of payload_validator's
+REQUEST_FAILED = "request_failed"
+INVALID_BODY = "invalid_body"
+
+_REASONS = {200: "OK", 201: "Created", 204: "No Content", 404: "Not Found"}
+# Resent once if a reused connection fails after the request went out. PUT
+# and DELETE are idempotent too, but a second DELETE answers differently.
+_RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE"})
+_MISSING_BODY = object()
+
+
+class Exchange(NamedTuple):
+    """
+    One recorded request and the response the service gave. invalid is set
+    (to the reason) for a capture record that could not be read; such
+    exchanges are reported as invalid_record and never sent. line locates
+    the record in the capture: its line in an NDJSON file, its 1-based
+    position in log.entries of a HAR archive.
+    """
+
+    method: str
+    target: str  # path plus query string
+    request_body: Optional[bytes]
+    status: int
+    response_body: bytes
+    content_type: str
+    invalid: Optional[str] = None
+    line: int = 0
+
+
+def _json_bytes(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _har_exchanges(doc: Dict[str, Any]) -> Iterator[Exchange]:
+    for number, entry in enumerate(doc.get("log", {}).get("entries", []), 1):
+        request = entry.get("request", {})
+        response = entry.get("response", {})
+        parts = urlsplit(request.get("url", "/"))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        post = request.get("postData") or {}
+        content = response.get("content") or {}
+        text = content.get("text") or ""
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(text)
+        else:
+            body = text.encode("utf-8")
+        yield Exchange(
+            method=request.get("method", "GET").upper(),
+            target=target,
+            request_body=post["text"].encode("utf-8") if post.get("text") else None,
+            status=int(response.get("status") or 0),
+            response_body=body,
+            content_type=content.get("mimeType") or "application/json",
+            line=number,
+        )
+
+
+def _invalid(reason: str, line: int) -> Exchange:
+    return Exchange("", "", None, 0, b"", "", invalid=reason, line=line)
+
+
+def _ndjson_exchanges(lines: Iterable[bytes]) -> Iterator[Exchange]:
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        # Same reasons as payload_validator reports for check-payloads
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield _invalid("not JSON", number)
+            continue
+        try:
+            request = record.get("request")
+            yield Exchange(
+                method=record["method"].upper(),
+                target=record["path"],
+                request_body=_json_bytes(request) if request is not None else None,
+                status=int(record.get("status") or 200),
+                response_body=_json_bytes(record.get("response")),
+                content_type="application/json",
+                line=number,
+            )
+        except (ValueError, KeyError, TypeError, AttributeError):
+            yield _invalid("missing path or method", number)
+
+
+def _read_ndjson(f: BinaryIO) -> Iterator[Exchange]:
+    with f:
+        yield from _ndjson_exchanges(f)
+
+
+def load_capture(path: str) -> Iterator[Exchange]:
+    """
+    Exchanges of a capture file: a HAR archive (*.har) or NDJSON with one
+    {"path", "method", "status", "response", "request"} object per line.
+    NDJSON is read lazily, and unreadable lines become invalid exchanges; a
+    HAR archive is one JSON document, read here.
+
+    Raises OSError if the file cannot be opened and ValueError if a HAR
+    archive is not valid.
+    """
+    if path.endswith(".har"):
+        with open(path, "rb") as f:
+            doc = json.load(f)
+        try:
+            return iter(list(_har_exchanges(doc)))
+        except (AttributeError, KeyError, TypeError) as exc:
+            raise ValueError(f"{path} is not a HAR archive: {exc!r}") from exc
+    return _read_ndjson(open(path, "rb"))
+
+
+# -- stand-in server ----------------------------------------------------------
+
+
+async def read_head(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, Dict[str, str]]]:
+    """First line and lower-cased headers of a message; None at end of stream."""
+    first = await reader.readline()
+    if not first.strip():
+        return None
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return first.decode("latin-1").rstrip("\r\n"), headers
+
+
+class StandInServer:
+    """
+    Serves recorded responses over HTTP/1.1 with keep-alive.
+
+    Call start() inside a running event loop; url is valid afterwards.
+    """
+
+    def __init__(self, exchanges: List[Exchange], host: str = "127.0.0.1", port: int = 0) -> None:
+        self.exchanges = exchanges
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Deque[int]] = defaultdict(deque)
+        for i, ex in enumerate(exchanges):
+            if ex.invalid is None:
+                self._routes[(ex.method, ex.target)].append(i)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Handlers wait on keep-alive connections; end them too.
+            for task in self._handlers:
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "StandInServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def _lookup(self, method: str, target: str, replay_id: Optional[str]) -> Optional[Exchange]:
+        if replay_id is not None and replay_id.isdigit() and int(replay_id) < len(self.exchanges):
+            return self.exchanges[int(replay_id)]
+        route = self._routes.get((method, target))
+        if not route:
+            return None
+        route.rotate(-1)
+        return self.exchanges[route[-1]]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._handlers.add(task)
+        try:
+            while True:
+                head = await read_head(reader)
+                if head is None:
+                    break
+                request_line, headers = head
+                method, target, _ = (request_line.split(" ", 2) + ["", ""])[:3]
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                ex = self._lookup(method.upper(), target, headers.get(REPLAY_ID_HEADER))
+                if ex is None:
+                    status, body, content_type = 404, b"no recorded response", "text/plain"
+                else:
+                    status, body, content_type = ex.status, ex.response_body, ex.content_type
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {_REASONS.get(status, 'Recorded')}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Cancelled by close(): finish normally so asyncio does not log it.
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+
+# -- replay client ------------------------------------------------------------
+
+
+class ReplayReport:
+    """Violations (a PayloadReport) and response latencies per endpoint."""
+
+    def __init__(self, max_examples: int = DEFAULT_MAX_EXAMPLES) -> None:
+        self.payloads = PayloadReport(max_examples)
+        self.latencies: Dict[OperationKey, List[float]] = defaultdict(list)
+
+    @property
+    def ok(self) -> bool:
+        return self.payloads.ok
+
+    def percentiles(self, key: OperationKey) -> Dict[str, float]:
+        """Nearest-rank latency percentiles (and max) in milliseconds."""
+        samples = sorted(self.latencies.get(key, ()))
+        if not samples:
+            return {}
+        result = {
+            f"p{p}": round(samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000, 2)
+            for p in PERCENTILES
+        }
+        result["max"] = round(samples[-1] * 1000, 2)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        doc = self.payloads.to_dict()
+        for op in doc["operations"]:
+            op["latency_ms"] = self.percentiles((op["path"], op["method"]))
+        return doc
+
+
+class _Connection:
+    """One keep-alive HTTP/1.1 connection to the replay target."""
+
+    def __init__(
+        self, host: str, port: int, prefix: str, timeout: float, send_replay_id: bool
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.prefix = prefix  # path of the target base URL, without trailing /
+        self.timeout = timeout
+        self.send_replay_id = send_replay_id
+        self._streams: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+
+    def close(self) -> None:
+        if self._streams is not None:
+            self._streams[1].close()
+            self._streams = None
+
+    async def request(self, ex: Exchange, replay_id: int) -> Tuple[int, bytes]:
+        """
+        Send ex's request and return (status, body). A kept-alive connection
+        the server has already closed is replaced before anything is sent. If
+        a reused connection fails once the request is written, only methods in
+        _RETRY_METHODS are resent, so a recorded POST never runs twice.
+        """
+        if self._streams is not None and self._streams[0].at_eof():
+            self.close()
+        for attempt in (0, 1):
+            fresh = self._streams is None
+            if fresh:
+                self._streams = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout
+                )
+            try:
+                return await asyncio.wait_for(self._exchange(ex, replay_id), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError, EOFError):
+                self.close()
+                if fresh or attempt or ex.method not in _RETRY_METHODS:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+        raise AssertionError("unreachable")
+
+    async def _exchange(self, ex: Exchange, replay_id: int) -> Tuple[int, bytes]:
+        reader, writer = self._streams  # type: ignore[misc]
+        body = ex.request_body or b""
+        head = (
+            f"{ex.method} {self.prefix}{ex.target} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        )
+        if self.send_replay_id:
+            head += f"X-Replay-Id: {replay_id}\r\n"
+        if ex.request_body is not None:
+            head += "Content-Type: application/json\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+        parsed = await read_head(reader)
+        if parsed is None:
+            raise EOFError("connection closed before the response")
+        status_line, headers = parsed
+        status = int(status_line.split(" ", 2)[1])
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            parts: List[bytes] = []
+            while True:
+                size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                parts.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(parts)
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+            self.close()
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, data
+
+
+def _decode_body(data: bytes) -> Any:
+    if not data.strip():
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return _MISSING_BODY
+
+
+async def _worker(
+    exchanges: Iterator[Tuple[int, Exchange]],
+    conn: _Connection,
+    validator: SpecValidator,
+    report: ReplayReport,
+) -> None:
+    for index, ex in exchanges:
+        line = ex.line or index + 1
+        if ex.invalid is not None:
+            invalid = Violation("", "", "", "", INVALID_RECORD, None, ex.invalid)
+            report.payloads.add(line, ("", ""), [invalid])
+            continue
+        op = validator.find_operation(ex.target, ex.method)
+        key = (op.path, op.method) if op is not None else (ex.target.split("?", 1)[0], ex.method)
+        request = _decode_body(ex.request_body) if ex.request_body is not None else None
+        start = time.perf_counter()
+        try:
+            status, data = await conn.request(ex, index)
+        except (OSError, EOFError, asyncio.TimeoutError, ValueError, IndexError) as exc:
+            failure = Violation(key[0], key[1], "response", "", REQUEST_FAILED, None, str(exc) or type(exc).__name__)
+            report.payloads.add(line, key, [failure])
+            continue
+        report.latencies[key].append(time.perf_counter() - start)
+
+        response = _decode_body(data)
+        if response is _MISSING_BODY:
+            violations = [Violation(key[0], key[1], "response", "", INVALID_BODY, "JSON", "not JSON")]
+        elif op is None:
+            violations = validator.validate(ex.target, ex.method)
+        else:
+            violations = validator.validate_operation(
+                op, response, status, request if request is not _MISSING_BODY else None
+            )
+        report.payloads.add(line, key, violations)
+
+
+async def replay_capture(
+    exchanges: Iterable[Exchange],
+    validator: SpecValidator,
+    target: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    max_examples: int = DEFAULT_MAX_EXAMPLES,
+) -> ReplayReport:
+    """
+    Replay exchanges against target (a base URL such as
+    http://localhost:8080 or http://gateway/api, whose path is put in front
+    of each recorded path), or against a StandInServer serving the recorded
+    responses when target is None, and validate each response.
+
+    Raises ValueError if target is not an http:// URL.
+    """
+    report = ReplayReport(max_examples)
+    server: Optional[StandInServer] = None
+    if target is None:
+        exchanges = list(exchanges)
+        server = StandInServer(exchanges)
+        await server.start()
+        target = server.url
+
+    parts = urlsplit(target)
+    if parts.scheme != "http":
+        raise ValueError(f"Replay target must be an http:// URL, got {target!r}")
+    host = parts.hostname or "localhost"
+    port = parts.port or 80
+
+    start = time.perf_counter()
+    shared = iter(enumerate(exchanges))
+    conns = [
+        _Connection(
+            host, port, parts.path.rstrip("/"), timeout_seconds, send_replay_id=server is not None
+        )
+        for _ in range(max(1, concurrency))
+    ]
+    try:
+        await asyncio.gather(*(_worker(shared, c, validator, report) for c in conns))
+    finally:
+        for conn in conns:
+            conn.close()
+        if server is not None:
+            await server.close()
+    report.payloads.elapsed_seconds = time.perf_counter() - start
+    return report
+
+
+async def serve_capture(exchanges: List[Exchange], host: str, port: int) -> None:
+    """Run a StandInServer for exchanges until cancelled."""
+    async with StandInServer(exchanges, host, port) as server:
+        print(f"Serving {len(exchanges)} recorded exchange(s) on {server.url}")
+        await asyncio.Event().wait()
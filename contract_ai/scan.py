@@ -0,0 +1,407 @@
+# scan.py
+"""
+Monorepo-wide compare: every spec under a tree against a baseline.
+
+Spec files are discovered by glob patterns relative to the tree root (by
+default any *.json directly inside a `specs/` directory at any depth, so
+both `specs/` and `contract_ai/specs/` are found) and paired by relative
+path with the same files in a baseline:
+
+- a git ref (`git ls-tree` for the file list, one `git cat-file --batch`
+  for the contents that are needed), or
+- a baseline directory with the same layout, e.g. a checkout of main.
+
+Files are compared by their git blob hash before anything is parsed, so
+unchanged specs are skipped without being decoded or diffed. Hashes of
+files on disk are kept in a stat cache (path -> mtime, size, hash), so a
+re-scan only reads files whose mtime or size changed. A spec that only
+exists on one side is diffed against an empty spec, which reports its
+endpoints as added or removed.
+
+The remaining pairs are diffed on a process pool; results come back in
+path order, are classified in the parent (rules may hold functions that
+do not pickle) and are aggregated into one report (text, json or ndjson).
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Union,
+)
+
+from compatibility import BREAKING, DEFAULT_RULESET, RuleSet
+from diff_engine import Change, diff_changes, load_spec
+from diff_report import change_record
+from generation_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_PATTERNS = ("specs/*.json", "*/specs/*.json")
+FORMATS = ("text", "json", "ndjson")
+
+# Never descended into while discovering specs
+SKIP_DIRS = frozenset(
+    {".git", ".hg", ".svn", ".tox", ".venv", "venv", "node_modules", "__pycache__"}
+    | {DEFAULT_CACHE_DIR}
+)
+
+# Stat cache location, relative to the scanned root
+DEFAULT_STAT_CACHE = f"{DEFAULT_CACHE_DIR}/scan-stat.json"
+# Files modified this recently are hashed but not cached: a second write
+# within the same mtime tick would otherwise go unnoticed.
+_RACY_SECONDS = 2.0
+
+# Pair status
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+UNCHANGED = "unchanged"
+
+# A side of a pair: a path on disk, the bytes of a git blob, or None (absent)
+Source = Union[str, bytes, None]
+
+
+class ScanError(Exception):
+    """The baseline could not be read (not a git repo, unknown ref, ...)."""
+
+
+class ScanTask(NamedTuple):
+    spec: str
+    status: str
+    old: Source
+    new: Source
+
+
+class ScanResult(NamedTuple):
+    spec: str
+    status: str
+    changes: List[Change]
+    error: Optional[str] = None
+
+
+class ScanPlan(NamedTuple):
+    tasks: List[ScanTask]
+    unchanged: List[str]
+
+
+class ScanSummary(NamedTuple):
+    specs: int
+    added: int
+    removed: int
+    modified: int
+    unchanged: int
+    changes: int
+    breaking: int
+    errors: int
+
+    def to_dict(self) -> Dict[str, int]:
+        return self._asdict()
+
+
+def blob_hash(data: bytes) -> str:
+    """The git blob id of data, so disk files compare directly with ls-tree."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class StatCache:
+    """
+    Blob hashes of files on disk, reused while a file's mtime and size are
+    unchanged. path=None keeps the cache in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._entries: Dict[str, List[Any]] = {}
+        self._dirty = False
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def hash(self, path: str) -> str:
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self._entries.get(key)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+
+        with open(path, "rb") as f:
+            digest = blob_hash(f.read())
+        if st.st_mtime_ns < (time.time() - _RACY_SECONDS) * 1e9:
+            self._entries[key] = [st.st_mtime_ns, st.st_size, digest]
+            self._dirty = True
+        return digest
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def matches(relpath: str, patterns: Sequence[str]) -> bool:
+    """Whether a root-relative POSIX path matches any discovery pattern."""
+    if any(part in SKIP_DIRS for part in relpath.split("/")[:-1]):
+        return False
+    return any(fnmatch.fnmatchcase(relpath, pattern) for pattern in patterns)
+
+
+def discover_specs(root: str, patterns: Sequence[str] = DEFAULT_PATTERNS) -> Dict[str, str]:
+    """Map root-relative POSIX path -> file path for every spec under root."""
+    found: Dict[str, str] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        rel_dir = Path(os.path.relpath(dirpath, root)).as_posix()
+        for name in filenames:
+            rel = name if rel_dir == "." else f"{rel_dir}/{name}"
+            if matches(rel, patterns):
+                found[rel] = os.path.join(dirpath, name)
+    return found
+
+
+def _git(root: str, *args: str, stdin: Optional[bytes] = None) -> bytes:
+    try:
+        proc = subprocess.run(
+            ["git", "-C", root, *args], input=stdin, capture_output=True, check=False
+        )
+    except OSError as exc:
+        raise ScanError(f"Cannot run git: {exc}") from exc
+    if proc.returncode != 0:
+        raise ScanError(proc.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} failed")
+    return proc.stdout
+
+
+def git_specs(root: str, ref: str, patterns: Sequence[str] = DEFAULT_PATTERNS) -> Dict[str, str]:
+    """Map root-relative path -> blob id for every spec under root at ref."""
+    listing = _git(root, "ls-tree", "-r", "-z", ref)
+    found: Dict[str, str] = {}
+    for entry in listing.split(b"\0"):
+        if not entry:
+            continue
+        meta, _, name = entry.partition(b"\t")
+        _, kind, blob = meta.split()
+        rel = name.decode("utf-8")
+        if kind == b"blob" and matches(rel, patterns):
+            found[rel] = blob.decode("ascii")
+    return found
+
+
+def read_blobs(root: str, blobs: Iterable[str]) -> Dict[str, bytes]:
+    """Contents of the given blob ids, read with a single git process."""
+    wanted = list(dict.fromkeys(blobs))
+    if not wanted:
+        return {}
+    output = _git(root, "cat-file", "--batch", stdin="".join(f"{b}\n" for b in wanted).encode())
+
+    contents: Dict[str, bytes] = {}
+    pos = 0
+    for blob in wanted:
+        end = output.index(b"\n", pos)
+        header = output[pos:end].split()
+        if len(header) != 3:
+            raise ScanError(f"git cat-file: missing object {blob}")
+        size = int(header[2])
+        contents[blob] = output[end + 1:end + 1 + size]
+        pos = end + 1 + size + 1
+    return contents
+
+
+def plan_scan(
+    root: str,
+    base_ref: Optional[str] = None,
+    baseline_dir: Optional[str] = None,
+    patterns: Sequence[str] = DEFAULT_PATTERNS,
+    stat_cache: Optional[StatCache] = None,
+) -> ScanPlan:
+    """
+    Pair the specs under root with those in base_ref or baseline_dir and
+    return the pairs that need a diff. Pairs with equal hashes go to
+    unchanged without being read beyond hashing (or at all, on a stat cache
+    hit).
+    """
+    stat_cache = stat_cache or StatCache()
+    current = discover_specs(root, patterns)
+    current_hashes = {rel: stat_cache.hash(path) for rel, path in current.items()}
+
+    if base_ref is not None:
+        base_hashes = git_specs(root, base_ref, patterns)
+        base_sources: Dict[str, Source] = {}
+    else:
+        if not baseline_dir or not os.path.isdir(baseline_dir):
+            raise ScanError(f"Baseline directory not found: {baseline_dir}")
+        base_files = discover_specs(baseline_dir, patterns)
+        base_hashes = {rel: stat_cache.hash(path) for rel, path in base_files.items()}
+        base_sources = dict(base_files)
+
+    tasks: List[ScanTask] = []
+    unchanged: List[str] = []
+    for rel in sorted(current_hashes.keys() | base_hashes.keys()):
+        old_hash = base_hashes.get(rel)
+        new_hash = current_hashes.get(rel)
+        if old_hash == new_hash:
+            unchanged.append(rel)
+            continue
+        status = ADDED if old_hash is None else REMOVED if new_hash is None else MODIFIED
+        old = None if old_hash is None else base_sources.get(rel, old_hash)
+        tasks.append(ScanTask(rel, status, old, current.get(rel)))
+
+    if base_ref is not None:
+        # Old sides are blob ids so far; fetch them all in one go.
+        blobs = read_blobs(root, [t.old for t in tasks if isinstance(t.old, str)])
+        tasks = [t._replace(old=blobs[t.old]) if isinstance(t.old, str) else t for t in tasks]
+
+    return ScanPlan(tasks, unchanged)
+
+
+def _load(source: Source) -> Dict[str, Any]:
+    if source is None:
+        return {}
+    spec = json.loads(source) if isinstance(source, bytes) else load_spec(source)
+    if not isinstance(spec, dict):
+        raise ValueError(f"expected a JSON object, got {type(spec).__name__}")
+    return spec
+
+
+def _diff_task(task: ScanTask) -> ScanResult:
+    try:
+        changes = diff_changes(_load(task.old), _load(task.new))
+    except (OSError, ValueError, AttributeError, TypeError) as exc:
+        # AttributeError/TypeError: an object whose paths or operations are
+        # not objects; one malformed spec must not abort the whole scan.
+        return ScanResult(task.spec, task.status, [], f"{type(exc).__name__}: {exc}")
+    return ScanResult(task.spec, task.status, changes)
+
+
+def iter_scan(tasks: Sequence[ScanTask], workers: int = 0) -> Iterator[ScanResult]:
+    """
+    Yield one result per task, in order. workers <= 0 uses one process per
+    CPU; with a single worker (or very few tasks) everything runs in-process
+    to avoid pool start-up cost.
+    """
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    if workers == 1 or len(tasks) < 4:
+        for task in tasks:
+            yield _diff_task(task)
+        return
+
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_diff_task, tasks, chunksize=chunksize)
+
+
+class _Aggregate:
+    """Classifies each result's changes and keeps the running totals."""
+
+    def __init__(self, results: Iterable[ScanResult], rules: RuleSet, unchanged: int) -> None:
+        self._results = results
+        self.rules = rules
+        self.counts = dict.fromkeys(ScanSummary._fields, 0)
+        self.counts["unchanged"] = self.counts["specs"] = unchanged
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        match = self.rules.match
+        counts = self.counts
+        for result in self._results:
+            records = []
+            breaking = 0
+            for change in result.changes:
+                rule = match(change)
+                if rule.severity == BREAKING:
+                    breaking += 1
+                records.append(change_record(change, rule))
+
+            counts["specs"] += 1
+            counts[result.status] += 1
+            counts["changes"] += len(records)
+            counts["breaking"] += breaking
+            entry: Dict[str, Any] = {
+                "spec": result.spec,
+                "status": result.status,
+                "change_count": len(records),
+                "breaking": breaking,
+                "changes": records,
+            }
+            if result.error:
+                counts["errors"] += 1
+                entry["error"] = result.error
+            yield entry
+
+    def summary(self) -> ScanSummary:
+        return ScanSummary(**self.counts)
+
+
+def _write_text(items: _Aggregate, out: TextIO, baseline: str) -> None:
+    for entry in items:
+        if entry.get("error"):
+            out.write(f"{entry['spec']} ({entry['status']}): error: {entry['error']}\n")
+            continue
+        out.write(
+            f"{entry['spec']} ({entry['status']}): {entry['change_count']} change(s), "
+            f"{entry['breaking']} breaking\n"
+        )
+        for record in entry["changes"]:
+            out.write(f"- {record['description']}\n")
+    s = items.summary()
+    out.write(
+        f"Scanned {s.specs} spec(s) against {baseline}: {s.modified} modified, "
+        f"{s.added} added, {s.removed} removed, {s.unchanged} unchanged; "
+        f"{s.changes} change(s), {s.breaking} breaking"
+        + (f", {s.errors} error(s)" if s.errors else "")
+        + "\n"
+    )
+
+
+def _write_ndjson(items: _Aggregate, out: TextIO, baseline: str) -> None:
+    for entry in items:
+        out.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _write_json(items: _Aggregate, out: TextIO, baseline: str) -> None:
+    out.write(f'{{\n  "baseline": {json.dumps(baseline)},\n  "specs": [')
+    first = True
+    for entry in items:
+        out.write(("" if first else ",") + "\n    " + json.dumps(entry))
+        first = False
+    out.write("],\n" if first else "\n  ],\n")
+    out.write(f'  "summary": {json.dumps(items.summary().to_dict())}\n}}\n')
+
+
+_WRITERS = {"text": _write_text, "ndjson": _write_ndjson, "json": _write_json}
+
+
+def write_scan(
+    plan: ScanPlan,
+    results: Iterable[ScanResult],
+    fmt: str,
+    out: TextIO,
+    baseline: str,
+    rules: RuleSet = DEFAULT_RULESET,
+) -> ScanSummary:
+    """
+    Write one report entry per changed spec to out in fmt (one of FORMATS)
+    as results arrive; unchanged specs only appear in the summary.
+    """
+    items = _Aggregate(results, rules, len(plan.unchanged))
+    _WRITERS[fmt](items, out, baseline)
+    return items.summary()
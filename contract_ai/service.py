@@ -0,0 +1,432 @@
+# service.py
+"""
+Long-running HTTP service for compare and generate.
+
+A CLI run pays for interpreter startup, imports and spec parsing every
+time. ContractService keeps that state warm in one asyncio process:
+
+- POST /specs         raw spec JSON; parsed once and kept under its hash
+- POST /compare       {"old": spec, "new": spec} -> changes
+- POST /generate      {"old": spec, "new": spec} -> generated pytest module
+- GET  /health, GET /metrics (metrics.REGISTRY)
+
+In /compare and /generate each spec is either an inline JSON object or the
+hash of a spec held by the service (returned by /specs, and as "old"/"new"
+in every response), so CI jobs can skip re-sending an unchanged baseline.
+
+Parsed specs live in a SpecCache, an LRU keyed by content hash: a hash of
+the raw bytes for uploads (so a re-upload is recognized before parsing),
+a canonical hash for inline specs.
+
+The event loop only moves bytes. Hashing, JSON parsing and encoding,
+diffing, templates and job planning run on a small thread pool of their
+own (separate from the generation pool, so they never queue behind an LLM
+call), so one large upload or diff does not stall the other clients.
+
+Generation works like generate-tests --per-endpoint: templates first, then
+one LLM job per endpoint group on a thread pool sharing the pooled Ollama
+clients (or a HostPool) and the on-disk GenerationCache. Identical jobs
+that arrive while one is in flight (same prompt and model, the cache key)
+are coalesced: they wait for the running call instead of starting another.
+
+HTTP/1.1 with keep-alive, JSON in and out; errors are {"error": message}
+with status 400, 404, 405 or 413.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from ai_client_ollama import PROMPT_VERSION
+from diff_engine import Change, change_to_dict, diff_changes, format_change
+from generation import (
+    Client,
+    GenerationJob,
+    GenerationResult,
+    build_generation_jobs,
+    merge_test_modules,
+    run_generation_job,
+)
+from generation_cache import GenerationCache, cache_key
+from metrics import (
+    COALESCED_GENERATIONS,
+    PROMETHEUS_CONTENT_TYPE,
+    REGISTRY,
+    SERVICE_REQUESTS,
+    SPEC_CACHE_REQUESTS,
+)
+from replay import read_head
+from spec_context import DEFAULT_CONTEXT_TOKENS
+from spec_index import canonical_hash, raw_hash
+from template_generator import EndpointKey, generate_template_tests
+from token_budget import DEFAULT_MAX_PROMPT_TOKENS
+
+DEFAULT_PORT = 8088
+DEFAULT_SPEC_CACHE_SIZE = 256
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# List items per json.dumps call when encoding large responses
+_JSON_SLICE = 1000
+
+_ENDPOINTS = ("/specs", "/compare", "/generate", "/health", "/metrics")
+
+T = TypeVar("T")
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class RequestError(Exception):
+    """A client error, answered with status and {"error": message}."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class SpecCache:
+    """LRU of parsed specs keyed by content hash (hex)."""
+
+    def __init__(self, max_entries: int = DEFAULT_SPEC_CACHE_SIZE) -> None:
+        self.max_entries = max(1, max_entries)
+        self._specs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        spec = self._specs.get(key)
+        SPEC_CACHE_REQUESTS.inc(result="miss" if spec is None else "hit")
+        if spec is not None:
+            self._specs.move_to_end(key)
+        return spec
+
+    def put(self, key: str, spec: Dict[str, Any]) -> None:
+        """Store spec under key, or mark it recently used if already there."""
+        if key in self._specs:
+            self._specs.move_to_end(key)
+            return
+        self._specs[key] = spec
+        while len(self._specs) > self.max_entries:
+            self._specs.popitem(last=False)
+
+
+def parse_spec(data: bytes) -> Dict[str, Any]:
+    """Spec JSON bytes as a dict; RequestError(400) if they are not one."""
+    try:
+        spec = json.loads(data)
+    except ValueError as exc:
+        raise RequestError(400, f"Spec is not valid JSON: {exc}") from exc
+    if not isinstance(spec, dict):
+        raise RequestError(400, "Spec must be a JSON object")
+    return spec
+
+
+def _parse_request(data: bytes) -> Dict[str, Any]:
+    try:
+        request = json.loads(data)
+    except ValueError as exc:
+        raise RequestError(400, f"Request body is not valid JSON: {exc}") from exc
+    if not isinstance(request, dict):
+        raise RequestError(400, "Request body must be a JSON object")
+    return request
+
+
+class ContractService:
+    """
+    The HTTP service. Call start() inside a running event loop; url is
+    valid afterwards.
+
+    clients are used round-robin for LLM jobs (pass a single HostPool to
+    balance by load instead); workers bounds concurrent generations.
+    repair_rounds=None skips validating generated code.
+    """
+
+    def __init__(
+        self,
+        clients: Sequence[Client],
+        cache: Optional[GenerationCache] = None,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        spec_cache_size: int = DEFAULT_SPEC_CACHE_SIZE,
+        workers: int = 4,
+        repair_rounds: Optional[int] = None,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+    ) -> None:
+        self.clients = list(clients)
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.specs = SpecCache(spec_cache_size)
+        self.repair_rounds = repair_rounds
+        self.context_tokens = context_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self._next_client = cycle(self.clients)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="generate")
+        self._cpu = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="cpu")
+        self._inflight: Dict[str, "asyncio.Future[GenerationResult]"] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in self._handlers:
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._cpu.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> "ContractService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    # -- endpoints ------------------------------------------------------------
+
+    async def _offload(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run CPU-bound fn(*args) on the cpu pool instead of the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self._cpu, fn, *args)
+
+    async def add_spec(self, data: bytes) -> str:
+        """Parse and store spec JSON bytes unless the same bytes are cached."""
+        key = await self._offload(lambda: raw_hash(data).hex())
+        if self.specs.get(key) is None:
+            self.specs.put(key, await self._offload(parse_spec, data))
+        return key
+
+    async def _resolve(self, body: Dict[str, Any], name: str) -> Tuple[str, Dict[str, Any]]:
+        value = body.get(name)
+        if isinstance(value, str):
+            spec = self.specs.get(value)
+            if spec is None:
+                raise RequestError(404, f"Unknown spec hash for '{name}': {value}")
+            return value, spec
+        if isinstance(value, dict):
+            key = await self._offload(lambda: canonical_hash(value).hex())
+            self.specs.put(key, value)
+            return key, value
+        raise RequestError(400, f"'{name}' must be a spec object or a spec hash")
+
+    async def compare(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        old_key, old = await self._resolve(body, "old")
+        new_key, new = await self._resolve(body, "new")
+        result = {"old": old_key, "new": new_key}
+        result.update(await self._offload(_compare, old, new))
+        return result
+
+    async def generate(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        old_key, old = await self._resolve(body, "old")
+        new_key, new = await self._resolve(body, "new")
+        changes, modules, leftover, jobs = await self._offload(self._plan, old, new)
+        outcomes = await asyncio.gather(*(self._run_job(job) for job in jobs))
+        errors, code = await self._offload(_assemble, modules, [r for r, _ in outcomes])
+        return {
+            "old": old_key,
+            "new": new_key,
+            "changes": [change_to_dict(c) for c in changes],
+            "templated": len(changes) - len(leftover),
+            "jobs": len(jobs),
+            "cached": sum(1 for result, _ in outcomes if result.cached),
+            "coalesced": sum(1 for _, coalesced in outcomes if coalesced),
+            "errors": errors,
+            "code": code,
+        }
+
+    def _plan(
+        self, old: Dict[str, Any], new: Dict[str, Any]
+    ) -> Tuple[List[Change], Dict[EndpointKey, str], List[Change], List[GenerationJob]]:
+        """Diff, templated modules, changes left for the LLM and their jobs."""
+        changes = diff_changes(old, new)
+        modules, leftover = generate_template_tests(changes, new)
+        jobs = build_generation_jobs(
+            leftover, old, new, self.context_tokens, self.max_prompt_tokens
+        )
+        return changes, modules, leftover, jobs
+
+    async def _run_job(self, job: GenerationJob) -> Tuple[GenerationResult, bool]:
+        """Run job on the pool, or wait for an identical one in flight (coalesced)."""
+        client = next(self._next_client)
+        key = cache_key(job.diff_summary, job.spec_snippet, PROMPT_VERSION, client.model)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            COALESCED_GENERATIONS.inc()
+            # shield: a disconnecting client must not cancel the shared call.
+            return await asyncio.shield(pending), True
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, run_generation_job, job, client, self.cache, False, self.repair_rounds
+        )
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future), False
+
+    # -- HTTP -----------------------------------------------------------------
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        """(status, content type, body) for one request."""
+        if path == "/metrics" and method == "GET":
+            return 200, PROMETHEUS_CONTENT_TYPE, REGISTRY.render().encode("utf-8")
+        if path == "/health" and method == "GET":
+            return 200, "application/json", _json({"status": "ok", "specs": len(self.specs)})
+        if path not in _ENDPOINTS:
+            raise RequestError(404, f"No endpoint {path}")
+        if method != "POST":
+            raise RequestError(405, f"{path} expects POST")
+
+        if path == "/specs":
+            return 200, "application/json", _json({"hash": await self.add_spec(body)})
+        request = await self._offload(_parse_request, body)
+        if path == "/compare":
+            result = await self.compare(request)
+        else:
+            result = await self.generate(request)
+        return 200, "application/json", await self._offload(_json, result)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._handlers.add(task)
+        try:
+            while True:
+                head = await read_head(reader)
+                if head is None:
+                    break
+                request_line, headers = head
+                method, target, _ = (request_line.split(" ", 2) + ["", ""])[:3]
+                path = target.split("?", 1)[0]
+                try:
+                    length = _content_length(headers)
+                except RequestError as exc:
+                    # Where the body ends is unknown, so answer and close.
+                    status, content_type, payload = (
+                        exc.status, "application/json", _json({"error": str(exc)})
+                    )
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, content_type, payload = await self._dispatch(
+                            method.upper(), path, body
+                        )
+                    except RequestError as exc:
+                        status, content_type, payload = (
+                            exc.status, "application/json", _json({"error": str(exc)})
+                        )
+                    except Exception as exc:
+                        # Report the failure and keep serving other requests.
+                        status, content_type, payload = (
+                            500, "application/json", _json({"error": repr(exc)})
+                        )
+                    keep_alive = headers.get("connection", "").lower() != "close"
+
+                endpoint = path if path in _ENDPOINTS else "other"
+                SERVICE_REQUESTS.inc(endpoint=endpoint, status=status)
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(payload)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+
+def _content_length(headers: Dict[str, str]) -> int:
+    """The request's Content-Length; RequestError if it is invalid or too big."""
+    value = headers.get("content-length", "").strip()
+    if not value:
+        return 0
+    if not (value.isascii() and value.isdigit()):
+        raise RequestError(400, f"Invalid Content-Length: {value!r}")
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Body over {MAX_BODY_BYTES} bytes")
+    return length
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _json(value: Any) -> bytes:
+    """
+    Compact JSON bytes. Long lists in a top-level object are encoded in
+    slices: json.dumps holds the GIL for the whole call, and a 200k-change
+    diff would otherwise stall the event loop for most of a second.
+    """
+    if not isinstance(value, dict):
+        return _dumps(value).encode("utf-8")
+    members = []
+    for key, item in value.items():
+        if isinstance(item, list) and len(item) > _JSON_SLICE:
+            encoded = ",".join(
+                _dumps(item[i:i + _JSON_SLICE])[1:-1] for i in range(0, len(item), _JSON_SLICE)
+            )
+            members.append(f"{_dumps(key)}:[{encoded}]")
+        else:
+            members.append(f"{_dumps(key)}:{_dumps(item)}")
+    return ("{" + ",".join(members) + "}").encode("utf-8")
+
+
+def _compare(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    changes = diff_changes(old, new)
+    return {
+        "changes": [change_to_dict(c) for c in changes],
+        "summary": [format_change(c) for c in changes],
+    }
+
+
+def _assemble(
+    modules: Dict[EndpointKey, str], results: List[GenerationResult]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Merge LLM results into the templated modules: (errors, merged code)."""
+    errors = []
+    for result in results:
+        if result.code is None:
+            path, method = result.key
+            errors.append({"path": path, "method": method, "error": result.error})
+            continue
+        previous = modules.get(result.key)
+        modules[result.key] = (
+            merge_test_modules([previous, result.code]) if previous else result.code
+        )
+    return errors, merge_test_modules(list(modules.values())) if modules else None
+
+
+async def run_service(service: ContractService) -> None:
+    """Run service until cancelled."""
+    async with service:
+        print(f"Serving compare and generate on {service.url}")
+        await asyncio.Event().wait()
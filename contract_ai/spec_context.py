@@ -0,0 +1,179 @@
+# spec_context.py
+"""
+Prompt-sized spec context for test generation.
+
+Dumping the whole spec and cutting it at N characters gives the model
+unrelated endpoints and often loses the changed ones. build_spec_context()
+instead selects:
+
+- the operations touched by the changes (removed ones from the old spec)
+- the component schemas they reference, followed transitively via $ref
+
+It serializes them as compact JSON and adds operations in change order
+until the token budget is spent. Operations that do not fit are listed by
+name under "omitted", so the model knows they exist.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from diff_engine import ENDPOINT_REMOVED, METHOD_REMOVED, Change
+from token_budget import estimate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 2048
+
+_REF_PREFIX = "#/components/schemas/"
+
+# (path, method, operation, component schemas the operation's $refs resolve in)
+_Operation = Tuple[str, str, Dict[str, Any], Dict[str, Any]]
+
+
+def _compact(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _cost(value: Any) -> int:
+    """Tokens value adds to the compact document, with its separator."""
+    return estimate_tokens(_compact(value)) + 1
+
+
+def _schemas(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return (spec.get("components") or {}).get("schemas") or {}
+
+
+def _collect_refs(node: Any, out: List[str]) -> None:
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith(_REF_PREFIX):
+            out.append(ref[len(_REF_PREFIX):])
+        for value in node.values():
+            _collect_refs(value, out)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_refs(value, out)
+
+
+def referenced_components(node: Any, schemas: Dict[str, Any]) -> List[str]:
+    """Names of the component schemas node references, transitively, in first-use order."""
+    found: List[str] = []
+    _collect_refs(node, found)
+    pending = deque(found)
+    seen: Dict[str, None] = {}
+    while pending:
+        name = pending.popleft()
+        if name in seen or name not in schemas:
+            continue
+        seen[name] = None
+        found.clear()
+        _collect_refs(schemas[name], found)
+        pending.extend(found)
+    return list(seen)
+
+
+def _changed_operations(
+    changes: Sequence[Change],
+    old_spec: Dict[str, Any],
+    new_spec: Dict[str, Any],
+) -> List[_Operation]:
+    """Operations touched by changes, in change order, each listed once."""
+    old_paths = old_spec.get("paths", {})
+    new_paths = new_spec.get("paths", {})
+    ops: Dict[Tuple[str, str], _Operation] = {}
+    for change in changes:
+        removed = change.kind in (ENDPOINT_REMOVED, METHOD_REMOVED)
+        sources = [(old_paths, old_spec), (new_paths, new_spec)]
+        if not removed:
+            sources.reverse()
+        if change.method:
+            methods: Sequence[str] = (change.method,)
+        else:
+            methods = change.methods or list(sources[0][0].get(change.path, {}))
+        for method in methods:
+            if (change.path, method) in ops:
+                continue
+            for paths, spec in sources:
+                op = paths.get(change.path, {}).get(method)
+                if op is not None:
+                    ops[(change.path, method)] = (change.path, method, op, _schemas(spec))
+                    break
+    return list(ops.values())
+
+
+def _all_operations(spec: Dict[str, Any]) -> List[_Operation]:
+    schemas = _schemas(spec)
+    return [
+        (path, method, op, schemas)
+        for path, methods in spec.get("paths", {}).items()
+        for method, op in methods.items()
+    ]
+
+
+def build_spec_context(
+    changes: Optional[Sequence[Change]],
+    old_spec: Dict[str, Any],
+    new_spec: Dict[str, Any],
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+) -> str:
+    """
+    Compact JSON of the operations touched by changes plus the components
+    they reference, within roughly max_tokens. changes=None selects every
+    operation of new_spec (in file order) under the same budget.
+
+    The first operation is always included; only if it alone exceeds the
+    budget is the output cut, and then it ends with "... (truncated)".
+    """
+    if changes is None:
+        ops = _all_operations(new_spec)
+    else:
+        ops = _changed_operations(changes, old_spec, new_spec)
+
+    paths: Dict[str, Dict[str, Any]] = {}
+    components: Dict[str, Any] = {}
+    omitted: List[str] = []
+    more = 0
+    # Envelope plus the "omitted" key and its "... and N more" entry
+    used = _cost(
+        {"version": new_spec.get("version"), "paths": {}, "components": {"schemas": {}}}
+    ) + 12
+
+    for path, method, op, schemas in ops:
+        if paths and used + 16 > max_tokens:
+            # No room for any operation: skip serializing the rest.
+            more += 1
+            continue
+        needed = [n for n in referenced_components(op, schemas) if n not in components]
+        cost = _cost(method) + _cost(op)
+        if path not in paths:
+            cost += _cost(path) + 1
+        cost += sum(_cost(n) + _cost(schemas[n]) for n in needed)
+
+        if paths and used + cost > max_tokens:
+            name_cost = _cost(f"{method} {path}")
+            if used + name_cost <= max_tokens:
+                omitted.append(f"{method} {path}")
+                used += name_cost
+            else:
+                more += 1
+            continue
+
+        paths.setdefault(path, {})[method] = op
+        for n in needed:
+            components[n] = schemas[n]
+        used += cost
+
+    doc: Dict[str, Any] = {"version": new_spec.get("version"), "paths": paths}
+    if components:
+        doc["components"] = {"schemas": components}
+    if more:
+        omitted.append(f"... and {more} more")
+    if omitted:
+        doc["omitted"] = omitted
+
+    text = _compact(doc)
+    tokens = estimate_tokens(text)
+    if tokens > max_tokens:
+        return text[: len(text) * max_tokens // tokens] + "\n... (truncated)"
+    return text
@@ -0,0 +1,194 @@
+# spec_index.py
+"""
+Persisted snapshot index of a spec, for fast repeated diffs.
+
+CI compares the same baseline spec against every PR. Instead of re-parsing
+the baseline each time, build_index() stores a compact SQLite snapshot:
+
+- paths:      one row per path with a hash of its raw bytes
+- operations: one row per (path, method) with a canonical hash and the
+              operation itself as compressed compact JSON
+- meta:       format version, spec version and the components section
+
+diff_engine.iter_diff_snapshot() then only hashes the new spec. A path
+whose raw bytes hash the same is skipped without being parsed, and within
+a changed path only operations whose canonical hash differs are diffed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import zlib
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from spec_stream import LazySpec
+
+INDEX_FORMAT_VERSION = 1
+
+# Raw-bytes test for "may reference a component"
+REF_MARKER = b'"$ref"'
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE paths (
+    ord INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    raw_hash BLOB NOT NULL
+);
+CREATE TABLE operations (
+    path TEXT NOT NULL,
+    method TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    has_ref INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (path, method)
+);
+"""
+
+
+class SnapshotError(RuntimeError):
+    """Raised when a snapshot index is missing, corrupt or of another version."""
+
+
+class OperationEntry(NamedTuple):
+    """Hash and $ref flag of one stored operation."""
+
+    hash: bytes
+    has_ref: bool
+
+
+def raw_hash(data: bytes) -> bytes:
+    """Hash of undecoded bytes; equal only for byte-identical entries."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def canonical_hash(value: Any) -> bytes:
+    """Hash of a decoded JSON value, independent of formatting and key order."""
+    text = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def contains_ref(value: Any) -> bool:
+    """True if value references a component (so component edits affect it)."""
+    if isinstance(value, dict):
+        return "$ref" in value or any(contains_ref(v) for v in value.values())
+    if isinstance(value, list):
+        return any(contains_ref(v) for v in value)
+    return False
+
+
+def build_index(spec_path: str, index_path: str) -> int:
+    """
+    Build a snapshot index of spec_path at index_path (replacing it).
+
+    Returns the number of operations stored.
+    """
+    out = Path(index_path)
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+
+    import sqlite3  # only snapshot commands need it; keeps plain compares fast
+
+    count = 0
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(_SCHEMA)
+        with LazySpec(spec_path) as spec:
+            components = spec.get("components") or {}
+            meta = {
+                "format_version": str(INDEX_FORMAT_VERSION),
+                "spec_version": json.dumps(spec.get("version")),
+                "components": json.dumps(components, separators=(",", ":")),
+                "components_hash": canonical_hash(components).hex(),
+            }
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+
+            for path, span in spec.path_spans().items():
+                raw = spec.raw(span)
+                conn.execute(
+                    "INSERT INTO paths (path, raw_hash) VALUES (?, ?)",
+                    (path, raw_hash(raw)),
+                )
+                for method, op in spec.load_span(span).items():
+                    body = json.dumps(op, separators=(",", ":")).encode("utf-8")
+                    conn.execute(
+                        "INSERT INTO operations VALUES (?, ?, ?, ?, ?)",
+                        (
+                            path,
+                            method,
+                            canonical_hash(op),
+                            int(contains_ref(op)),
+                            zlib.compress(body),
+                        ),
+                    )
+                    count += 1
+        conn.commit()
+    finally:
+        conn.close()
+
+    tmp.replace(out)
+    return count
+
+
+class SpecSnapshot:
+    """Read access to an index written by build_index()."""
+
+    def __init__(self, index_path: str) -> None:
+        import sqlite3
+
+        if not Path(index_path).is_file():
+            raise SnapshotError(f"Snapshot index not found: {index_path}")
+        self.index_path = index_path
+        uri = Path(index_path).resolve().as_uri() + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True)
+        try:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as exc:
+            self._conn.close()
+            raise SnapshotError(f"Not a snapshot index: {index_path}: {exc}") from exc
+
+        version = meta.get("format_version")
+        if version != str(INDEX_FORMAT_VERSION):
+            self._conn.close()
+            raise SnapshotError(
+                f"Snapshot index {index_path} has format {version}, expected "
+                f"{INDEX_FORMAT_VERSION}; rebuild it with the snapshot command."
+            )
+
+        self.spec_version: Any = json.loads(meta["spec_version"])
+        self.components: Dict[str, Any] = json.loads(meta["components"])
+        self.components_hash = bytes.fromhex(meta["components_hash"])
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "SpecSnapshot":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def path_hashes(self) -> Dict[str, bytes]:
+        """Map each path (in original order) to its raw-bytes hash."""
+        rows = self._conn.execute("SELECT path, raw_hash FROM paths ORDER BY ord")
+        return dict(rows)
+
+    def operations(self, path: str) -> Dict[str, OperationEntry]:
+        """Map each method of path to its stored hash and $ref flag."""
+        rows = self._conn.execute(
+            "SELECT method, hash, has_ref FROM operations WHERE path = ? ORDER BY rowid",
+            (path,),
+        )
+        return {method: OperationEntry(h, bool(ref)) for method, h, ref in rows}
+
+    def load_operation(self, path: str, method: str) -> Optional[Dict[str, Any]]:
+        """Decode one stored operation, or None if it is not in the snapshot."""
+        row = self._conn.execute(
+            "SELECT body FROM operations WHERE path = ? AND method = ?",
+            (path, method),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
@@ -0,0 +1,169 @@
+# spec_stream.py
+"""
+Lazy, mmap-backed access to large spec files.
+
+json.load() materializes the whole document. For 50-200 MB OpenAPI files
+that is slow and memory hungry, so LazySpec instead scans the mmap'd bytes
+for the top-level "paths" object and records the byte span of each path
+entry. Entries are decoded one at a time, on demand, with json.loads().
+
+Peak memory is therefore bounded by the largest single path entry plus a
+small (name -> span) table, not by the size of the document.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import re
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+Span = Tuple[int, int]
+
+_WS_RE = re.compile(rb"[ \t\r\n]*")
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR_RE = re.compile(rb"[^,}\] \t\r\n]+")
+# Consumes everything up to and including the next bracket in one C-level
+# match. Strings are matched whole so brackets inside them are never counted.
+# The quantifiers are possessive: a buffer that ends in a long bracket-free
+# run must fail in linear time, not backtrack through every way to split it.
+_TO_BRACKET_RE = re.compile(
+    rb'(?:[^"{}\[\]]++|"[^"\\]*+(?:\\.[^"\\]*+)*+")*+([{}\[\]])', re.DOTALL
+)
+
+
+class SpecFormatError(ValueError):
+    """Raised when the spec file is not a well-formed JSON object."""
+
+
+def _skip_ws(buf: Any, pos: int) -> int:
+    return _WS_RE.match(buf, pos).end()
+
+
+def _expect(buf: Any, pos: int, char: bytes) -> int:
+    if buf[pos:pos + 1] != char:
+        found = buf[pos:pos + 1] or b"end of file"
+        raise SpecFormatError(f"Expected {char!r} at byte {pos}, found {found!r}")
+    return pos + 1
+
+
+def _skip_string(buf: Any, pos: int) -> int:
+    m = _STRING_RE.match(buf, pos)
+    if m is None:
+        raise SpecFormatError(f"Unterminated string at byte {pos}")
+    return m.end()
+
+
+def _skip_value(buf: Any, pos: int) -> int:
+    """Return the offset just past the JSON value starting at pos."""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        return _skip_string(buf, pos)
+    if first not in (b"{", b"["):
+        m = _SCALAR_RE.match(buf, pos)
+        if m is None:
+            raise SpecFormatError(f"Expected a value at byte {pos}")
+        return m.end()
+
+    depth = 0
+    match = _TO_BRACKET_RE.match
+    while True:
+        m = match(buf, pos)
+        if m is None:
+            raise SpecFormatError("Unexpected end of file inside a container")
+        pos = m.end()
+        if m.group(1) in (b"{", b"["):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _iter_members(buf: Any, pos: int) -> Iterator[Tuple[str, Span]]:
+    """Yield (key, value span) for each member of the object starting at pos."""
+    pos = _skip_ws(buf, _expect(buf, _skip_ws(buf, pos), b"{"))
+    if buf[pos:pos + 1] == b"}":
+        return
+
+    while True:
+        key_end = _skip_string(buf, pos)
+        key = json.loads(buf[pos:key_end])
+        pos = _skip_ws(buf, _expect(buf, _skip_ws(buf, key_end), b":"))
+        value_end = _skip_value(buf, pos)
+        yield key, (pos, value_end)
+
+        pos = _skip_ws(buf, value_end)
+        if buf[pos:pos + 1] == b",":
+            pos = _skip_ws(buf, pos + 1)
+            continue
+        _expect(buf, pos, b"}")
+        return
+
+
+class LazySpec:
+    """
+    Read-only view of a spec file that decodes path entries on demand.
+
+    Use as a context manager:
+
+        with LazySpec("specs/spec_v2.json") as spec:
+            for path, methods in spec.iter_paths():
+                ...
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._buf: Any = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:  # empty file
+            self._file.close()
+            raise SpecFormatError(f"Spec file is empty: {path}") from exc
+        # Top-level members stay undecoded until asked for.
+        try:
+            self._members: Dict[str, Span] = dict(_iter_members(self._buf, 0))
+        except SpecFormatError:
+            self.close()
+            raise
+        self._paths_span: Optional[Span] = self._members.get("paths")
+
+    def close(self) -> None:
+        self._buf.close()
+        self._file.close()
+
+    def __enter__(self) -> "LazySpec":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Decode a top-level member (e.g. "version"), like dict.get()."""
+        span = self._members.get(key)
+        if span is None:
+            return default
+        return self.load_span(span)
+
+    def path_spans(self) -> Dict[str, Span]:
+        """Map each path name to the byte span of its (undecoded) entry."""
+        if self._paths_span is None:
+            return {}
+        return dict(_iter_members(self._buf, self._paths_span[0]))
+
+    def raw(self, span: Span) -> bytes:
+        """Return the undecoded bytes at span."""
+        start, end = span
+        return self._buf[start:end]
+
+    def load_span(self, span: Span) -> Any:
+        """Decode the JSON value at span."""
+        start, end = span
+        return json.loads(self._buf[start:end])
+
+    def iter_paths(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (path, methods) in file order, decoding one entry at a time."""
+        if self._paths_span is None:
+            return
+        for key, span in _iter_members(self._buf, self._paths_span[0]):
+            yield key, self.load_span(span)
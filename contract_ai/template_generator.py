@@ -0,0 +1,313 @@
+# template_generator.py
+"""
+Deterministic, template-based pytest generation for simple spec changes.
+
+Most changes reported by the diff engine map mechanically to the asserts
+in tests/test_contract_generated.py:
+- Field added/removed/type changed between "string", "number", "boolean"
+- New endpoints or methods whose response schema uses known types
+
+generate_template_tests() emits those tests directly in microseconds and
+hands back every change it cannot express (request bodies, nested field
+changes, removed endpoints, unknown types) so only those go to the LLM.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from diff_engine import (
+    Change,
+    ChangeIndex,
+    ENDPOINT_ADDED,
+    FIELD_ADDED,
+    FIELD_REMOVED,
+    FIELD_TYPE_CHANGED,
+    METHOD_ADDED,
+    RESPONSE,
+)
+
+# (path, method); method is "" for endpoint-level changes
+EndpointKey = Tuple[str, str]
+
+# Spec type -> Python type expression used in isinstance() asserts
+PY_TYPES = {
+    "string": "str",
+    "number": "(int, float)",
+    "boolean": "bool",
+    "object": "dict",
+    "array": "list",
+}
+PRIMITIVE_TYPES = frozenset(("string", "number", "boolean"))
+
+_REF_PREFIX = "#/components/schemas/"
+_MAX_DEPTH = 8
+
+
+def _resolve(node: Any, schemas: Dict[str, Any]) -> Any:
+    seen: Set[str] = set()
+    while isinstance(node, dict) and len(node) == 1 and "$ref" in node:
+        ref = node["$ref"]
+        if not isinstance(ref, str) or not ref.startswith(_REF_PREFIX):
+            return None
+        name = ref[len(_REF_PREFIX):]
+        if name not in schemas or name in seen:
+            return None
+        seen.add(name)
+        node = schemas[name]
+    return node
+
+
+def _type_name(node: Any) -> Optional[str]:
+    if isinstance(node, dict):
+        return "object"
+    if isinstance(node, list):
+        return "array"
+    return node if node in PRIMITIVE_TYPES else None
+
+
+def _supported(node: Any, schemas: Dict[str, Any], depth: int = 0) -> bool:
+    """True if every leaf of the schema resolves to a known type."""
+    node = _resolve(node, schemas)
+    if depth > _MAX_DEPTH or _type_name(node) is None:
+        return False
+    if isinstance(node, dict):
+        return all(_supported(v, schemas, depth + 1) for v in node.values())
+    if isinstance(node, list):
+        return all(_supported(v, schemas, depth + 1) for v in node[:1])
+    return True
+
+
+def _sample(node: Any, schemas: Dict[str, Any], name: str) -> Any:
+    """Deterministic sample value for a (supported) schema node."""
+    node = _resolve(node, schemas)
+    if isinstance(node, dict):
+        return {k: _sample(v, schemas, k) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_sample(node[0], schemas, name)] if node else []
+    if node == "number":
+        return 1.5
+    if node == "boolean":
+        return True
+    return f"sample-{name}"
+
+
+def _literal(value: Any) -> str:
+    """Python source for a sample value, with double-quoted strings."""
+    if isinstance(value, bool) or value is None:
+        return repr(value)
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, dict):
+        items = ", ".join(f"{json.dumps(k)}: {_literal(v)}" for k, v in value.items())
+        return "{" + items + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(_literal(v) for v in value) + "]"
+    return repr(value)
+
+
+def _assign_response(value: Dict[str, Any]) -> List[str]:
+    """`response = {...}` lines, one field per line when it gets long."""
+    line = f"response = {_literal(value)}"
+    if len(line) <= 72 or not value:
+        return [line]
+    items = [f"    {json.dumps(k)}: {_literal(v)}," for k, v in value.items()]
+    return ["response = {"] + items + ["}"]
+
+
+def _slug(text: str) -> str:
+    text = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", "_", text)
+    return "_".join(p for p in re.split(r"[^0-9A-Za-z]+", text) if p).lower()
+
+
+class _ModuleWriter:
+    """Accumulates test functions for one module with unique names."""
+
+    def __init__(self) -> None:
+        self.functions: List[str] = []
+        self._names: Set[str] = set()
+
+    def add(self, name: str, docstring: str, body: List[str]) -> None:
+        unique = name
+        n = 1
+        while unique in self._names:
+            n += 1
+            unique = f"{name}_{n}"
+        self._names.add(unique)
+        docstring = docstring.replace("\\", "\\\\").replace('"', '\\"')
+        lines = [f"def {unique}():", f'    """{docstring}"""'] + [
+            f"    {line}" if line else "" for line in body
+        ]
+        self.functions.append("\n".join(lines))
+
+    def render(self) -> str:
+        return "import pytest\n\n\n" + "\n\n\n".join(self.functions) + "\n"
+
+
+def _schema_test(
+    writer: _ModuleWriter,
+    path: str,
+    method: str,
+    schema: Dict[str, Any],
+    schemas: Dict[str, Any],
+    what: str,
+) -> None:
+    fields = _resolve(schema, schemas)
+    body = _assign_response(_sample(fields, schemas, "")) + [""]
+    body.append("# Validate required fields exist")
+    body += [f"assert {json.dumps(f)} in response" for f in fields]
+    body += ["", "# Validate types"]
+    body += [
+        f"assert isinstance(response[{json.dumps(f)}], "
+        f"{PY_TYPES[_type_name(_resolve(v, schemas))]})"
+        for f, v in fields.items()
+    ]
+    writer.add(
+        f"test_{_slug(path) or 'root'}_{method.lower()}_response_schema",
+        f"Test {path} {method} response matches the current spec ({what}).",
+        body,
+    )
+
+
+def _field_test(
+    writer: _ModuleWriter,
+    change: Change,
+    payload: Optional[Dict[str, Any]],
+) -> None:
+    path, method, field = change.path, change.method or "", change.field or ""
+    prefix = f"test_{_slug(path) or 'root'}_{method.lower()}_{_slug(field)}"
+    key = json.dumps(field)
+    quoted = f"'{json.dumps(field)[1:-1]}'"  # escaped for comments/docstrings
+
+    if change.kind == FIELD_REMOVED:
+        body = _assign_response(payload or {}) + [
+            "",
+            f"# Old spec had {quoted} ({change.old_type}) - clients must not rely on it",
+            f"assert {key} not in response",
+        ]
+        writer.add(
+            f"{prefix}_field_removed",
+            f"Test that removed field {quoted} is no longer in {path} {method}.",
+            body,
+        )
+        return
+
+    if payload is None:
+        payload = {field: _sample(change.new_type, {}, field)}
+    py_type = PY_TYPES[change.new_type]
+
+    if change.kind == FIELD_ADDED:
+        body = _assign_response(payload) + [
+            "",
+            f"# Old spec didn't have {quoted} - new spec requires it",
+            f"assert {key} in response",
+            f"assert isinstance(response[{key}], {py_type})",
+        ]
+        writer.add(
+            f"{prefix}_field_added",
+            f"Test that new field {quoted} is present in {path} {method}.",
+            body,
+        )
+        return
+
+    body = [
+        f"response = {{{key}: {_literal(payload[field])}}}",
+        "",
+        f"# New spec expects {change.new_type}",
+        f"assert isinstance(response[{key}], {py_type})",
+        "",
+        f"# Old clients expecting {change.old_type} would fail:",
+        f"# assert isinstance(response[{key}], {PY_TYPES[change.old_type]})",
+    ]
+    writer.add(
+        f"{prefix}_type_change",
+        f"Test that {quoted} in {path} {method} is now {change.new_type} "
+        f"(was {change.old_type}).",
+        body,
+    )
+
+
+def _response_schema(spec: Dict[str, Any], path: str, method: str) -> Any:
+    op = spec.get("paths", {}).get(path, {}).get(method) or {}
+    return op.get("response", {}).get("schema", {})
+
+
+def _is_simple_field_change(change: Change) -> bool:
+    return (
+        change.kind in (FIELD_ADDED, FIELD_REMOVED, FIELD_TYPE_CHANGED)
+        and change.location == RESPONSE
+        and change.field is not None
+        and "." not in change.field
+        and "[" not in change.field
+        and (change.old_type is None or change.old_type in PRIMITIVE_TYPES)
+        and (change.new_type is None or change.new_type in PRIMITIVE_TYPES)
+    )
+
+
+def _emit_new_operation(
+    writer: _ModuleWriter,
+    change: Change,
+    new_spec: Dict[str, Any],
+    schemas: Dict[str, Any],
+) -> bool:
+    """Schema tests for an added endpoint/method; False if not templatable."""
+    if change.kind == ENDPOINT_ADDED:
+        methods, what = change.methods, "new endpoint"
+    else:
+        methods, what = (change.method or "",), "new method"
+
+    op_schemas = [_response_schema(new_spec, change.path, m) for m in methods]
+    if not all(
+        _supported(schema, schemas) and isinstance(_resolve(schema, schemas), dict)
+        for schema in op_schemas
+    ):
+        return False
+
+    for m, schema in zip(methods, op_schemas):
+        _schema_test(writer, change.path, m, schema, schemas, what)
+    return True
+
+
+def generate_template_tests(
+    changes: Sequence[Change],
+    new_spec: Dict[str, Any],
+) -> Tuple[Dict[EndpointKey, str], List[Change]]:
+    """
+    Generate pytest modules for the changes that map to fixed templates.
+
+    Returns (modules, leftover): one module per (path, method) group that
+    had at least one templated change, and the changes that still need the
+    LLM, in their original order.
+    """
+    schemas = (new_spec.get("components") or {}).get("schemas") or {}
+    modules: Dict[EndpointKey, str] = {}
+    handled: Set[int] = set()
+
+    for key, group in ChangeIndex(changes).by_endpoint().items():
+        writer = _ModuleWriter()
+        path, method = key
+        payload = None
+        if method:
+            schema = _response_schema(new_spec, path, method)
+            if _supported(schema, schemas) and isinstance(_resolve(schema, schemas), dict):
+                payload = _sample(_resolve(schema, schemas), schemas, "")
+                if any(_is_simple_field_change(c) for c in group):
+                    _schema_test(writer, path, method, schema, schemas, "updated schema")
+
+        for change in group:
+            if change.kind in (ENDPOINT_ADDED, METHOD_ADDED):
+                if _emit_new_operation(writer, change, new_spec, schemas):
+                    handled.add(id(change))
+            elif _is_simple_field_change(change):
+                if payload is None and change.kind == FIELD_REMOVED:
+                    continue  # nothing meaningful to assert against
+                _field_test(writer, change, payload)
+                handled.add(id(change))
+
+        if writer.functions:
+            modules[key] = writer.render()
+
+    leftover = [c for c in changes if id(c) not in handled]
+    return modules, leftover
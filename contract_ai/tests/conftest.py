@@ -0,0 +1,7 @@
+# conftest.py
+"""Make the flat contract_ai modules importable however pytest is started."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
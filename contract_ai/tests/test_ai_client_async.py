@@ -0,0 +1,151 @@
+# test_ai_client_async.py
+"""AsyncOllamaClient against an asyncio stub: fan-out, deadlines, streams and reuse."""
+
+import asyncio
+import json
+import re
+import socket
+
+import pytest
+
+from ai_client_async import AsyncOllamaClient, generate_many
+from ai_client_ollama import OllamaError, OllamaUnavailableError
+from replay import read_head
+
+CHUNKS = ["def test_", "streamed():\n", "    pass\n"]
+
+
+class _Ollama:
+    """
+    Keep-alive /api/chat stub. Answers after delay seconds, echoing the
+    prompt's "diff N" line, with HTTP 400 when the prompt mentions "fail",
+    and streams CHUNKS chunked when asked.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/api/chat"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while (head := await read_head(reader)) is not None:
+                payload = json.loads(await reader.readexactly(int(head[1]["content-length"])))
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+                writer.write(self._answer(payload))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _answer(self, payload):
+        prompt = payload["messages"][-1]["content"]
+        if "fail" in prompt:
+            body = b'{"error": "bad prompt"}'
+            return b"HTTP/1.1 400 Bad Request\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+        if not payload["stream"]:
+            echo = re.search(r"diff \d+", prompt)
+            content = f"# {echo.group() if echo else 'ok'}\n"
+            body = json.dumps({"message": {"content": content}, "done": True}).encode()
+            return b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+        lines = [{"message": {"content": c}, "done": False} for c in CHUNKS]
+        lines.append({"message": {"content": ""}, "done": True, "eval_count": 3})
+        out = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        for line in lines:
+            data = json.dumps(line).encode() + b"\n"
+            out += b"%x\r\n%s\r\n" % (len(data), data)
+        return out + b"0\r\n\r\n"
+
+
+def _run(test, delay=0.0, **kwargs):
+    async def main():
+        async with _Ollama(delay) as ollama:
+            async with AsyncOllamaClient(ollama.url, "stub", **kwargs) as client:
+                return await test(client), ollama
+
+    return asyncio.run(main())
+
+
+def test_generate_many_is_bounded_ordered_and_isolates_failures():
+    jobs = [(f"diff {i}" if i != 3 else "fail", "{}") for i in range(6)]
+
+    results, ollama = _run(lambda client: generate_many(client, jobs), delay=0.05,
+                           max_concurrency=2)
+
+    assert ollama.max_in_flight == 2
+    # Two slots; the connection that answered 400 is dropped, not reused.
+    assert ollama.connections == 3
+    assert isinstance(results[3], OllamaError) and "HTTP 400" in str(results[3])
+    assert not isinstance(results[3], OllamaUnavailableError)
+    assert [r for i, r in enumerate(results) if i != 3] == [
+        f"# diff {i}\n" for i in (0, 1, 2, 4, 5)
+    ]
+
+
+def test_deadline_drops_the_connection():
+    async def test(client):
+        with pytest.raises(OllamaError, match="deadline"):
+            await client.chat([{"role": "user", "content": "slow"}], timeout_seconds=0.05)
+        return client._idle
+
+    idle, ollama = _run(test, delay=0.2)
+
+    assert idle == []
+    assert ollama.connections == 1
+
+
+def test_cancelled_request_is_not_reused():
+    async def test(client):
+        task = asyncio.ensure_future(client.chat([{"role": "user", "content": "slow"}]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        idle = list(client._idle)
+        return idle, await client.chat([{"role": "user", "content": "next"}])
+
+    (idle, answer), ollama = _run(test, delay=0.2)
+
+    assert idle == []
+    assert answer == "# ok\n"
+    assert ollama.connections == 2
+
+
+def test_streams_yield_chunks_and_reuse_the_connection():
+    async def test(client):
+        return [
+            [chunk async for chunk in client.stream_chat([{"role": "user", "content": "s"}])]
+            for _ in range(2)
+        ]
+
+    streams, ollama = _run(test)
+
+    assert streams == [CHUNKS, CHUNKS]
+    assert ollama.connections == 1
+
+
+def test_unreachable_host_is_unavailable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/api/chat"
+
+    async def main():
+        async with AsyncOllamaClient(url, "stub") as client:
+            await client.chat([{"role": "user", "content": "hi"}])
+
+    with pytest.raises(OllamaUnavailableError, match="Failed to reach Ollama"):
+        asyncio.run(main())
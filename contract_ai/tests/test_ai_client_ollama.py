@@ -0,0 +1,125 @@
+# test_ai_client_ollama.py
+"""OllamaClient against a stub /api/chat: keep-alive, retries and error mapping."""
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai_client_ollama import (
+    OllamaClient,
+    OllamaError,
+    OllamaUnavailableError,
+    get_client,
+)
+
+ANSWER = {
+    "model": "stub",
+    "message": {"role": "assistant", "content": "def test_ok():\n    pass\n"},
+    "done": True,
+    "prompt_eval_count": 12,
+    "eval_count": 5,
+    "eval_duration": 2_000_000_000,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.client_address[1], payload))
+        status, body = self.server.answers.pop(0) if self.server.answers else (200, ANSWER)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.requests = []
+    server.answers = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(ollama, **kwargs):
+    return OllamaClient(ollama.url, model="stub", backoff_seconds=0, **kwargs)
+
+
+def test_calls_reuse_one_connection_and_record_usage(ollama):
+    with _client(ollama) as client:
+        codes = [client.generate_test_code("diff", "{}") for _ in range(3)]
+
+    assert codes == [ANSWER["message"]["content"]] * 3
+    assert len({port for port, _ in ollama.requests}) == 1
+    payload = ollama.requests[0][1]
+    assert (payload["model"], payload["stream"]) == ("stub", False)
+    assert [m["role"] for m in payload["messages"]] == ["system", "user"]
+    usage = client.usage.entries[0]
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.eval_seconds) == (12, 5, 2.0)
+    assert usage.estimated_prompt_tokens > 0
+
+
+def test_5xx_is_retried(ollama):
+    ollama.answers = [(503, {"error": "busy"}), (502, {"error": "busy"})]
+
+    with _client(ollama, retries=2) as client:
+        assert client.chat([{"role": "user", "content": "hi"}]) == ANSWER["message"]["content"]
+
+    assert len(ollama.requests) == 3
+
+
+def test_5xx_after_retries_is_unavailable(ollama):
+    ollama.answers = [(503, {"error": "busy"})] * 3
+
+    with _client(ollama, retries=1) as client:
+        with pytest.raises(OllamaUnavailableError, match="HTTP 503"):
+            client.chat([{"role": "user", "content": "hi"}])
+
+    assert len(ollama.requests) == 2
+
+
+@pytest.mark.parametrize(
+    "answer, message",
+    [
+        ((400, {"error": "bad model"}), "HTTP 400"),
+        ((200, {"message": {}}), "missing 'message.content'"),
+    ],
+)
+def test_bad_requests_and_responses_are_not_retried(ollama, answer, message):
+    ollama.answers = [answer]
+
+    with _client(ollama) as client:
+        with pytest.raises(OllamaError, match=message) as exc_info:
+            client.chat([{"role": "user", "content": "hi"}])
+
+    assert not isinstance(exc_info.value, OllamaUnavailableError)
+    assert len(ollama.requests) == 1
+
+
+def test_unreachable_host_is_unavailable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/api/chat"
+
+    with OllamaClient(url, retries=0) as client:
+        with pytest.raises(OllamaUnavailableError, match="Failed to reach Ollama"):
+            client.chat([{"role": "user", "content": "hi"}])
+
+
+def test_shared_client_per_url(ollama):
+    assert get_client(ollama.url) is get_client(ollama.url)
+    assert get_client(ollama.url) is not get_client(ollama.url + "?other")
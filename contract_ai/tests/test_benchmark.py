@@ -0,0 +1,89 @@
+# test_benchmark.py
+"""Benchmark harness: synthetic specs, baseline comparison and the startup check."""
+
+import json
+
+from benchmark import (
+    COMPARE_FORBIDDEN_IMPORTS,
+    FAKE_TEST_MODULE,
+    FakeOllama,
+    _generate_tests,
+    check_startup,
+    compare_to_baseline,
+    make_spec_pair,
+    run_benchmarks,
+)
+from diff_engine import diff_changes
+
+PARAMS = {"endpoints": 20, "fields": 6, "depth": 2, "change_rate": 0.3, "seed": 1,
+          "repeat": 1, "generate_endpoints": 2, "latency": 0.0, "skip_generate": True}
+
+
+def _results(**medians):
+    return {"meta": {"params": PARAMS},
+            "results": {case: {"median": m} for case, m in medians.items()}}
+
+
+def test_spec_pairs_are_reproducible_and_changed():
+    old, new = make_spec_pair(20, 6, depth=2, change_rate=0.3, seed=1)
+
+    assert (old, new) == make_spec_pair(20, 6, depth=2, change_rate=0.3, seed=1)
+    assert old != make_spec_pair(20, 6, depth=2, change_rate=0.3, seed=2)[0]
+    assert len(old["paths"]) == 20
+    assert diff_changes(old, new)
+    assert diff_changes(*make_spec_pair(20, 6, change_rate=0.0)) == []
+
+
+def test_baseline_flags_only_real_regressions(capsys):
+    baseline = _results(fast=0.001, diff=0.1, load=0.1)
+    current = _results(fast=0.002, diff=0.13, load=0.11, new_case=0.5)
+
+    assert compare_to_baseline(current, baseline, threshold=0.2) == ["diff"]
+    out = capsys.readouterr().out
+    assert "diff" in out and "REGRESSION" in out
+    assert "Warning" not in out
+
+
+def test_baseline_with_other_parameters_warns(capsys):
+    baseline = {"meta": {"params": dict(PARAMS, seed=2)}, "results": {}}
+
+    compare_to_baseline(_results(diff=0.1), baseline, threshold=0.2)
+
+    assert "different spec or latency parameters" in capsys.readouterr().out
+
+
+def test_startup_check_reports_budget_and_forbidden_imports():
+    startup = {"import_ms": 90.0, "modules": {"cli": 80.0, "json": 10.0},
+               "forbidden": [COMPARE_FORBIDDEN_IMPORTS[0]]}
+
+    problems = check_startup(startup, budget_ms=75)
+
+    assert problems[0].startswith("compare imports took 90.0ms, over the 75ms budget")
+    assert "(slowest: cli 80.0ms, json 10.0ms)" in problems[0]
+    assert problems[1] == f"compare imported {COMPARE_FORBIDDEN_IMPORTS[0]}, which it never uses"
+    assert check_startup(dict(startup, forbidden=[]), budget_ms=100) == []
+
+
+def test_generate_case_runs_against_the_fake_ollama(tmp_path):
+    old, new = make_spec_pair(2, 4, change_rate=0.5, seed=3)
+    paths = []
+    for name, spec in (("old", old), ("new", new)):
+        paths.append(str(tmp_path / f"{name}.json"))
+        (tmp_path / f"{name}.json").write_text(json.dumps(spec))
+    output = tmp_path / "test_out.py"
+
+    with FakeOllama(latency=0.0) as fake:
+        _generate_tests(*paths, str(output), fake.url)
+
+    assert "def test_generated_contract():" in output.read_text()
+    assert FAKE_TEST_MODULE.splitlines()[0] in output.read_text()
+
+
+def test_run_benchmarks_document():
+    doc = run_benchmarks(PARAMS)
+
+    assert set(doc["results"]) == {"load_spec", "diff_specs", "json_snippet_for_model",
+                                   "startup_compare"}
+    assert all(r["runs"] == 1 and r["min"] <= r["median"] for r in doc["results"].values())
+    assert doc["meta"]["params"] == PARAMS and doc["meta"]["changes"] > 0
+    assert doc["meta"]["startup"]["forbidden"] == []
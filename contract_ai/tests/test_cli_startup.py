@@ -0,0 +1,69 @@
+# test_cli_startup.py
+"""CLI startup: compare loads only what it needs, and every command still parses."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import cli
+from benchmark import COMPARE_FORBIDDEN_IMPORTS
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Run a command in a fresh interpreter and print the forbidden modules it loaded.
+_PROBE = """
+import sys
+sys.argv = ["cli.py", *sys.argv[1:]]
+import cli
+try:
+    cli.main()
+except SystemExit:
+    pass
+print(" ".join(m for m in {forbidden!r} if m in sys.modules), file=sys.stderr)
+"""
+
+
+def _loaded(*argv):
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(forbidden=COMPARE_FORBIDDEN_IMPORTS), *argv],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout, result.stderr.splitlines()[-1].split()
+
+
+@pytest.mark.parametrize("extra", [(), ("--streaming",), ("--format", "sarif")])
+def test_compare_imports_no_other_commands_modules(extra):
+    out, loaded = _loaded("compare", "--old", "specs/spec_v1.json",
+                          "--new", "specs/spec_v2.json", *extra)
+
+    assert "amount" in out
+    assert loaded == []
+
+
+def test_probe_sees_what_other_commands_load():
+    _, loaded = _loaded("generate-tests", "--help")
+
+    assert "requests" in loaded
+
+
+@pytest.mark.parametrize("name", [name for name, _, _ in cli.COMMANDS])
+def test_every_command_has_help(name):
+    help_text = subprocess.run(
+        [sys.executable, "cli.py", name, "--help"], cwd=ROOT, capture_output=True, text=True
+    ).stdout
+
+    assert help_text.startswith(f"usage: cli.py {name}")
+    assert "--profile" in help_text and "--metrics-port" in help_text
+
+
+def test_only_the_selected_command_gets_its_arguments():
+    argv = ["generate-tests", "--old", "a.json", "--new", "b.json", "--output", "t.py"]
+
+    with pytest.raises(SystemExit):
+        cli.build_parser("compare").parse_args(argv)
+    assert cli.build_parser("generate-tests").parse_args(argv).func is cli.cmd_generate_tests
+    assert "usage:" in cli.build_parser().format_help()
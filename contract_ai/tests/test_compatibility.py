@@ -0,0 +1,189 @@
+# test_compatibility.py
+"""Compatibility rules, the compiled RuleSet and compare --fail-on."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from compatibility import (
+    BREAKING,
+    DEFAULT_RULES,
+    NON_BREAKING,
+    UNMATCHED,
+    Rule,
+    RuleSet,
+    classify,
+    load_rules,
+)
+from diff_engine import (
+    ENDPOINT_ADDED,
+    ENDPOINT_REMOVED,
+    FIELD_ADDED,
+    FIELD_REMOVED,
+    FIELD_TYPE_CHANGED,
+    METHOD_ADDED,
+    METHOD_REMOVED,
+    REQUEST,
+    RESPONSE,
+    Change,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _field(kind, location=RESPONSE, old_type=None, new_type=None):
+    return Change(kind, "/w", "POST", "qty", old_type, new_type, location=location)
+
+
+@pytest.mark.parametrize(
+    "change, severity, rule",
+    [
+        (Change(ENDPOINT_ADDED, "/w", methods=("GET",)), NON_BREAKING, "endpoint-added"),
+        (Change(ENDPOINT_REMOVED, "/w", methods=("GET",)), BREAKING, "endpoint-removed"),
+        (Change(METHOD_ADDED, "/w", "POST"), NON_BREAKING, "method-added"),
+        (Change(METHOD_REMOVED, "/w", "POST"), BREAKING, "method-removed"),
+        (_field(FIELD_ADDED), NON_BREAKING, "response-field-added"),
+        (_field(FIELD_ADDED, REQUEST), BREAKING, "request-field-added"),
+        (_field(FIELD_REMOVED), BREAKING, "response-field-removed"),
+        (_field(FIELD_REMOVED, REQUEST), NON_BREAKING, "request-field-removed"),
+        (_field(FIELD_TYPE_CHANGED, REQUEST, "integer", "number"), NON_BREAKING,
+         "request-type-widened"),
+        (_field(FIELD_TYPE_CHANGED, REQUEST, "number", "integer"), BREAKING, "type-changed"),
+        (_field(FIELD_TYPE_CHANGED, RESPONSE, "integer", "number"), BREAKING, "type-changed"),
+    ],
+)
+def test_default_rules(change, severity, rule):
+    assert RuleSet().match(change).name == rule
+    assert classify(change) == severity
+
+
+def test_unmatched_changes_are_breaking():
+    rules = RuleSet([Rule("only-adds", ENDPOINT_ADDED, NON_BREAKING)])
+    change = Change(METHOD_ADDED, "/w", "POST")
+
+    assert rules.match(change) is UNMATCHED
+    assert rules.classify(change) == BREAKING
+
+
+def test_rules_in_front_override_the_defaults():
+    relaxed = Rule("types-ok", FIELD_TYPE_CHANGED, NON_BREAKING, RESPONSE)
+    rules = RuleSet([relaxed, *DEFAULT_RULES])
+
+    assert rules.match(_field(FIELD_TYPE_CHANGED, RESPONSE, "number", "string")) is relaxed
+    # The override is limited to the response; requests keep the defaults.
+    request_change = _field(FIELD_TYPE_CHANGED, REQUEST, "number", "string")
+    assert rules.match(request_change).name == "type-changed"
+
+
+def test_dispatch_tables():
+    rules = RuleSet()
+
+    assert rules._fixed[(FIELD_ADDED, REQUEST)].name == "request-field-added"
+    assert rules._fixed[(ENDPOINT_REMOVED, RESPONSE)].name == "endpoint-removed"
+    # Only the guarded kind needs its candidates tried in order, and the
+    # list stops at the first unconditional rule.
+    assert list(rules._guarded) == [(FIELD_TYPE_CHANGED, REQUEST)]
+    assert [r.name for r in rules._guarded[(FIELD_TYPE_CHANGED, REQUEST)]] == [
+        "request-type-widened",
+        "type-changed",
+    ]
+    assert rules._fixed[(FIELD_TYPE_CHANGED, RESPONSE)].name == "type-changed"
+
+
+def test_rule_set_rejects_unknown_severity_and_location():
+    with pytest.raises(ValueError, match="unknown severity"):
+        RuleSet([Rule("x", FIELD_ADDED, "minor")])
+    with pytest.raises(ValueError, match="unknown location"):
+        RuleSet([Rule("x", FIELD_ADDED, BREAKING, "header")])
+
+
+def _rules_file(tmp_path, entries):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(entries))
+    return str(path)
+
+
+def test_load_rules(tmp_path):
+    path = _rules_file(
+        tmp_path,
+        [
+            {"kind": FIELD_ADDED, "severity": NON_BREAKING, "location": REQUEST},
+            {"name": "no-removals", "kind": ENDPOINT_REMOVED, "severity": NON_BREAKING,
+             "description": "Removals are announced."},
+        ],
+    )
+
+    assert load_rules(path) == [
+        Rule("custom-0", FIELD_ADDED, NON_BREAKING, REQUEST),
+        Rule("no-removals", ENDPOINT_REMOVED, NON_BREAKING,
+             description="Removals are announced."),
+    ]
+
+
+@pytest.mark.parametrize(
+    "entries, message",
+    [
+        ({"kind": FIELD_ADDED}, "expected a JSON list"),
+        ([{"kind": FIELD_ADDED}], "needs at least 'kind' and 'severity'"),
+        (["breaking"], "needs at least 'kind' and 'severity'"),
+        ([{"kind": "field_renamed", "severity": BREAKING}], "unknown kind"),
+    ],
+)
+def test_load_rules_rejects_bad_files(tmp_path, entries, message):
+    with pytest.raises(ValueError, match=message):
+        load_rules(_rules_file(tmp_path, entries))
+
+
+def _compare(*args):
+    return subprocess.run(
+        [sys.executable, "cli.py", "compare", "--old", "specs/spec_v1.json", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_compare_fail_on_breaking_exits_1():
+    result = _compare("--new", "specs/spec_v2.json", "--fail-on", "breaking")
+
+    assert result.returncode == 1
+    assert "1 breaking change(s) found (--fail-on breaking)" in result.stderr
+
+
+def test_compare_without_fail_on_exits_0():
+    assert _compare("--new", "specs/spec_v2.json").returncode == 0
+
+
+def test_compare_fail_on_any_ignores_severity(tmp_path):
+    rules = _rules_file(tmp_path, [{"kind": FIELD_TYPE_CHANGED, "severity": NON_BREAKING}])
+
+    relaxed = _compare("--new", "specs/spec_v2.json", "--rules", rules, "--fail-on", "breaking")
+    any_change = _compare("--new", "specs/spec_v2.json", "--rules", rules, "--fail-on", "any")
+    unchanged = _compare("--new", "specs/spec_v1.json", "--fail-on", "any")
+
+    assert relaxed.returncode == 0
+    assert any_change.returncode == 1
+    assert "4 change(s) found (--fail-on any)" in any_change.stderr
+    assert unchanged.returncode == 0
+
+
+def test_compare_json_marks_severity_per_change():
+    result = _compare("--new", "specs/spec_v2.json", "--format", "json")
+    report = json.loads(result.stdout)
+
+    assert report["summary"] == {"changes": 4, "breaking": 1, "non_breaking": 3}
+    assert [c["rule"] for c in report["changes"] if c["severity"] == BREAKING] == [
+        "type-changed"
+    ]
+
+
+def test_compare_rejects_an_invalid_rules_file(tmp_path):
+    rules = _rules_file(tmp_path, [{"kind": "nope", "severity": BREAKING}])
+
+    result = _compare("--new", "specs/spec_v2.json", "--rules", rules)
+
+    assert result.returncode == 1
+    assert result.stdout.startswith("Error: invalid rules file:")
@@ -0,0 +1,231 @@
+# test_diff_engine.py
+"""Change records, their rendering and ChangeIndex."""
+
+from diff_engine import (
+    ENDPOINT_ADDED,
+    ENDPOINT_REMOVED,
+    FIELD_ADDED,
+    FIELD_REMOVED,
+    FIELD_TYPE_CHANGED,
+    METHOD_ADDED,
+    METHOD_REMOVED,
+    REQUEST,
+    Change,
+    ChangeIndex,
+    change_to_dict,
+    diff_changes,
+    diff_specs,
+    format_change,
+    _SchemaDiffer,
+)
+
+
+def _op(schema):
+    return {"response": {"status": 200, "schema": schema}}
+
+
+OLD = {
+    "paths": {
+        "/widget": {"GET": _op({"id": "string", "amount": "number"})},
+        "/order": {"GET": _op({"id": "string"}), "DELETE": _op({})},
+        "/legacy": {"GET": _op({})},
+    }
+}
+NEW = {
+    "paths": {
+        "/widget": {"GET": _op({"id": "string", "amount": "string", "url": "string"})},
+        "/order": {"GET": _op({}), "POST": _op({})},
+        "/health": {"GET": _op({"status": "string"})},
+    }
+}
+
+
+def test_diff_changes_returns_records_in_documented_order():
+    assert diff_changes(OLD, NEW) == [
+        Change(ENDPOINT_ADDED, "/health", methods=("GET",)),
+        Change(ENDPOINT_REMOVED, "/legacy", methods=("GET",)),
+        Change(METHOD_ADDED, "/order", "POST"),
+        Change(METHOD_REMOVED, "/order", "DELETE"),
+        Change(FIELD_REMOVED, "/order", "GET", "id", old_type="string"),
+        Change(FIELD_ADDED, "/widget", "GET", "url", new_type="string"),
+        Change(FIELD_TYPE_CHANGED, "/widget", "GET", "amount", "number", "string"),
+    ]
+
+
+def test_identical_specs_have_no_changes():
+    assert diff_changes(OLD, OLD) == []
+
+
+def test_format_change_keeps_the_historical_wording():
+    assert diff_specs(OLD, NEW) == [
+        "Endpoint added: /health ['GET']",
+        "Endpoint removed: /legacy ['GET']",
+        "Endpoint /order: method POST added",
+        "Endpoint /order: method DELETE removed",
+        "Endpoint /order GET: field 'id' removed (type: string)",
+        "Endpoint /widget GET: field 'url' added (type: string)",
+        "Endpoint /widget GET: field 'amount' type changed from number to string",
+    ]
+
+
+def test_change_to_dict_has_only_set_attributes():
+    change = Change(FIELD_TYPE_CHANGED, "/widget", "GET", "amount", "number", "string")
+    assert change_to_dict(change) == {
+        "kind": FIELD_TYPE_CHANGED,
+        "path": "/widget",
+        "method": "GET",
+        "field": "amount",
+        "location": "response",
+        "old_type": "number",
+        "new_type": "string",
+        "description": format_change(change),
+    }
+    added = change_to_dict(Change(ENDPOINT_ADDED, "/health", methods=("GET",)))
+    assert added == {
+        "kind": ENDPOINT_ADDED,
+        "path": "/health",
+        "methods": ["GET"],
+        "description": "Endpoint added: /health ['GET']",
+    }
+
+
+def test_change_index_filters_keep_diff_order():
+    changes = diff_changes(OLD, NEW)
+    index = ChangeIndex(changes)
+
+    assert len(index) == len(changes)
+    assert [c.kind for c in index.for_path("/order")] == [
+        METHOD_ADDED,
+        METHOD_REMOVED,
+        FIELD_REMOVED,
+    ]
+    assert [c.path for c in index.for_method("GET")] == ["/order", "/widget", "/widget"]
+    assert index.for_field("amount") == [changes[-1]]
+    assert index.for_kind(ENDPOINT_REMOVED) == [changes[1]]
+    assert index.for_path("/missing") == []
+
+
+def test_change_index_groups_by_endpoint():
+    groups = ChangeIndex(diff_changes(OLD, NEW)).by_endpoint()
+
+    assert set(groups) == {
+        ("/health", ""),
+        ("/legacy", ""),
+        ("/order", "POST"),
+        ("/order", "DELETE"),
+        ("/order", "GET"),
+        ("/widget", "GET"),
+    }
+    assert [c.field for c in groups[("/widget", "GET")]] == ["url", "amount"]
+
+
+# -- nested schemas, arrays, $ref components and request bodies ---------------
+
+
+def _ref(name):
+    return {"$ref": f"#/components/schemas/{name}"}
+
+
+def _spec(paths, schemas=None):
+    spec = {"paths": paths}
+    if schemas is not None:
+        spec["components"] = {"schemas": schemas}
+    return spec
+
+
+def test_nested_fields_get_dotted_names():
+    old = _spec({"/o": {"GET": _op({"customer": {"address": {"city": "string"}}})}})
+    address = {"city": "number", "zip": "string"}
+    new = _spec({"/o": {"GET": _op({"customer": {"address": address}})}})
+
+    assert diff_changes(old, new) == [
+        Change(FIELD_ADDED, "/o", "GET", "customer.address.zip", new_type="string"),
+        Change(FIELD_TYPE_CHANGED, "/o", "GET", "customer.address.city", "string", "number"),
+    ]
+
+
+def test_array_items_are_diffed_with_brackets():
+    old = _spec({"/o": {"GET": _op({"items": [{"sku": "string"}], "tags": ["string"]})}})
+    new = _spec(
+        {"/o": {"GET": _op({"items": [{"sku": "string", "qty": "number"}], "tags": "string"})}}
+    )
+
+    assert diff_changes(old, new) == [
+        Change(FIELD_ADDED, "/o", "GET", "items[].qty", new_type="number"),
+        Change(FIELD_TYPE_CHANGED, "/o", "GET", "tags", "array", "string"),
+    ]
+
+
+def test_shared_component_change_is_reported_per_use():
+    money_old = {"amount": "number", "currency": "string"}
+    money_new = {"amount": "string", "currency": "string"}
+    paths = {
+        "/a": {"GET": _op({"price": _ref("Money")})},
+        "/b": {"GET": _op({"total": _ref("Money")})},
+    }
+
+    old = _spec(paths, {"Money": money_old})
+    new = _spec(paths, {"Money": money_new})
+
+    changes = diff_changes(old, new)
+
+    assert [(c.path, c.field) for c in changes] == [
+        ("/a", "price.amount"),
+        ("/b", "total.amount"),
+    ]
+    assert all((c.old_type, c.new_type) == ("number", "string") for c in changes)
+
+
+def test_ref_and_inline_schema_with_the_same_shape_are_equal():
+    money = {"amount": "number"}
+    old = _spec({"/a": {"GET": _op({"price": _ref("Money")})}}, {"Money": money})
+    new = _spec({"/a": {"GET": _op({"price": dict(money)})}})
+
+    assert diff_changes(old, new) == []
+
+
+def test_recursive_components_terminate():
+    paths = {"/n": {"GET": _op({"head": _ref("Node")})}}
+    old = _spec(paths, {"Node": {"value": "string", "next": _ref("Node")}})
+    new = _spec(paths, {"Node": {"value": "number", "next": _ref("Node")}})
+
+    changes = diff_changes(old, new)
+
+    assert [(c.field, c.old_type, c.new_type) for c in changes] == [
+        ("head.value", "string", "number")
+    ]
+
+
+def test_shared_subtrees_are_diffed_once(monkeypatch):
+    calls = []
+    original = _SchemaDiffer._diff_nodes
+
+    def counting(self, old_node, new_node):
+        calls.append(1)
+        return original(self, old_node, new_node)
+
+    monkeypatch.setattr(_SchemaDiffer, "_diff_nodes", counting)
+    paths = {f"/r{i}": {"GET": _op({"price": _ref("Money")})} for i in range(50)}
+    old = _spec(paths, {"Money": {"amount": "number"}})
+    new = _spec(paths, {"Money": {"amount": "string"}})
+
+    assert len(diff_changes(old, new)) == 50
+    # One diff for the Money pair and one for its "amount" leaf; each
+    # endpoint's top-level schema has the same hash pair and is memoized too.
+    assert len(calls) == 3
+
+
+def test_request_schema_changes_are_qualified():
+    def post(request_schema):
+        return {"POST": {**_op({}), "request": {"schema": request_schema}}}
+
+    old = _spec({"/o": post({"qty": "number"})})
+    new = _spec({"/o": post({"qty": "number", "note": "string"})})
+
+    changes = diff_changes(old, new)
+
+    assert changes == [
+        Change(FIELD_ADDED, "/o", "POST", "note", new_type="string", location=REQUEST)
+    ]
+    expected = "Endpoint /o POST: request field 'note' added (type: string)"
+    assert format_change(changes[0]) == expected
@@ -0,0 +1,101 @@
+# test_diff_report.py
+"""compare --format writers: text, ndjson, json and SARIF output."""
+
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from compatibility import BREAKING, DEFAULT_RULES, NON_BREAKING, Rule, RuleSet
+from diff_engine import FIELD_TYPE_CHANGED, diff_changes
+from diff_report import FORMATS, SARIF_VERSION, DiffSummary, write_changes
+
+ROOT = Path(__file__).resolve().parent.parent
+SPEC_V1 = ROOT / "specs" / "spec_v1.json"
+SPEC_V2 = ROOT / "specs" / "spec_v2.json"
+OLD = json.loads(SPEC_V1.read_text())
+NEW = json.loads(SPEC_V2.read_text())
+
+
+def _write(fmt, old=OLD, new=NEW, rules=None):
+    out = io.StringIO()
+    args = () if rules is None else (rules,)
+    summary = write_changes(iter(diff_changes(old, new)), fmt, out, "v1.json", "v2.json", *args)
+    return summary, out.getvalue()
+
+
+def test_text_keeps_the_cli_wording():
+    summary, text = _write("text")
+
+    assert summary == DiffSummary(4, 1)
+    assert text.splitlines() == [
+        "Differences detected:",
+        "- Endpoint added: /health ['GET']",
+        "- Endpoint /order GET: field 'currency' added (type: string)",
+        "- Endpoint /widget GET: field 'reviewUrl' added (type: string)",
+        "- Endpoint /widget GET: field 'amount' type changed from number to string",
+    ]
+    assert _write("text", NEW, NEW)[1] == "No differences detected between the two specs.\n"
+
+
+def test_ndjson_has_one_classified_record_per_line():
+    _, text = _write("ndjson")
+    records = [json.loads(line) for line in text.splitlines()]
+
+    assert [(r["kind"], r["severity"]) for r in records][-1] == (FIELD_TYPE_CHANGED, BREAKING)
+    assert all(r["severity"] == NON_BREAKING for r in records[:-1])
+    assert _write("ndjson", NEW, NEW)[1] == ""
+
+
+@pytest.mark.parametrize("old, changes", [(OLD, 4), (NEW, 0)])
+def test_json_is_one_valid_document(old, changes):
+    _, text = _write("json", old)
+    document = json.loads(text)
+
+    assert (document["old"], document["new"]) == ("v1.json", "v2.json")
+    assert len(document["changes"]) == changes
+    assert document["summary"]["changes"] == changes
+
+
+def test_sarif_levels_rules_and_locations():
+    relaxed = Rule("types-ok", FIELD_TYPE_CHANGED, NON_BREAKING, description="Allowed.")
+    _, text = _write("sarif", rules=RuleSet([relaxed, *DEFAULT_RULES]))
+    run = json.loads(text)["runs"][0]
+
+    assert json.loads(text)["version"] == SARIF_VERSION
+    rule_ids = [r["id"] for r in run["tool"]["driver"]["rules"]]
+    assert rule_ids[0] == "types-ok" and "unmatched" in rule_ids
+    assert len(rule_ids) == len(set(rule_ids))
+    assert {r["level"] for r in run["results"]} == {"note"}
+    amount = run["results"][-1]
+    assert amount["ruleId"] == "types-ok"
+    location = amount["locations"][0]
+    assert location["physicalLocation"]["artifactLocation"]["uri"] == "v2.json"
+    assert location["logicalLocations"][0]["fullyQualifiedName"] == "GET /widget response.amount"
+    assert run["properties"] == {"changes": 4, "breaking": 0, "non_breaking": 4}
+
+
+def test_every_format_has_a_writer():
+    for fmt in FORMATS:
+        assert _write(fmt)[0] == DiffSummary(4, 1)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_spec_errors_go_to_stderr_not_into_the_report(tmp_path, fmt):
+    broken = tmp_path / "broken.json"
+    broken.write_text(SPEC_V2.read_text()[:-20])
+
+    result = subprocess.run(
+        [sys.executable, "cli.py", "compare", "--streaming", "--format", fmt,
+         "--old", str(SPEC_V1), "--new", str(broken)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    assert "Error" not in result.stdout
+    assert result.stderr.startswith("Error: ")
@@ -0,0 +1,106 @@
+# test_generate_stream.py
+"""generate-tests --stream against a stub Ollama: --output is only replaced on success."""
+
+import json
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SPECS = ROOT / "specs"
+
+CHUNKS = ["import pytest\n\n\n", "def test_streamed():\n", "    assert True\n"]
+PREVIOUS = "# previous good tests\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = [{"message": {"content": c}, "done": False} for c in CHUNKS]
+        lines.append({"message": {"content": ""}, "done": True})
+        for i, line in enumerate(lines):
+            data = json.dumps(line).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            if self.server.break_after is not None and i + 1 == self.server.break_after:
+                self.close_connection = True
+                return
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.break_after = None
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _generate(ollama, tmp_path, old, *extra):
+    output = tmp_path / "test_contract.py"
+    output.write_text(PREVIOUS)
+    url = f"http://127.0.0.1:{ollama.server_address[1]}/api/chat"
+    result = subprocess.run(
+        [sys.executable, "cli.py", "generate-tests", "--old", str(old),
+         "--new", str(SPECS / "spec_v2.json"), "--output", str(output),
+         "--stream", "--idle-timeout", "1", "--no-cache", "--no-validate",
+         "--retries", "0", "--ollama-url", url, *extra],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    return result, output, tmp_path / "test_contract.py.partial"
+
+
+def test_successful_stream_replaces_output(ollama, tmp_path):
+    result, output, partial = _generate(
+        ollama, tmp_path, SPECS / "spec_v1.json", "--generator", "llm"
+    )
+
+    assert result.returncode == 0, result.stdout
+    assert output.read_text() == "".join(CHUNKS)
+    assert not partial.exists()
+
+
+def test_broken_stream_leaves_previous_output(ollama, tmp_path):
+    ollama.break_after = 1
+
+    result, output, partial = _generate(
+        ollama, tmp_path, SPECS / "spec_v1.json", "--generator", "llm"
+    )
+
+    assert result.returncode == 1
+    assert output.read_text() == PREVIOUS
+    assert partial.read_text() == CHUNKS[0]
+    assert f"Partial output left in: {partial}" in result.stdout
+
+
+def test_broken_stream_still_writes_templated_tests(ollama, tmp_path):
+    ollama.break_after = 1
+    old = json.loads((SPECS / "spec_v1.json").read_text())
+    # A removed endpoint has no template, so the LLM is called as well.
+    old["paths"]["/legacy"] = {"GET": {"response": {"status": 200, "schema": {}}}}
+    old_path = tmp_path / "old.json"
+    old_path.write_text(json.dumps(old))
+
+    result, output, partial = _generate(ollama, tmp_path, old_path)
+
+    assert result.returncode == 1
+    assert "def test_widget_get_amount_type_change():" in output.read_text()
+    assert partial.read_text() == CHUNKS[0]
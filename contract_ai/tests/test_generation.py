@@ -0,0 +1,113 @@
+# test_generation.py
+"""Per-endpoint generation jobs, the worker pool and merging of generated modules."""
+
+import json
+import threading
+from pathlib import Path
+
+from ai_client_ollama import OllamaError, estimate_prompt_size
+from diff_engine import diff_changes
+from generation import (
+    build_generation_jobs,
+    endpoint_module_name,
+    group_changes_by_endpoint,
+    merge_test_modules,
+    run_generation_jobs,
+    split_changes,
+)
+from generation_cache import GenerationCache
+
+SPECS = Path(__file__).resolve().parent.parent / "specs"
+SPEC_V1 = json.loads((SPECS / "spec_v1.json").read_text())
+SPEC_V2 = json.loads((SPECS / "spec_v2.json").read_text())
+CHANGES = diff_changes(SPEC_V1, SPEC_V2)
+
+
+class _Client:
+    """Stands in for an OllamaClient; fails for diffs that mention fail_on."""
+
+    def __init__(self, model="stub", fail_on=None):
+        self.model = model
+        self.fail_on = fail_on
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate_test_code(self, diff_summary, spec_snippet):
+        with self._lock:
+            self.prompts.append(diff_summary)
+        if self.fail_on and self.fail_on in diff_summary:
+            raise OllamaError(f"cannot do {self.fail_on}")
+        return f"def test_{self.model}():\n    assert {len(diff_summary)}\n"
+
+
+def test_changes_are_grouped_by_endpoint_in_diff_order():
+    groups = group_changes_by_endpoint(CHANGES)
+
+    assert list(groups) == [("/health", ""), ("/order", "GET"), ("/widget", "GET")]
+    assert len(groups[("/widget", "GET")]) == 2
+
+
+def test_one_job_per_endpoint_with_only_its_operations_as_context():
+    jobs = build_generation_jobs(CHANGES, SPEC_V1, SPEC_V2)
+
+    assert [job.key for job in jobs] == list(group_changes_by_endpoint(CHANGES))
+    order = next(job for job in jobs if job.key == ("/order", "GET"))
+    assert "'currency' added" in order.diff_summary
+    assert "/order" in order.spec_snippet and "/widget" not in order.spec_snippet
+
+
+def test_groups_over_the_prompt_budget_are_split():
+    widget = group_changes_by_endpoint(CHANGES)[("/widget", "GET")]
+    fixed = estimate_prompt_size("", "").total
+
+    assert split_changes(widget, fixed + 100, context_tokens=0) == [widget]
+    assert split_changes(widget, fixed + 1, context_tokens=0) == [[c] for c in widget]
+    jobs = build_generation_jobs(widget, SPEC_V1, SPEC_V2, max_tokens=0,
+                                 max_prompt_tokens=fixed + 1)
+    assert [job.key for job in jobs] == [("/widget", "GET")] * 2
+
+
+def test_jobs_run_round_robin_and_keep_job_order():
+    jobs = build_generation_jobs(CHANGES, SPEC_V1, SPEC_V2)
+    clients = [_Client("a"), _Client("b", fail_on="/order")]
+
+    results = run_generation_jobs(jobs, clients, workers=3)
+
+    assert [r.key for r in results] == [job.key for job in jobs]
+    assert [len(c.prompts) for c in clients] == [2, 1]
+    health, order, widget = results
+    assert "def test_a():" in health.code and "def test_a():" in widget.code
+    assert (order.code, order.error) == (None, "cannot do /order")
+
+
+def test_cached_jobs_skip_the_client(tmp_path):
+    jobs = build_generation_jobs(CHANGES, SPEC_V1, SPEC_V2)
+    cache = GenerationCache(str(tmp_path))
+    client = _Client()
+
+    first = run_generation_jobs(jobs, [client], cache=cache)
+    second = run_generation_jobs(jobs, [client], cache=cache)
+    refreshed = run_generation_jobs(jobs, [client], cache=cache, refresh=True)
+
+    assert [r.cached for r in first + second + refreshed] == [False] * 3 + [True] * 3 + [False] * 3
+    assert [r.code for r in second] == [r.code for r in first]
+    assert len(client.prompts) == 6
+
+
+def test_endpoint_module_names():
+    assert endpoint_module_name(("/widget/{id}", "GET")) == "test_contract_widget_id_get.py"
+    assert endpoint_module_name(("/health", "")) == "test_contract_health.py"
+    assert endpoint_module_name(("/", "")) == "test_contract_root.py"
+
+
+def test_merge_hoists_imports_and_renames_colliding_tests():
+    first = "import pytest\nfrom x import (\n    a,\n    b,\n)\n\n\ndef test_it():\n    pass\n"
+    second = "import pytest\n\ndef test_it():\n    pass\n\n\nasync def test_other():\n    pass\n"
+
+    merged = merge_test_modules([first, second, "import pytest\n"])
+
+    assert merged.startswith("import pytest\nfrom x import (\n    a,\n    b,\n)\n\n\n")
+    assert merged.count("import pytest") == 1
+    assert "def test_it():" in merged and "def test_it_2():" in merged
+    assert "async def test_other():" in merged
+    compile(merged, "merged", "exec")
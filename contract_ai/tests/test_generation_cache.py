@@ -0,0 +1,71 @@
+# test_generation_cache.py
+"""GenerationCache hits, age expiry and least-recently-used eviction."""
+
+import os
+import time
+
+import generation_cache
+from generation_cache import GenerationCache, cache_key
+
+
+def _age(cache, key, accessed, created):
+    """Backdate an entry: accessed and created are seconds before now."""
+    now = time.time()
+    os.utime(cache._entry_path(key), (now - accessed, now - created))
+
+
+def test_key_covers_every_input():
+    base = ("diff", "snippet", "v1", "model", {"temperature": 0})
+    keys = {cache_key(*base)}
+    for i in range(len(base)):
+        changed = list(base)
+        changed[i] = {"temperature": 1} if i == 4 else base[i] + "x"
+        keys.add(cache_key(*changed))
+
+    assert len(keys) == len(base) + 1
+    assert cache_key(*base) == cache_key(*base)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = GenerationCache(str(tmp_path))
+
+    assert cache.get("k") is None
+    cache.put("k", "code")
+    assert cache.get("k") == "code"
+
+
+def test_frequently_read_entry_still_expires(tmp_path, monkeypatch):
+    cache = GenerationCache(str(tmp_path), max_age_seconds=100)
+    cache.put("k", "code")
+    _age(cache, "k", accessed=90, created=90)
+
+    assert cache.get("k") == "code"
+    later = time.time() + 20
+    monkeypatch.setattr(generation_cache.time, "time", lambda: later)
+
+    assert cache.get("k") is None
+    assert not cache._entry_path("k").exists()
+
+
+def test_prune_removes_expired_entries_even_if_recently_read(tmp_path):
+    cache = GenerationCache(str(tmp_path), max_age_seconds=100)
+    cache.put("old", "code")
+    cache.put("new", "code")
+    _age(cache, "old", accessed=0, created=200)
+
+    assert cache.prune() == 1
+    assert cache.get("old") is None
+    assert cache.get("new") == "code"
+
+
+def test_size_limit_evicts_least_recently_read_first(tmp_path):
+    entry = "x" * 100
+    cache = GenerationCache(str(tmp_path), max_bytes=300)
+    for age, key in ((30, "a"), (20, "b"), (10, "c")):
+        cache.put(key, entry)
+        _age(cache, key, accessed=age, created=age)
+
+    assert cache.get("a") == entry
+    cache.put("d", entry)
+
+    assert sorted(p.stem for p in tmp_path.glob("*.py")) == ["a", "c", "d"]
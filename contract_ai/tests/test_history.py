@@ -0,0 +1,75 @@
+# test_history.py
+"""compare-history: natural ordering, chunked pairs and pooled diffs."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from diff_engine import change_to_dict, diff_changes
+from history import _chunks, iter_history, resolve_spec_files
+
+ROOT = Path(__file__).resolve().parent.parent
+SPEC_V1 = json.loads((ROOT / "specs" / "spec_v1.json").read_text())
+SPEC_V2 = json.loads((ROOT / "specs" / "spec_v2.json").read_text())
+
+
+def _versions(tmp_path, count):
+    """spec_v1 .. spec_v<count>, alternating between the two sample specs."""
+    for i in range(1, count + 1):
+        spec = dict(SPEC_V1 if i % 2 else SPEC_V2, version=f"{i}.0")
+        (tmp_path / f"spec_v{i}.json").write_text(json.dumps(spec))
+    return str(tmp_path)
+
+
+def test_files_are_naturally_sorted(tmp_path):
+    directory = _versions(tmp_path, 11)
+    expected = [str(tmp_path / f"spec_v{i}.json") for i in range(1, 12)]
+
+    assert resolve_spec_files(directory) == expected
+    assert resolve_spec_files(str(tmp_path / "spec_v1*.json")) == [expected[0], *expected[9:]]
+
+
+def test_chunks_share_their_boundary_files():
+    files = list("abcdefg")
+
+    assert _chunks(files, 2) == [list("abc"), list("cde"), list("efg")]
+    assert _chunks(files, 4) == [list("abcde"), list("efg")]
+
+
+def test_each_step_is_the_diff_of_its_pair(tmp_path):
+    files = resolve_spec_files(_versions(tmp_path, 3))
+
+    entries = list(iter_history(files, workers=1))
+
+    steps = [(e["from_version"], e["to_version"]) for e in entries]
+    assert steps == [("1.0", "2.0"), ("2.0", "3.0")]
+    assert entries[0]["changes"] == [change_to_dict(c) for c in diff_changes(SPEC_V1, SPEC_V2)]
+    assert entries[1]["change_count"] == len(diff_changes(SPEC_V2, SPEC_V1))
+
+
+def test_process_pool_matches_in_process(tmp_path):
+    files = resolve_spec_files(_versions(tmp_path, 12))
+
+    pooled = list(iter_history(files, workers=2))
+
+    assert pooled == list(iter_history(files, workers=1))
+    assert [e["to"] for e in pooled] == files[1:]
+
+
+def test_cli_writes_a_json_change_log(tmp_path):
+    (tmp_path / "specs").mkdir()
+    directory = _versions(tmp_path / "specs", 4)
+    output = tmp_path / "history.json"
+
+    result = subprocess.run(
+        [sys.executable, "cli.py", "compare-history", "--specs", directory,
+         "--format", "json", "--output", str(output), "--workers", "1"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stdout
+    assert "3 version step(s)" in result.stdout
+    assert [e["to_version"] for e in json.loads(output.read_text())] == ["2.0", "3.0", "4.0"]
@@ -0,0 +1,229 @@
+# test_host_pool.py
+"""HostPool routing, ejection, recovery and failover against stub Ollama hosts."""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai_client_ollama import OllamaClient, OllamaUnavailableError
+from host_pool import HostPool
+
+# Stub behaviours
+OK = "ok"
+FAIL = "fail"  # 503 on every request, /api/tags included
+BREAK = "break"  # streams send one chunk, then the connection drops
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # streams are sent chunked, as Ollama does
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.server.stub
+        self._send(503 if stub.mode == FAIL else 200, b'{"models": []}')
+
+    def do_POST(self):
+        stub = self.server.stub
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with stub.lock:
+            stub.chats += 1
+        time.sleep(stub.delay)
+        if stub.mode == FAIL:
+            self._send(503, b'{"error": "overloaded"}')
+            return
+        if not payload.get("stream"):
+            self._send(200, json.dumps({"message": {"content": stub.name}, "done": True}).encode())
+            return
+
+        lines = [{"message": {"content": f"{stub.name}-{i}"}, "done": False} for i in range(2)]
+        lines.append({"message": {"content": ""}, "done": True})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data = json.dumps(line).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            if stub.mode == BREAK:
+                # Hang up mid-stream, after the first chunk.
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _StubOllama:
+    """An Ollama stand-in on 127.0.0.1 that can be told to fail or stop."""
+
+    def __init__(self, name, port=0):
+        self.name = name
+        self.mode = OK
+        self.delay = 0.0
+        self.chats = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/api/chat"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    started = []
+
+    def start(name, port=0):
+        stub = _StubOllama(name, port)
+        started.append(stub)
+        return stub
+
+    yield start
+    for stub in started:
+        stub.stop()
+
+
+def _pool(*urls, probe_interval_seconds=0.0):
+    clients = [OllamaClient(url=url, model="stub", retries=0) for url in urls]
+    return HostPool(clients, probe_interval_seconds=probe_interval_seconds)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _healthy(pool):
+    return [host["healthy"] for host in pool.stats()]
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_concurrent_requests_spread_over_hosts(stubs):
+    a, b = stubs("a"), stubs("b")
+    a.delay = b.delay = 0.3
+
+    with _pool(a.url, b.url) as pool:
+        threads = [threading.Thread(target=pool.chat, args=(MESSAGES,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert (a.chats, b.chats) == (1, 1)
+        assert [host["outstanding"] for host in pool.stats()] == [0, 0]
+
+
+def test_requests_go_to_the_faster_host(stubs):
+    slow, fast = stubs("slow"), stubs("fast")
+    slow.delay = 0.3
+
+    with _pool(slow.url, fast.url) as pool:
+        # Two at once, so both hosts get a latency sample.
+        threads = [threading.Thread(target=pool.chat, args=(MESSAGES,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [pool.chat(MESSAGES) for _ in range(4)] == ["fast"] * 4
+        assert (slow.chats, fast.chats) == (1, 5)
+
+
+def test_host_returning_5xx_is_ejected_and_probed_back(stubs):
+    a, b = stubs("a"), stubs("b")
+    a.mode = FAIL
+
+    with _pool(a.url, b.url) as pool:
+        assert pool.chat(MESSAGES) == "b"
+        assert _healthy(pool) == [False, True]
+        assert pool.stats()[0]["failures"] == 1
+
+        # Ejected: later requests skip it without trying.
+        assert pool.chat(MESSAGES) == "b"
+        assert a.chats == 1
+
+        pool.probe()
+        assert _healthy(pool) == [False, True]
+
+        a.mode = OK
+        pool.probe()
+        assert _healthy(pool) == [True, True]
+        assert pool.chat(MESSAGES) == "a"
+
+
+def test_refused_host_is_ejected_and_returns_once_it_listens(stubs):
+    port = _free_port()
+    b = stubs("b")
+
+    with _pool(f"http://127.0.0.1:{port}/api/chat", b.url, probe_interval_seconds=0.05) as pool:
+        assert pool.chat(MESSAGES) == "b"
+        assert _healthy(pool) == [False, True]
+
+        a = stubs("a", port)
+        deadline = time.monotonic() + 5
+        while not all(_healthy(pool)) and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        assert _healthy(pool) == [True, True]
+        assert pool.chat(MESSAGES) == "a"
+
+
+def test_all_hosts_down_raises_with_every_error(stubs):
+    a, b = stubs("a"), stubs("b")
+    a.mode = b.mode = FAIL
+
+    with _pool(a.url, b.url) as pool:
+        with pytest.raises(OllamaUnavailableError, match="All Ollama hosts failed") as info:
+            pool.chat(MESSAGES)
+        assert str(info.value).count("HTTP 503") == 2
+
+        # With every host ejected the longest-ejected one is still tried.
+        a.mode = OK
+        assert pool.chat(MESSAGES) == "a"
+
+
+def test_stream_fails_over_before_the_first_chunk(stubs):
+    a, b = stubs("a"), stubs("b")
+    a.mode = FAIL
+
+    with _pool(a.url, b.url) as pool:
+        chunks = list(pool.stream_test_code("diff", "{}"))
+
+        assert chunks == ["b-0", "b-1"]
+        assert _healthy(pool) == [False, True]
+        assert pool.stats()[1]["latency_seconds"] is not None
+
+
+def test_stream_does_not_fail_over_after_the_first_chunk(stubs):
+    a, b = stubs("a"), stubs("b")
+    a.mode = BREAK
+
+    with _pool(a.url, b.url) as pool:
+        stream = pool.stream_test_code("diff", "{}")
+
+        assert next(stream) == "a-0"
+        with pytest.raises(OllamaUnavailableError, match="stalled or broke"):
+            next(stream)
+        assert b.chats == 0
+        assert _healthy(pool) == [False, True]
+        assert [host["outstanding"] for host in pool.stats()] == [0, 0]
@@ -0,0 +1,119 @@
+# test_metrics.py
+"""Metric types, Prometheus and OpenMetrics rendering, and the exporters."""
+
+import urllib.request
+
+import pytest
+
+from metrics import (
+    LLM_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+    OPENMETRICS_CONTENT_TYPE,
+    PROMETHEUS_CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    observe_llm_request,
+    start_http_server,
+    start_textfile_exporter,
+    write_textfile,
+)
+from token_budget import Usage
+
+
+def _registry():
+    registry = Registry()
+    requests = registry.register(Counter("app_requests", "Requests.", ["path"]))
+    in_flight = registry.register(Gauge("app_in_flight", "In flight."))
+    latency = registry.register(Histogram("app_seconds", "Latency.", (0.5, 1)))
+    requests.inc(path='/a"b')
+    requests.inc(2, path="/c")
+    in_flight.inc(3)
+    in_flight.dec()
+    latency.observe(0.2)
+    latency.observe(0.75)
+    latency.observe(5)
+    return registry
+
+
+def test_prometheus_text_format():
+    assert _registry().render().splitlines() == [
+        "# HELP app_requests_total Requests.",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{path="/a\\"b"} 1',
+        'app_requests_total{path="/c"} 2',
+        "# HELP app_in_flight In flight.",
+        "# TYPE app_in_flight gauge",
+        "app_in_flight 2",
+        "# HELP app_seconds Latency.",
+        "# TYPE app_seconds histogram",
+        'app_seconds_bucket{le="0.5"} 1',
+        'app_seconds_bucket{le="1.0"} 2',
+        'app_seconds_bucket{le="+Inf"} 3',
+        "app_seconds_sum 5.95",
+        "app_seconds_count 3",
+    ]
+
+
+def test_openmetrics_names_the_counter_family_without_total():
+    text = _registry().render(openmetrics=True)
+
+    assert "# TYPE app_requests counter\n" in text
+    assert 'app_requests_total{path="/c"} 2\n' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_labels_and_names_are_checked():
+    registry = _registry()
+    counter = Counter("app_requests", "Again.", ["path"])
+
+    with pytest.raises(ValueError, match="takes labels"):
+        counter.inc(method="GET")
+    with pytest.raises(ValueError, match="already registered"):
+        registry.register(counter)
+
+
+def test_observe_llm_request_records_tokens_and_throughput():
+    usage = Usage("m-test", 10, 100, 40, 0.5, 2.0, 3.0)
+    before = LLM_TOKENS.value(model="m-test", type="prompt")
+
+    observe_llm_request("m-test", 3.0, True, usage)
+
+    assert LLM_TOKENS.value(model="m-test", type="prompt") == before + 100
+    assert LLM_TOKENS.value(model="m-test", type="completion") >= 40
+    text = "\n".join(line for line in LLM_TOKENS_PER_SECOND.render(False) if "m-test" in line)
+    assert 'phase="prefill",le="320.0"} 1' in text
+    assert 'phase="generation",le="20.0"} 1' in text
+
+
+def test_http_server_negotiates_the_format():
+    server = start_http_server(0, registry=_registry())
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    try:
+        with urllib.request.urlopen(url) as resp:
+            plain = (resp.headers["Content-Type"], resp.read().decode())
+        request = urllib.request.Request(url, headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request) as resp:
+            open_metrics = (resp.headers["Content-Type"], resp.read().decode())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert plain[0] == PROMETHEUS_CONTENT_TYPE and "app_in_flight 2" in plain[1]
+    assert open_metrics[0] == OPENMETRICS_CONTENT_TYPE and open_metrics[1].endswith("# EOF\n")
+
+
+def test_textfile_is_written_whole(tmp_path):
+    path = tmp_path / "contract_ai.prom"
+    registry = _registry()
+
+    write_textfile(str(path), registry)
+    assert path.read_text() == registry.render()
+
+    exporter = start_textfile_exporter(str(path), interval_seconds=60, registry=registry)
+    registry.register(Gauge("app_late", "Added later.")).set(7)
+    exporter.stop()
+
+    assert "app_late 7" in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == ["contract_ai.prom"]
@@ -0,0 +1,210 @@
+# test_payload_validator.py
+"""Compiled payload checkers and NDJSON capture validation."""
+
+import json
+
+from payload_validator import (
+    INVALID_RECORD,
+    MISSING,
+    STATUS_MISMATCH,
+    TYPE_MISMATCH,
+    UNEXPECTED,
+    UNKNOWN_OPERATION,
+    SpecValidator,
+    Violation,
+    validate_ndjson,
+)
+
+
+def _ref(name):
+    return {"$ref": f"#/components/schemas/{name}"}
+
+
+SPEC = {
+    "paths": {
+        "/widget": {
+            "GET": {"response": {"status": 200, "schema": {"id": "string", "amount": "number"}}},
+            "POST": {
+                "request": {"schema": {"qty": "integer"}},
+                "response": {"status": 201, "schema": {"id": "string"}},
+            },
+        },
+        "/order/{id}": {
+            "GET": {
+                "response": {
+                    "status": 200,
+                    "schema": {
+                        "total": _ref("Money"),
+                        "items": [{"sku": "string", "qty": "integer"}],
+                        "node": _ref("Node"),
+                    },
+                }
+            }
+        },
+    },
+    "components": {
+        "schemas": {
+            "Money": {"amount": "number", "currency": "string"},
+            "Node": {"value": "string", "children": [_ref("Node")]},
+        }
+    },
+}
+
+ORDER = {
+    "total": {"amount": 1.5, "currency": "EUR"},
+    "items": [{"sku": "a", "qty": 1}],
+    "node": {"value": "x", "children": []},
+}
+
+
+def _problems(violations):
+    return [(v.field, v.kind, v.expected, v.actual) for v in violations]
+
+
+def test_valid_payload_has_no_violations():
+    validator = SpecValidator(SPEC)
+
+    assert validator.validate("/widget", "GET", {"id": "w1", "amount": 3}, 200) == []
+    assert validator.validate("/order/42", "get", ORDER, 200) == []
+
+
+def test_missing_fields_and_type_mismatches():
+    violations = SpecValidator(SPEC).validate("/widget", "GET", {"amount": "3"})
+
+    assert violations == [
+        Violation("/widget", "GET", "response", "id", MISSING, None, None),
+        Violation("/widget", "GET", "response", "amount", TYPE_MISMATCH, "number", "string"),
+    ]
+
+
+def test_booleans_are_not_numbers():
+    validator = SpecValidator(SPEC)
+
+    assert _problems(validator.validate("/widget", "GET", {"id": "w", "amount": True})) == [
+        ("amount", TYPE_MISMATCH, "number", "boolean")
+    ]
+    assert _problems(validator.validate("/widget", "POST", {"id": "w"}, request={"qty": 1.0})) == [
+        ("qty", TYPE_MISMATCH, "integer", "number")
+    ]
+
+
+def test_extra_fields_are_reported_only_in_strict_mode():
+    payload = {"id": "w", "amount": 1, "note": None}
+
+    assert SpecValidator(SPEC).validate("/widget", "GET", payload) == []
+    assert _problems(SpecValidator(SPEC, strict=True).validate("/widget", "GET", payload)) == [
+        ("note", UNEXPECTED, None, "null")
+    ]
+
+
+def test_refs_and_nested_objects_use_dotted_names():
+    order = dict(
+        ORDER,
+        total={"amount": "1.5"},
+        node={"value": "a", "children": [{"value": 2, "children": []}]},
+    )
+
+    assert _problems(SpecValidator(SPEC).validate("/order/7", "GET", order)) == [
+        ("total.currency", MISSING, None, None),
+        ("total.amount", TYPE_MISMATCH, "number", "string"),
+        ("node.children[].value", TYPE_MISMATCH, "string", "number"),
+    ]
+
+
+def test_array_items_report_each_distinct_problem_once():
+    items = [
+        {"sku": "a", "qty": "1"},
+        {"sku": "b", "qty": "2"},
+        {"qty": 3},
+        {"sku": 4, "qty": "5"},
+    ]
+    order = dict(ORDER, items=items)
+
+    assert _problems(SpecValidator(SPEC).validate("/order/7", "GET", order)) == [
+        ("items[].qty", TYPE_MISMATCH, "integer", "string"),
+        ("items[].sku", MISSING, None, None),
+        ("items[].sku", TYPE_MISMATCH, "string", "number"),
+    ]
+
+
+def test_non_array_for_array_field():
+    order = dict(ORDER, items={"sku": "a"})
+
+    assert _problems(SpecValidator(SPEC).validate("/order/7", "GET", order)) == [
+        ("items", TYPE_MISMATCH, "array", "object")
+    ]
+
+
+def test_undocumented_status_skips_the_body():
+    violations = SpecValidator(SPEC).validate("/widget", "GET", {"error": "boom"}, 500)
+
+    assert violations == [
+        Violation("/widget", "GET", "response", "", STATUS_MISMATCH, "200", "500")
+    ]
+
+
+def test_request_bodies_are_checked_separately():
+    violations = SpecValidator(SPEC).validate("/widget", "POST", {}, 201, request={})
+
+    assert [(v.location, v.field, v.kind) for v in violations] == [
+        ("request", "qty", MISSING),
+        ("response", "id", MISSING),
+    ]
+
+
+def test_unknown_operations():
+    validator = SpecValidator(SPEC)
+
+    assert [v.kind for v in validator.validate("/nope", "GET", {})] == [UNKNOWN_OPERATION]
+    assert [v.kind for v in validator.validate("/widget", "DELETE", {})] == [UNKNOWN_OPERATION]
+    assert validator.find_operation("/order/1?expand=items", "GET").path == "/order/{id}"
+    assert validator.find_operation("/order/1/items", "GET") is None
+
+
+def _write_ndjson(tmp_path, lines):
+    path = tmp_path / "capture.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_validate_ndjson_counts_records_and_keeps_example_lines(tmp_path):
+    good = json.dumps({"path": "/widget", "method": "GET", "status": 200,
+                       "response": {"id": "w", "amount": 1}})
+    bad = json.dumps({"path": "/widget", "method": "GET", "response": {"id": "w"}})
+    unknown = json.dumps({"path": "/nope", "method": "GET", "response": {}})
+    not_strings = [json.dumps({"path": "/nope", "method": 5}),
+                   json.dumps({"path": ["/widget"], "method": "GET"})]
+    capture = _write_ndjson(
+        tmp_path,
+        [good, bad, "{not json", "", json.dumps({"path": "/widget"}), bad, unknown, *not_strings],
+    )
+
+    report = validate_ndjson(SPEC, capture)
+    summary = report.to_dict()
+
+    assert not report.ok
+    assert (report.records, report.invalid_records) == (8, 7)
+    assert [(v["kind"], v["actual"], v["count"], v["example_lines"])
+            for v in summary["violations"]] == [
+        (INVALID_RECORD, "missing path or method", 3, [5, 8, 9]),
+        (MISSING, None, 2, [2, 6]),
+        (INVALID_RECORD, "not JSON", 1, [3]),
+        (UNKNOWN_OPERATION, None, 1, [7]),
+    ]
+
+
+def test_validate_ndjson_in_processes_matches_in_process(tmp_path):
+    lines = []
+    for i in range(12_000):
+        amount = "1" if i % 1000 == 999 else i
+        lines.append(json.dumps({"path": "/widget", "method": "GET", "status": 200,
+                                 "response": {"id": f"w{i}", "amount": amount,
+                                              "pad": "x" * 60}}))
+    capture = _write_ndjson(tmp_path, lines)
+
+    single = validate_ndjson(SPEC, capture, processes=1).to_dict()
+    split = validate_ndjson(SPEC, capture, processes=2).to_dict()
+
+    assert single["records"] == split["records"] == 12_000
+    assert single["violations"] == split["violations"]
+    assert split["violations"][0]["example_lines"] == [1000, 2000, 3000, 4000, 5000]
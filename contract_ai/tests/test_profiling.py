@@ -0,0 +1,96 @@
+# test_profiling.py
+"""Profiling spans: recording, self-time breakdown and the CLI's --profile flags."""
+
+import io
+import json
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import profiling
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(autouse=True)
+def _disable_afterwards():
+    yield
+    profiling.disable()
+
+
+def _rows():
+    return {r["name"]: (r["calls"], round(r["total"], 6), round(r["self"], 6))
+            for r in profiling.breakdown()}
+
+
+def test_spans_are_free_when_disabled():
+    with profiling.span("x", a=1) as s:
+        s.set(b=2)
+    profiling.record("y", 1.0)
+
+    assert not profiling.enabled()
+    assert profiling.events() == []
+
+
+def test_self_time_excludes_direct_children():
+    profiling.enable()
+    # outer [0, 10) holds a [1, 4) and b [5, 9); b holds c [6, 7)
+    profiling.record("outer", 10.0, end=10.0)
+    profiling.record("a", 3.0, end=4.0)
+    profiling.record("b", 4.0, end=9.0)
+    profiling.record("c", 1.0, end=7.0)
+
+    assert _rows() == {
+        "outer": (1, 10.0, 3.0),
+        "b": (1, 4.0, 3.0),
+        "a": (1, 3.0, 3.0),
+        "c": (1, 1.0, 1.0),
+    }
+
+
+def test_spans_on_other_threads_are_not_children():
+    profiling.enable()
+    profiling.record("main", 10.0, end=10.0)
+    worker = threading.Thread(target=profiling.record, args=("worker", 5.0), kwargs={"end": 6.0})
+    worker.start()
+    worker.join()
+
+    assert _rows()["main"] == (1, 10.0, 10.0)
+
+
+def test_span_records_args_and_print_breakdown():
+    profiling.enable()
+    for _ in range(2):
+        with profiling.span("step", n=1) as s:
+            s.set(extra="x")
+    out = io.StringIO()
+    profiling.print_breakdown(out)
+
+    assert [e.args for e in profiling.events()] == [{"n": 1, "extra": "x"}] * 2
+    assert _rows()["step"][0] == 2
+    assert "Profile: " in out.getvalue() and "\nstep " in out.getvalue()
+
+
+def test_cli_profile_flags(tmp_path):
+    trace = tmp_path / "trace.json"
+    stats = tmp_path / "compare.prof"
+
+    result = subprocess.run(
+        [sys.executable, "cli.py", "compare", "--old", "specs/spec_v1.json",
+         "--new", "specs/spec_v2.json", "--profile", "--profile-trace", str(trace),
+         "--profile-stats", str(stats)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    assert result.stdout.startswith("Differences detected:")
+    assert "Profile: " in result.stderr and "cli.compare" in result.stderr
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert "cli.compare" in {e["name"] for e in events}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert stats.stat().st_size > 0
@@ -0,0 +1,177 @@
+# test_replay.py
+"""replay_capture against the stand-in server, and when a failed request is resent."""
+
+import asyncio
+import base64
+import json
+from pathlib import Path
+
+from payload_validator import (
+    INVALID_RECORD,
+    MISSING,
+    TYPE_MISMATCH,
+    UNKNOWN_OPERATION,
+    SpecValidator,
+)
+from replay import (
+    INVALID_BODY,
+    REQUEST_FAILED,
+    _Connection,
+    _ndjson_exchanges,
+    load_capture,
+    read_head,
+    replay_capture,
+)
+
+SPECS = Path(__file__).resolve().parent.parent / "specs"
+SPEC_V2 = json.loads((SPECS / "spec_v2.json").read_text())
+WIDGET = {"id": "w", "status": "ok", "amount": "1.50", "reviewUrl": "http://r"}
+
+
+def _kinds(report):
+    return sorted((v["kind"], v["example_lines"]) for v in report.to_dict()["violations"])
+
+
+def test_ndjson_capture_replayed_against_the_stand_in_server(tmp_path):
+    records = [
+        {"path": "/widget", "method": "GET", "status": 200, "response": WIDGET},
+        {"path": "/widget", "method": "GET", "response": dict(WIDGET, amount=1.5)},
+        {"path": "/order", "method": "get", "response": {"orderId": "o", "total": 2}},
+        {"path": "/nope", "method": "GET", "response": {}},
+    ]
+    capture = tmp_path / "capture.ndjson"
+    capture.write_text("\n".join([*map(json.dumps, records), "{not json"]) + "\n")
+
+    report = asyncio.run(
+        replay_capture(load_capture(str(capture)), SpecValidator(SPEC_V2), concurrency=2)
+    )
+
+    assert report.payloads.records == 5
+    assert _kinds(report) == [
+        (INVALID_RECORD, [5]),
+        (MISSING, [3]),
+        (TYPE_MISMATCH, [2]),
+        (UNKNOWN_OPERATION, [4]),
+    ]
+    assert set(report.percentiles(("/widget", "GET"))) == {"p50", "p90", "p99", "max"}
+    widget = report.to_dict()["operations"][0]
+    assert (widget["path"], widget["records"], widget["invalid"]) == ("/widget", 2, 1)
+
+
+def test_har_capture_with_base64_and_non_json_bodies(tmp_path):
+    def entry(url, text, encoding=None):
+        content = {"mimeType": "application/json", "text": text}
+        if encoding:
+            content["encoding"] = encoding
+        return {"request": {"method": "GET", "url": url},
+                "response": {"status": 200, "content": content}}
+
+    encoded = base64.b64encode(json.dumps({"status": "up"}).encode()).decode()
+    har = {"log": {"entries": [entry("http://svc/health?full=1", encoded, "base64"),
+                               entry("http://svc/health", "<html>")]}}
+    capture = tmp_path / "capture.har"
+    capture.write_text(json.dumps(har))
+
+    report = asyncio.run(replay_capture(load_capture(str(capture)), SpecValidator(SPEC_V2)))
+
+    assert report.payloads.records == 2
+    assert _kinds(report) == [(INVALID_BODY, [2])]
+
+
+# -- resending after a failure ------------------------------------------------
+
+
+# /health answers POST as well, so both methods validate cleanly
+HEALTH_SPEC = {"paths": {"/health": {m: SPEC_V2["paths"]["/health"]["GET"]
+                                     for m in ("GET", "POST")}}}
+
+
+class _Target:
+    """
+    A service that answers the first request on each connection and then
+    either closes at once (close_idle) or reads the next request and hangs
+    up without answering it, as if it crashed after acting on it.
+    """
+
+    def __init__(self, close_idle=False):
+        self.close_idle = close_idle
+        self.received = []
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        for answered in range(2):
+            head = await read_head(reader)
+            if head is None:
+                break
+            length = int(head[1].get("content-length") or 0)
+            await reader.readexactly(length)
+            self.received.append(head[0].split(" ")[0])
+            if answered:
+                break
+            body = json.dumps({"status": "up"}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            if self.close_idle:
+                break
+        writer.close()
+
+
+def _exchanges(method, count):
+    record = json.dumps({"path": "/health", "method": method}).encode()
+    return list(_ndjson_exchanges([record] * count))
+
+
+def _replay_twice(method):
+    exchanges = _exchanges(method, 2)
+
+    async def main():
+        async with _Target() as target:
+            report = await replay_capture(
+                exchanges, SpecValidator(HEALTH_SPEC), target=target.url, concurrency=1
+            )
+            return report, target.received
+
+    return asyncio.run(main())
+
+
+def test_post_is_not_resent_after_the_request_went_out():
+    report, received = _replay_twice("POST")
+
+    assert received == ["POST", "POST"]
+    assert _kinds(report) == [(REQUEST_FAILED, [2])]
+
+
+def test_get_is_resent_on_a_new_connection():
+    report, received = _replay_twice("GET")
+
+    assert received == ["GET", "GET", "GET"]
+    assert report.ok
+
+
+def test_connection_closed_by_the_server_is_replaced_before_sending():
+    [exchange] = _exchanges("POST", 1)
+
+    async def main():
+        async with _Target(close_idle=True) as target:
+            port = int(target.url.rsplit(":", 1)[1])
+            conn = _Connection("127.0.0.1", port, "", 5.0, send_replay_id=False)
+            try:
+                first = await conn.request(exchange, 0)
+                await asyncio.sleep(0.05)
+                second = await conn.request(exchange, 1)
+            finally:
+                conn.close()
+            return first, second, target.received
+
+    first, second, received = asyncio.run(main())
+
+    assert first[0] == second[0] == 200
+    assert received == ["POST", "POST"]
@@ -0,0 +1,314 @@
+# test_scan.py
+"""Spec discovery, git/directory baselines, the stat cache and scan reports."""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from diff_engine import ENDPOINT_ADDED, ENDPOINT_REMOVED, FIELD_TYPE_CHANGED
+from scan import (
+    ADDED,
+    MODIFIED,
+    REMOVED,
+    ScanError,
+    StatCache,
+    blob_hash,
+    discover_specs,
+    git_specs,
+    iter_scan,
+    matches,
+    plan_scan,
+    read_blobs,
+    write_scan,
+)
+
+CLI = str(Path(__file__).resolve().parent.parent / "cli.py")
+
+
+def _spec(amount_type="number", extra=None):
+    schema = {"id": "string", "amount": amount_type}
+    paths = {"/widget": {"GET": {"response": {"status": 200, "schema": schema}}}}
+    paths.update(extra or {})
+    return {"paths": paths}
+
+
+def _put(root, rel, spec):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(spec, indent=2))
+    return path
+
+
+def _git(root, *args):
+    return subprocess.run(
+        ["git", "-C", str(root), "-c", "user.email=ci@example.com", "-c", "user.name=ci", *args],
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A git repo with four committed specs, then edited in the worktree."""
+    root = tmp_path / "repo"
+    _put(root, "specs/a.json", _spec())
+    _put(root, "svc/specs/b.json", _spec())
+    _put(root, "svc/specs/gone.json", _spec())
+    _put(root, "svc/specs/same.json", _spec())
+    _git(root, "init", "-q")
+    _git(root, "add", ".")
+    _git(root, "commit", "-q", "-m", "baseline")
+
+    _put(root, "specs/a.json", _spec("string"))  # modified
+    _put(root, "svc/specs/new.json", _spec())  # added, untracked
+    (root / "svc/specs/gone.json").unlink()  # removed
+    return root
+
+
+def test_matches_default_patterns_and_skip_dirs():
+    patterns = ("specs/*.json", "*/specs/*.json")
+
+    assert matches("specs/a.json", patterns)
+    assert matches("svc/specs/a.json", patterns)
+    assert matches("deep/er/specs/a.json", patterns)  # fnmatch "*" spans "/"
+    assert not matches("specs/a.yaml", patterns)
+    assert not matches("a.json", patterns)
+    assert not matches("node_modules/pkg/specs/a.json", patterns)
+    assert not matches("svc/.venv/specs/a.json", patterns)
+
+
+def test_discover_specs_skips_vendored_trees(tmp_path):
+    _put(tmp_path, "specs/a.json", {})
+    _put(tmp_path, "svc/specs/b.json", {})
+    _put(tmp_path, "node_modules/x/specs/c.json", {})
+    _put(tmp_path, ".git/specs/d.json", {})
+    _put(tmp_path, "svc/other/e.json", {})
+
+    found = discover_specs(str(tmp_path))
+
+    assert sorted(found) == ["specs/a.json", "svc/specs/b.json"]
+    assert found["specs/a.json"] == os.path.join(str(tmp_path), "specs", "a.json")
+
+
+def test_blob_hash_matches_git(tmp_path):
+    path = _put(tmp_path, "specs/a.json", _spec())
+    expected = subprocess.run(
+        ["git", "hash-object", str(path)], check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+    assert blob_hash(path.read_bytes()) == expected
+    assert blob_hash(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+
+def test_git_specs_and_read_blobs(repo):
+    blobs = git_specs(str(repo), "HEAD")
+
+    assert sorted(blobs) == [
+        "specs/a.json",
+        "svc/specs/b.json",
+        "svc/specs/gone.json",
+        "svc/specs/same.json",
+    ]
+    contents = read_blobs(str(repo), [blobs["specs/a.json"], blobs["specs/a.json"]])
+    assert list(contents) == [blobs["specs/a.json"]]
+    assert json.loads(contents[blobs["specs/a.json"]]) == _spec()
+    assert read_blobs(str(repo), []) == {}
+
+
+def test_read_blobs_reports_missing_objects(repo):
+    with pytest.raises(ScanError, match="missing object"):
+        read_blobs(str(repo), ["0" * 40])
+
+
+def test_plan_scan_against_a_git_ref(repo):
+    plan = plan_scan(str(repo), base_ref="HEAD")
+
+    assert plan.unchanged == ["svc/specs/b.json", "svc/specs/same.json"]
+    assert [(t.spec, t.status) for t in plan.tasks] == [
+        ("specs/a.json", MODIFIED),
+        ("svc/specs/gone.json", REMOVED),
+        ("svc/specs/new.json", ADDED),
+    ]
+    modified, removed, added = plan.tasks
+    # Old sides are read from git in one batch; new sides stay paths on disk.
+    assert json.loads(modified.old) == _spec()
+    assert modified.new == str(repo / "specs/a.json")
+    assert removed.new is None
+    assert added.old is None
+
+
+def test_unknown_ref_raises(repo):
+    with pytest.raises(ScanError):
+        plan_scan(str(repo), base_ref="no-such-branch")
+
+
+def test_not_a_git_repo_raises(tmp_path):
+    _put(tmp_path, "specs/a.json", _spec())
+
+    with pytest.raises(ScanError):
+        plan_scan(str(tmp_path), base_ref="HEAD")
+
+
+def test_plan_scan_against_a_baseline_dir(tmp_path):
+    base, root = tmp_path / "base", tmp_path / "root"
+    _put(base, "specs/a.json", _spec())
+    _put(base, "specs/same.json", _spec())
+    _put(root, "specs/a.json", _spec("string"))
+    _put(root, "specs/same.json", _spec())
+
+    plan = plan_scan(str(root), baseline_dir=str(base))
+
+    assert plan.unchanged == ["specs/same.json"]
+    assert plan.tasks[0].old == str(base / "specs/a.json")
+    with pytest.raises(ScanError, match="Baseline directory not found"):
+        plan_scan(str(root), baseline_dir=str(tmp_path / "missing"))
+
+
+def _age(path, seconds=60):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_stat_cache_reuses_hashes_while_mtime_and_size_match(tmp_path):
+    path = _put(tmp_path, "specs/a.json", _spec("number"))
+    _age(path)
+    cache_file = str(tmp_path / "cache" / "stat.json")
+    cache = StatCache(cache_file)
+    first = cache.hash(str(path))
+    cache.save()
+
+    # Same size and mtime: the cached hash is returned without reading.
+    stat = path.stat()
+    path.write_text(path.read_text().replace("number", "string"))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert StatCache(cache_file).hash(str(path)) == first
+
+    _age(path, 30)
+    assert StatCache(cache_file).hash(str(path)) == blob_hash(path.read_bytes()) != first
+
+
+def test_stat_cache_skips_recently_modified_files(tmp_path):
+    path = _put(tmp_path, "specs/a.json", _spec())
+    cache_file = tmp_path / "stat.json"
+    cache = StatCache(str(cache_file))
+
+    assert cache.hash(str(path)) == blob_hash(path.read_bytes())
+    cache.save()
+    assert not cache_file.exists()
+
+
+def _bad_tree(tmp_path):
+    (tmp_path / "base" / "specs").mkdir(parents=True)
+    root = tmp_path / "root"
+    (root / "specs").mkdir(parents=True)
+    (root / "specs" / "broken.json").write_text("{")
+    return root
+
+
+def test_iter_scan_reports_unreadable_specs(tmp_path):
+    plan = plan_scan(str(_bad_tree(tmp_path)), baseline_dir=str(tmp_path / "base"))
+
+    results = list(iter_scan(plan.tasks, workers=1))
+
+    assert [(r.spec, r.status) for r in results] == [("specs/broken.json", ADDED)]
+    assert results[0].error.startswith("JSONDecodeError")
+
+
+def test_non_object_specs_are_reported_per_spec(tmp_path):
+    root = _bad_tree(tmp_path)
+    (root / "specs" / "list.json").write_text("[1, 2]")
+    (root / "specs" / "bad_paths.json").write_text('{"paths": {"/a": 5}}')
+    _put(root, "specs/ok.json", _spec())
+
+    plan = plan_scan(str(root), baseline_dir=str(tmp_path / "base"))
+    results = {r.spec: r for r in iter_scan(plan.tasks, workers=1)}
+
+    assert results["specs/list.json"].error == "ValueError: expected a JSON object, got list"
+    assert results["specs/bad_paths.json"].error.startswith("AttributeError")
+    assert results["specs/ok.json"].error is None
+    assert len(results["specs/ok.json"].changes) == 1
+
+
+def test_write_scan_json_summary(repo):
+    plan = plan_scan(str(repo), base_ref="HEAD")
+    out = io.StringIO()
+
+    summary = write_scan(plan, iter_scan(plan.tasks, workers=1), "json", out, "HEAD")
+    report = json.loads(out.getvalue())
+
+    assert report["baseline"] == "HEAD"
+    assert report["summary"] == summary.to_dict() == {
+        "specs": 5,
+        "added": 1,
+        "removed": 1,
+        "modified": 1,
+        "unchanged": 2,
+        "changes": 3,
+        "breaking": 2,
+        "errors": 0,
+    }
+    assert [(e["spec"], [c["kind"] for c in e["changes"]]) for e in report["specs"]] == [
+        ("specs/a.json", [FIELD_TYPE_CHANGED]),
+        ("svc/specs/gone.json", [ENDPOINT_REMOVED]),
+        ("svc/specs/new.json", [ENDPOINT_ADDED]),
+    ]
+
+
+def test_write_scan_in_processes_matches_in_process(repo):
+    for i in range(6):
+        _put(repo, f"svc{i}/specs/x.json", _spec(extra={f"/extra{i}": {"GET": {}}}))
+    plan = plan_scan(str(repo), base_ref="HEAD")
+
+    serial, parallel = io.StringIO(), io.StringIO()
+    write_scan(plan, iter_scan(plan.tasks, workers=1), "ndjson", serial, "HEAD")
+    write_scan(plan, iter_scan(plan.tasks, workers=2), "ndjson", parallel, "HEAD")
+
+    assert parallel.getvalue() == serial.getvalue()
+    assert len(serial.getvalue().splitlines()) == 9
+
+
+def _scan(repo, *args):
+    return subprocess.run(
+        [sys.executable, CLI, "scan", "--root", str(repo), "--no-stat-cache", *args],
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_cli_scan_fail_on_exit_codes(repo):
+    breaking = _scan(repo, "--base-ref", "HEAD", "--fail-on", "breaking")
+    report_only = _scan(repo, "--base-ref", "HEAD")
+
+    assert breaking.returncode == 1
+    assert "2 breaking change(s) found (--fail-on breaking)" in breaking.stderr
+    assert report_only.returncode == 0
+    assert "Scanned 5 spec(s) against HEAD: 1 modified, 1 added, 1 removed" in (
+        report_only.stdout
+    )
+
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "update")
+    assert _scan(repo, "--base-ref", "HEAD", "--fail-on", "any").returncode == 0
+
+
+def test_cli_scan_lists_a_non_object_spec_as_an_error(repo):
+    (repo / "specs" / "list.json").write_text("[1, 2]")
+
+    result = _scan(repo, "--base-ref", "HEAD")
+
+    assert result.returncode == 1
+    assert "specs/list.json (added): error: ValueError: expected a JSON object" in result.stdout
+    assert "Traceback" not in result.stderr
+
+
+def test_cli_scan_unknown_ref_is_an_error(repo):
+    result = _scan(repo, "--base-ref", "no-such-branch")
+
+    assert result.returncode == 1
+    assert result.stdout.startswith("Error: ")
@@ -0,0 +1,199 @@
+# test_service.py
+"""ContractService endpoints, request framing and coalescing of generation jobs."""
+
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+
+from service import ContractService
+
+SPECS = Path(__file__).resolve().parent.parent / "specs"
+SPEC_V1 = json.loads((SPECS / "spec_v1.json").read_text())
+SPEC_V2 = json.loads((SPECS / "spec_v2.json").read_text())
+
+GENERATED = "def test_generated():\n    assert True\n"
+
+
+class _SlowClient:
+    """Stands in for an OllamaClient: counts calls, answers after a delay."""
+
+    model = "stub"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_test_code(self, diff_summary, spec_snippet):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return GENERATED
+
+
+def _run(test, client=None):
+    """Run test(service) against a started service on a free port."""
+
+    async def main():
+        async with ContractService([client or _SlowClient()], port=0) as service:
+            return await test(service)
+
+    return asyncio.run(main())
+
+
+async def _send(service, raw):
+    """Send raw request bytes; return [(status, decoded body)] and whether it closed."""
+    reader, writer = await asyncio.open_connection(service.host, service.port)
+    writer.write(raw)
+    await writer.drain()
+    responses = []
+    try:
+        while True:
+            status_line = await asyncio.wait_for(reader.readline(), 5)
+            if not status_line:
+                return responses, True
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            responses.append((int(status_line.split()[1]), json.loads(body)))
+            if headers.get("connection") == "close":
+                return responses, await reader.read() == b""
+    except asyncio.TimeoutError:
+        return responses, False
+    finally:
+        writer.close()
+
+
+def _request(method, path, body=b"", close=True):
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body).encode()
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    return head.encode() + b"\r\n" + body
+
+
+async def _call(service, method, path, body=b""):
+    responses, _ = await _send(service, _request(method, path, body))
+    return responses[0]
+
+
+def test_health_and_routing_errors():
+    async def test(service):
+        return [
+            await _call(service, "GET", "/health"),
+            await _call(service, "GET", "/compare"),
+            await _call(service, "POST", "/nope"),
+            await _call(service, "POST", "/compare", b"{not json"),
+            await _call(service, "POST", "/compare", {"old": SPEC_V1}),
+        ]
+
+    health, wrong_method, unknown, bad_json, missing = _run(test)
+
+    assert health == (200, {"status": "ok", "specs": 0})
+    assert wrong_method[0] == 405
+    assert unknown[0] == 404
+    assert bad_json[0] == 400 and "not valid JSON" in bad_json[1]["error"]
+    assert missing == (400, {"error": "'new' must be a spec object or a spec hash"})
+
+
+def test_compare_inline_and_by_uploaded_hash():
+    async def test(service):
+        upload = await _call(service, "POST", "/specs", json.dumps(SPEC_V1).encode())
+        old_hash = upload[1]["hash"]
+        by_hash = await _call(service, "POST", "/compare", {"old": old_hash, "new": SPEC_V2})
+        inline = await _call(service, "POST", "/compare", {"old": SPEC_V1, "new": SPEC_V2})
+        unknown = await _call(service, "POST", "/compare", {"old": "feed", "new": SPEC_V2})
+        return old_hash, by_hash, inline, unknown
+
+    old_hash, by_hash, inline, unknown = _run(test)
+
+    assert by_hash[0] == inline[0] == 200
+    assert by_hash[1]["old"] == old_hash
+    assert by_hash[1]["changes"] == inline[1]["changes"]
+    assert by_hash[1]["summary"][-1] == (
+        "Endpoint /widget GET: field 'amount' type changed from number to string"
+    )
+    assert unknown[0] == 404
+
+
+def test_keep_alive_serves_several_requests_per_connection():
+    async def test(service):
+        raw = _request("GET", "/health", close=False) + _request("GET", "/health")
+        return await _send(service, raw)
+
+    responses, closed = _run(test)
+
+    assert [status for status, _ in responses] == [200, 200]
+    assert closed
+
+
+def test_invalid_content_length_is_answered_with_400():
+    async def test(service):
+        results = []
+        for value in ("abc", "-5", "+5", "1_0"):
+            raw = f"POST /compare HTTP/1.1\r\nContent-Length: {value}\r\n\r\n{{}}".encode()
+            results.append(await _send(service, raw))
+        results.append(await _call(service, "GET", "/health"))
+        return results
+
+    *invalid, health = _run(test)
+
+    for responses, closed in invalid:
+        assert responses[0][0] == 400
+        assert responses[0][1]["error"].startswith("Invalid Content-Length")
+        assert closed
+    assert health[0] == 200
+
+
+def test_oversized_body_is_refused_without_reading_it():
+    async def test(service):
+        raw = b"POST /specs HTTP/1.1\r\nContent-Length: 999999999999\r\n\r\n"
+        return await _send(service, raw)
+
+    responses, closed = _run(test)
+
+    assert responses[0][0] == 413
+    assert closed
+
+
+def test_generate_uses_templates_for_simple_changes():
+    client = _SlowClient()
+
+    async def test(service):
+        return await _call(service, "POST", "/generate", {"old": SPEC_V1, "new": SPEC_V2})
+
+    status, result = _run(test, client)
+
+    assert status == 200
+    assert (result["templated"], result["jobs"], result["errors"]) == (4, 0, [])
+    assert "def test_" in result["code"]
+    compile(result["code"], "generated", "exec")
+    assert client.calls == 0
+
+
+def test_identical_generations_in_flight_are_coalesced():
+    client = _SlowClient(delay=0.5)
+    # A removed endpoint has no template, so it becomes an LLM job.
+    old = {"paths": {"/legacy": {"GET": {"response": {"status": 200, "schema": {}}}}}}
+    new = {"paths": {}}
+
+    async def test(service):
+        body = {"old": old, "new": new}
+        return await asyncio.gather(
+            _call(service, "POST", "/generate", body),
+            _call(service, "POST", "/generate", body),
+        )
+
+    results = [result for _, result in _run(test, client)]
+
+    assert client.calls == 1
+    assert sorted(r["coalesced"] for r in results) == [0, 1]
+    assert all(r["jobs"] == 1 and r["code"] == GENERATED for r in results)
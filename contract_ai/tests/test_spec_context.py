@@ -0,0 +1,85 @@
+# test_spec_context.py
+"""build_spec_context: changed operations, referenced components and the token budget."""
+
+import json
+
+from diff_engine import ENDPOINT_ADDED, Change, diff_changes
+from spec_context import build_spec_context, referenced_components
+from token_budget import estimate_tokens
+
+
+def _ref(name):
+    return {"$ref": f"#/components/schemas/{name}"}
+
+
+def _op(schema):
+    return {"response": {"status": 200, "schema": schema}}
+
+
+SCHEMAS = {
+    "Order": {"id": "string", "lines": [_ref("Line")], "customer": _ref("Customer")},
+    "Line": {"sku": "string", "order": _ref("Order")},
+    "Customer": {"name": "string"},
+    "Unused": {"x": "string"},
+}
+
+
+def test_referenced_components_are_transitive_and_cycle_safe():
+    assert referenced_components(_op(_ref("Order")), SCHEMAS) == ["Order", "Line", "Customer"]
+    assert referenced_components(_op(_ref("Line")), SCHEMAS) == ["Line", "Order", "Customer"]
+    assert referenced_components(_op(_ref("Missing")), SCHEMAS) == []
+
+
+def test_only_changed_operations_and_their_components_are_sent():
+    old = {"paths": {"/orders": {"GET": _op({"id": "string"})},
+                     "/legacy": {"DELETE": _op({})},
+                     "/other": {"GET": _op({})}},
+           "components": {"schemas": SCHEMAS}}
+    new = {"version": "2", "paths": {"/orders": {"GET": _op(_ref("Order"))},
+                                     "/other": {"GET": _op({})}},
+           "components": {"schemas": SCHEMAS}}
+
+    doc = json.loads(build_spec_context(diff_changes(old, new), old, new))
+
+    assert doc["version"] == "2"
+    assert doc["paths"] == {"/legacy": {"DELETE": old["paths"]["/legacy"]["DELETE"]},
+                            "/orders": {"GET": new["paths"]["/orders"]["GET"]}}
+    assert list(doc["components"]["schemas"]) == ["Order", "Line", "Customer"]
+    assert "omitted" not in doc
+
+
+def _many_operations(count):
+    schema = {f"field{i}": "string" for i in range(10)}
+    return {"paths": {f"/r{i}": {"GET": _op(schema)} for i in range(count)}}
+
+
+def test_operations_over_budget_are_listed_as_omitted():
+    spec = _many_operations(40)
+
+    text = build_spec_context(None, {}, spec, max_tokens=300)
+    doc = json.loads(text)
+
+    assert estimate_tokens(text) <= 300
+    assert 0 < len(doc["paths"]) < 40
+    assert doc["omitted"][0] == f"GET /r{len(doc['paths'])}"
+    assert doc["omitted"][-1].startswith("... and ")
+    listed = len(doc["paths"]) + len(doc["omitted"]) - 1
+    assert listed + int(doc["omitted"][-1].split()[2]) == 40
+
+
+def test_changes_none_selects_every_operation_in_file_order():
+    spec = _many_operations(3)
+
+    doc = json.loads(build_spec_context(None, {}, spec))
+
+    assert list(doc["paths"]) == ["/r0", "/r1", "/r2"]
+
+
+def test_an_operation_over_budget_on_its_own_is_cut():
+    spec = _many_operations(1)
+    change = Change(ENDPOINT_ADDED, "/r0", methods=("GET",))
+
+    text = build_spec_context([change], {}, spec, max_tokens=20)
+
+    assert text.endswith("\n... (truncated)")
+    assert text.startswith('{"version":null,"paths":{"/r0":{"GET":')
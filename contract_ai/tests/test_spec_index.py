@@ -0,0 +1,150 @@
+# test_spec_index.py
+"""Snapshot indexes and diffing a spec against one."""
+
+import json
+import sqlite3
+
+import pytest
+
+from diff_engine import ENDPOINT_ADDED, ENDPOINT_REMOVED, diff_changes, iter_diff_snapshot
+from spec_index import SnapshotError, SpecSnapshot, build_index, canonical_hash, raw_hash
+
+
+def _op(schema):
+    return {"response": {"status": 200, "schema": schema}}
+
+
+def _ref(name):
+    return {"$ref": f"#/components/schemas/{name}"}
+
+
+OLD = {
+    "version": "1.0",
+    "paths": {
+        "/widget": {"GET": _op({"id": "string", "amount": "number"})},
+        "/order": {"GET": _op({"price": _ref("Money")}), "DELETE": _op({})},
+        "/static": {"GET": _op({"name": "string"})},
+        "/legacy": {"GET": _op({})},
+    },
+    "components": {"schemas": {"Money": {"amount": "number"}}},
+}
+
+
+def _write(tmp_path, name, spec):
+    path = tmp_path / name
+    path.write_text(json.dumps(spec, indent=2))
+    return str(path)
+
+
+def _snapshot_diff(tmp_path, old, new):
+    index = str(tmp_path / "old.idx")
+    build_index(_write(tmp_path, "old.json", old), index)
+    new_path = _write(tmp_path, "new.json", new)
+    with SpecSnapshot(index) as snapshot:
+        return list(iter_diff_snapshot(snapshot, new_path))
+
+
+def _key(change):
+    return tuple(str(value) for value in change)
+
+
+def test_build_index_stores_every_operation(tmp_path):
+    index = str(tmp_path / "old.idx")
+
+    assert build_index(_write(tmp_path, "old.json", OLD), index) == 5
+    with SpecSnapshot(index) as snapshot:
+        assert snapshot.spec_version == "1.0"
+        assert list(snapshot.path_hashes()) == ["/widget", "/order", "/static", "/legacy"]
+        assert list(snapshot.operations("/order")) == ["GET", "DELETE"]
+        assert snapshot.operations("/order")["GET"].has_ref
+        assert not snapshot.operations("/widget")["GET"].has_ref
+        assert snapshot.load_operation("/widget", "GET") == OLD["paths"]["/widget"]["GET"]
+        assert snapshot.load_operation("/widget", "POST") is None
+
+
+def test_snapshot_diff_matches_a_full_diff(tmp_path):
+    new = json.loads(json.dumps(OLD))
+    new["paths"]["/widget"]["GET"] = _op({"id": "string", "amount": "string", "url": "string"})
+    new["paths"]["/order"]["POST"] = _op({})
+    del new["paths"]["/order"]["DELETE"]
+    del new["paths"]["/legacy"]
+    new["paths"]["/health"] = {"GET": _op({"status": "string"})}
+
+    changes = _snapshot_diff(tmp_path, OLD, new)
+
+    assert sorted(changes, key=_key) == sorted(diff_changes(OLD, new), key=_key)
+    # Added and common endpoints follow the new file, removed ones come last.
+    assert changes[-1].kind == ENDPOINT_REMOVED
+    assert [c.kind for c in changes if c.path == "/health"] == [ENDPOINT_ADDED]
+
+
+def test_unchanged_paths_are_not_loaded_from_the_snapshot(tmp_path, monkeypatch):
+    new = json.loads(json.dumps(OLD))
+    new["paths"]["/widget"]["GET"] = _op({"id": "string", "amount": "string"})
+    loaded = []
+    original = SpecSnapshot.load_operation
+
+    def recording(self, path, method):
+        loaded.append((path, method))
+        return original(self, path, method)
+
+    monkeypatch.setattr(SpecSnapshot, "load_operation", recording)
+
+    changes = _snapshot_diff(tmp_path, OLD, new)
+
+    assert [(c.path, c.field) for c in changes] == [("/widget", "amount")]
+    assert loaded == [("/widget", "GET")]
+
+
+def test_identical_spec_has_no_changes(tmp_path):
+    assert _snapshot_diff(tmp_path, OLD, OLD) == []
+
+
+def test_component_change_rediffs_operations_that_use_ref(tmp_path, monkeypatch):
+    new = json.loads(json.dumps(OLD))
+    new["components"]["schemas"]["Money"] = {"amount": "string"}
+    loaded = []
+    original = SpecSnapshot.load_operation
+
+    def recording(self, path, method):
+        loaded.append((path, method))
+        return original(self, path, method)
+
+    monkeypatch.setattr(SpecSnapshot, "load_operation", recording)
+
+    changes = _snapshot_diff(tmp_path, OLD, new)
+
+    assert changes == diff_changes(OLD, new)
+    assert [(c.path, c.field) for c in changes] == [("/order", "price.amount")]
+    assert loaded == [("/order", "GET")]
+
+
+def test_missing_index_raises(tmp_path):
+    with pytest.raises(SnapshotError, match="not found"):
+        SpecSnapshot(str(tmp_path / "absent.idx"))
+
+
+def test_non_index_file_raises(tmp_path):
+    bogus = tmp_path / "bogus.idx"
+    bogus.write_text("not a database")
+
+    with pytest.raises(SnapshotError, match="Not a snapshot index"):
+        SpecSnapshot(str(bogus))
+
+
+def test_other_format_version_raises(tmp_path):
+    index = tmp_path / "old.idx"
+    build_index(_write(tmp_path, "old.json", OLD), str(index))
+    conn = sqlite3.connect(index)
+    conn.execute("UPDATE meta SET value = '0' WHERE key = 'format_version'")
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(SnapshotError, match="rebuild it"):
+        SpecSnapshot(str(index))
+
+
+def test_hashes():
+    assert raw_hash(b'{"a": 1}') != raw_hash(b'{"a":1}')
+    assert canonical_hash({"a": 1, "b": [2]}) == canonical_hash({"b": [2], "a": 1})
+    assert canonical_hash({"a": 1}) != canonical_hash({"a": 1.5})
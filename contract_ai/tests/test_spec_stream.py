@@ -0,0 +1,115 @@
+# test_spec_stream.py
+"""LazySpec's byte-span scanner on well-formed, truncated and malformed specs."""
+
+import json
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from diff_engine import diff_changes, iter_diff_files
+from spec_stream import LazySpec, SpecFormatError
+
+ROOT = Path(__file__).resolve().parent.parent
+SPEC_V1 = ROOT / "specs" / "spec_v1.json"
+SPEC_V2 = ROOT / "specs" / "spec_v2.json"
+
+
+def _write(tmp_path, text, name="spec.json"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_spans_decode_to_the_same_values_as_json_load():
+    expected = json.loads(SPEC_V2.read_text())
+
+    with LazySpec(str(SPEC_V2)) as spec:
+        assert spec.get("version") == expected["version"]
+        assert spec.get("components", "none") == "none"
+        spans = spec.path_spans()
+        assert list(spans) == list(expected["paths"])
+        assert {p: json.loads(spec.raw(s)) for p, s in spans.items()} == expected["paths"]
+        assert dict(spec.iter_paths()) == expected["paths"]
+
+
+def test_brackets_and_escapes_inside_strings_are_not_structure(tmp_path):
+    paths = {
+        "/a/{id}": {"GET": {"description": 'quote \\" ] } [ {', "tags": ["[", "}"]}},
+        "/b": {"GET": {"n": [1, [2, {"x": None}]], "ok": True}},
+    }
+    path = _write(tmp_path, json.dumps({"paths": paths, "version": "1"}, indent=2))
+
+    with LazySpec(path) as spec:
+        assert dict(spec.iter_paths()) == paths
+        assert spec.get("version") == "1"
+
+
+def test_spec_without_paths_has_no_entries(tmp_path):
+    with LazySpec(_write(tmp_path, '{"version": "1"}')) as spec:
+        assert spec.path_spans() == {}
+        assert list(spec.iter_paths()) == []
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("", "Spec file is empty"),
+        ("[1, 2]", "Expected b'{' at byte 0"),
+        ('{"paths" {}}', "Expected b':' at byte 9"),
+        ('{"version": "1.0}', "Unterminated string at byte 12"),
+        ('{"paths": {"/a": {} "/b": {}}}', "Expected b'}' at byte 20"),
+        ('{"paths": {"/a": {"GET": [}}', "Unexpected end of file"),
+        ('{"paths": {"/a": }}', "Expected a value"),
+        ('{"paths": {}', "Expected b'}' at byte 12, found b'end of file'"),
+    ],
+)
+def test_malformed_specs_raise_spec_format_error(tmp_path, text, message):
+    with pytest.raises(SpecFormatError, match=re.escape(message)):
+        with LazySpec(_write(tmp_path, text)) as spec:
+            spec.path_spans()
+
+
+def test_iter_diff_files_matches_diff_changes():
+    old, new = (json.loads(p.read_text()) for p in (SPEC_V1, SPEC_V2))
+
+    streamed = list(iter_diff_files(str(SPEC_V1), str(SPEC_V2)))
+
+    assert sorted(streamed) == sorted(diff_changes(old, new))
+    assert list(iter_diff_files(str(SPEC_V2), str(SPEC_V2))) == []
+
+
+def _truncated(tmp_path, indent=34):
+    """spec_v2 pretty-printed, cut inside "paths", then a run of indentation."""
+    text = json.dumps(json.loads(SPEC_V2.read_text()), indent=4)
+    cut = text.index("\n", text.index('"paths"') + 60) + 1
+    path = tmp_path / "truncated.json"
+    path.write_text(text[:cut] + " " * indent)
+    return path
+
+
+def test_truncated_indented_spec_fails_fast(tmp_path):
+    path = _truncated(tmp_path, indent=10_000)
+
+    start = time.monotonic()
+    with pytest.raises(SpecFormatError, match="end of file"):
+        with LazySpec(str(path)) as spec:
+            spec.path_spans()
+    assert time.monotonic() - start < 1.0
+
+
+def test_streaming_compare_reports_a_truncated_spec(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "cli.py", "compare", "--streaming",
+         "--old", str(SPEC_V1), "--new", str(_truncated(tmp_path))],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+    assert result.returncode == 1
+    assert "Error: Unexpected end of file inside a container" in result.stdout + result.stderr
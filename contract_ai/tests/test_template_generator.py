@@ -0,0 +1,151 @@
+# test_template_generator.py
+"""Template-generated tests, what is left for the LLM, and generate-tests on LLM failure."""
+
+import json
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+from diff_engine import ENDPOINT_REMOVED, FIELD_ADDED, REQUEST, diff_changes
+from generation import merge_test_modules
+from template_generator import generate_template_tests
+
+ROOT = Path(__file__).resolve().parent.parent
+SPEC_V1 = json.loads((ROOT / "specs" / "spec_v1.json").read_text())
+SPEC_V2 = json.loads((ROOT / "specs" / "spec_v2.json").read_text())
+
+
+def _op(schema):
+    return {"response": {"status": 200, "schema": schema}}
+
+
+def _run_pytest(tmp_path, code):
+    module = tmp_path / "test_generated.py"
+    module.write_text(code)
+    return subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", str(module)],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_simple_changes_are_all_templated():
+    modules, leftover = generate_template_tests(diff_changes(SPEC_V1, SPEC_V2), SPEC_V2)
+
+    assert leftover == []
+    assert list(modules) == [("/health", ""), ("/order", "GET"), ("/widget", "GET")]
+    widget = modules[("/widget", "GET")]
+    assert "def test_widget_get_review_url_field_added():" in widget
+    assert "def test_widget_get_amount_type_change():" in widget
+
+
+def test_templated_modules_pass_under_pytest(tmp_path):
+    modules, _ = generate_template_tests(diff_changes(SPEC_V1, SPEC_V2), SPEC_V2)
+
+    result = _run_pytest(tmp_path, merge_test_modules(list(modules.values())))
+
+    assert result.returncode == 0, result.stdout
+    assert "6 passed" in result.stdout
+
+
+def test_refs_nested_objects_and_removed_fields_pass_under_pytest(tmp_path):
+    schemas = {"Money": {"amount": "number", "currency": "string"}}
+    old = {"paths": {"/o": {"GET": _op({"id": "string", "legacy": "boolean"})}}}
+    new = {
+        "paths": {
+            "/o": {"GET": _op({"id": "string"})},
+            "/p": {"POST": _op({"price": {"$ref": "#/components/schemas/Money"},
+                                "tags": ["string"], "ok": "boolean"})},
+        },
+        "components": {"schemas": schemas},
+    }
+
+    modules, leftover = generate_template_tests(diff_changes(old, new), new)
+    code = merge_test_modules(list(modules.values()))
+    result = _run_pytest(tmp_path, code)
+
+    assert leftover == []
+    assert '"price": {"amount": 1.5, "currency": "sample-currency"}' in code
+    assert 'assert "legacy" not in response' in code
+    assert result.returncode == 0, result.stdout
+
+
+def test_changes_without_a_template_are_left_for_the_llm():
+    old = {
+        "paths": {
+            "/legacy": {"GET": _op({})},
+            "/o": {"POST": {**_op({"a": {"b": "string"}}), "request": {"schema": {}}}},
+            "/x": {"GET": _op({"n": "string"})},
+        }
+    }
+    new = {
+        "paths": {
+            "/o": {"POST": {**_op({"a": {"b": "number"}}),
+                            "request": {"schema": {"qty": "number"}}}},
+            "/x": {"GET": _op({"n": "uuid"})},
+        }
+    }
+    changes = diff_changes(old, new)
+
+    modules, leftover = generate_template_tests(changes, new)
+
+    assert modules == {}
+    assert leftover == changes
+    assert {c.kind for c in leftover} >= {ENDPOINT_REMOVED, FIELD_ADDED}
+    assert any(c.location == REQUEST for c in leftover)
+
+
+# -- generate-tests when the LLM fails ------------------------------------------
+
+
+def _dead_ollama_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api/chat"
+
+
+def _mixed_specs(tmp_path):
+    """spec_v1 -> spec_v2 (templated) plus a removed endpoint (needs the LLM)."""
+    old = json.loads(json.dumps(SPEC_V1))
+    old["paths"]["/legacy"] = {"GET": _op({"id": "string"})}
+    old_path, new_path = tmp_path / "old.json", tmp_path / "new.json"
+    old_path.write_text(json.dumps(old))
+    new_path.write_text(json.dumps(SPEC_V2))
+    return old_path, new_path
+
+
+def _generate(tmp_path, *extra):
+    old, new = _mixed_specs(tmp_path)
+    output = tmp_path / "out" / "test_contract.py"
+    output.parent.mkdir()
+    output.write_text("# previous good tests\n")
+    result = subprocess.run(
+        [sys.executable, "cli.py", "generate-tests", "--old", str(old), "--new", str(new),
+         "--output", str(output), "--no-cache", "--retries", "0",
+         "--ollama-url", _dead_ollama_url(), *extra],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result, output
+
+
+def test_failed_llm_call_keeps_templated_tests_and_exits_1(tmp_path):
+    result, output = _generate(tmp_path)
+
+    assert result.returncode == 1
+    assert "Error calling Ollama" in result.stdout
+    code = output.read_text()
+    assert "def test_widget_get_amount_type_change():" in code
+    assert _run_pytest(tmp_path, code).returncode == 0
+
+
+def test_failed_per_endpoint_jobs_keep_templated_tests_and_exit_1(tmp_path):
+    result, output = _generate(tmp_path, "--per-endpoint")
+
+    assert result.returncode == 1
+    assert "Error generating tests for /legacy" in result.stdout
+    assert "def test_widget_get_amount_type_change():" in output.read_text()
@@ -0,0 +1,79 @@
+# test_token_budget.py
+"""Token estimates, prompt sizing and the usage log."""
+
+import json
+import threading
+
+from ai_client_ollama import build_test_generation_messages, estimate_prompt_size
+from token_budget import (
+    MESSAGE_OVERHEAD_TOKENS,
+    UsageLog,
+    estimate_message_tokens,
+    estimate_tokens,
+    usage_from_response,
+)
+
+
+def test_estimates_follow_the_documented_rules():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello") == 1
+    assert estimate_tokens(" international") == 3  # 13 letters, leading space free
+    assert estimate_tokens("1234567") == 3
+    assert estimate_tokens('{"a":') == 3  # '{"', 'a', '":'
+    assert estimate_tokens("a\n    b") == 3
+
+
+def test_message_tokens_include_template_overhead():
+    messages = [{"role": "system", "content": "hello"}, {"role": "user", "content": ""}]
+
+    assert estimate_message_tokens(messages) == 1 + 3 * MESSAGE_OVERHEAD_TOKENS
+
+
+def test_prompt_size_splits_user_tokens_into_spec_and_diff():
+    size = estimate_prompt_size("field added " * 50, '{"paths":{}}' * 20)
+    system, user = build_test_generation_messages("field added " * 50, '{"paths":{}}' * 20)
+
+    assert size.total == estimate_message_tokens([system, user])
+    assert size.system_tokens == estimate_tokens(system["content"])
+    assert size.user_tokens == estimate_tokens(user["content"])
+    assert size.diff_tokens == estimate_tokens("field added " * 50)
+    assert size.spec_tokens + size.diff_tokens < size.user_tokens
+
+
+def test_usage_from_response_converts_durations():
+    usage = usage_from_response(
+        {"prompt_eval_count": 100, "eval_count": 40, "prompt_eval_duration": 500_000_000,
+         "eval_duration": 2_000_000_000},
+        "llama3",
+        90,
+    )
+
+    assert usage.model == "llama3"
+    assert (usage.prompt_tokens, usage.completion_tokens) == (100, 40)
+    assert (usage.prompt_eval_seconds, usage.eval_seconds, usage.total_seconds) == (0.5, 2.0, None)
+
+
+def test_usage_log_totals_throughput_and_appends_ndjson(tmp_path):
+    path = tmp_path / "usage.ndjson"
+    log = UsageLog(str(path))
+    data = {"prompt_eval_count": 100, "eval_count": 40, "prompt_eval_duration": 500_000_000,
+            "eval_duration": 2_000_000_000}
+    threads = [
+        threading.Thread(target=log.record, args=(usage_from_response(data, "m", 90),))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.record(usage_from_response({}, "m", 10))
+
+    summary = log.summary()
+
+    assert summary["requests"] == 5
+    assert (summary["estimated_prompt_tokens"], summary["prompt_tokens"]) == (370, 400)
+    assert summary["prompt_tokens_per_second"] == 200.0
+    assert summary["completion_tokens_per_second"] == 20.0
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 5 and lines[-1]["prompt_tokens"] is None
+    assert UsageLog().summary()["completion_tokens_per_second"] is None
@@ -0,0 +1,126 @@
+# test_validation.py
+"""Validation of generated modules function by function, and the repair loop."""
+
+import threading
+
+from validation import (
+    FunctionFailure,
+    disable_functions,
+    join_chunks,
+    repair_module,
+    split_module,
+    validate_module,
+    validate_modules,
+)
+
+MODULE = '''import pytest
+
+
+@pytest.fixture
+def widget():
+    return {"id": "w"}
+
+
+def test_passes(widget):
+    assert widget["id"] == "w"
+
+
+def test_fails(widget):
+    assert widget["id"] == "x"
+
+
+def test_broken_syntax(widget):
+    assert widget[
+
+
+def test_unknown_fixture(order):
+    assert order
+'''
+
+
+class _Client:
+    """Answers repair prompts from a {function name: answer} table."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.asked = []
+        self._lock = threading.Lock()
+
+    def chat(self, messages):
+        prompt = messages[-1]["content"]
+        name = next(n for n in self.answers if f"def {n}(" in prompt)
+        with self._lock:
+            self.asked.append(name)
+        return self.answers[name]
+
+
+def test_split_and_join_round_trip():
+    chunks = split_module(MODULE.replace("assert widget[\n", "assert widget\n"))
+
+    assert [(c.name, c.is_test) for c in chunks] == [
+        (None, False), ("widget", False), ("test_passes", True), ("test_fails", True),
+        ("test_broken_syntax", True), ("test_unknown_fixture", True),
+    ]
+    assert chunks[1].source.startswith("@pytest.fixture\ndef widget():")
+    assert join_chunks(chunks) == MODULE.replace("assert widget[\n", "assert widget\n")
+
+
+def test_unparsable_module_is_split_by_lines():
+    names = [c.name for c in split_module(MODULE) if c.is_test]
+
+    assert names == ["test_passes", "test_fails", "test_broken_syntax", "test_unknown_fixture"]
+
+
+def test_each_failing_function_is_reported_on_its_own():
+    report = validate_module(MODULE)
+
+    assert report.tests == 4 and report.module_error is None
+    errors = {f.name: f.error for f in report.failures}
+    assert list(errors) == ["test_broken_syntax", "test_fails", "test_unknown_fixture"]
+    assert errors["test_broken_syntax"].startswith("SyntaxError")
+    assert "line 2 of the function" in errors["test_broken_syntax"]
+    assert "assert 'w' == 'x'" in errors["test_fails"]
+    assert "fixture 'order' not found" in errors["test_unknown_fixture"]
+
+
+def test_broken_shared_code_is_a_module_error():
+    report = validate_module("import pytest\nx = (\n\n\ndef test_a():\n    pass\n")
+
+    assert not report.ok
+    assert report.module_error.startswith("SyntaxError in shared code")
+
+
+def test_repair_splices_fixes_and_disables_what_still_fails():
+    client = _Client({
+        "test_fails": '```python\ndef test_fails(widget):\n    assert widget["id"] == "w"\n```',
+        # Renamed by the model and needing an import: both are handled.
+        "test_broken_syntax": "import json\n\n\ndef test_other(widget):\n"
+                              "    assert json.dumps(widget)\n",
+        "test_unknown_fixture": "def test_unknown_fixture(order):\n    assert order\n",
+    })
+
+    result = repair_module(MODULE, client, max_rounds=2)
+
+    assert sorted(result.repaired) == ["test_broken_syntax", "test_fails"]
+    assert result.disabled == ["test_unknown_fixture"]
+    assert result.rounds == 2
+    assert client.asked.count("test_fails") == 1
+    assert result.code.startswith("import json\nimport pytest\n")
+    assert "# Disabled by validation (" in result.code
+    assert validate_module(result.code).ok
+
+
+def test_disable_keeps_the_module_collectable():
+    code = disable_functions(MODULE, [FunctionFailure("test_broken_syntax", "SyntaxError: x")])
+
+    compile(code, "disabled", "exec")
+    assert "# Disabled by validation (SyntaxError: x):\n# def test_broken_syntax" in code
+
+
+def test_validate_modules_keeps_keys():
+    ok = "def test_ok():\n    assert True\n"
+
+    reports = validate_modules({("/a", "GET"): ok, ("/b", "GET"): MODULE}, workers=2)
+
+    assert reports[("/a", "GET")].ok
+    assert len(reports[("/b", "GET")].failures) == 3
@@ -0,0 +1,142 @@
+# token_budget.py
+"""
+Token estimation and usage accounting for Ollama prompts.
+
+We do not ship the model's tokenizer, so estimate_tokens() approximates a
+BPE vocabulary (llama-style) with a regex pass: words cost roughly one token
+per 6 letters (a leading space is free), numbers one per 3 digits, runs of
+punctuation one per 2 characters, and each newline/indent run one. This is
+accurate enough to keep prompts inside a budget and to size hardware; the
+exact counts come back from Ollama and are recorded in a UsageLog.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+# Chat template overhead per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Default cap on a whole prompt: llama3's 8k context minus room for the answer
+DEFAULT_MAX_PROMPT_TOKENS = 6144
+
+_PIECE_RE = re.compile(r" ?[A-Za-z]+| ?\d+|\s+|[^\sA-Za-z\d]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of tokens the model sees for text."""
+    count = 0
+    for piece in _PIECE_RE.findall(text):
+        last = piece[-1]
+        if last.isalpha():
+            count += -(-len(piece.lstrip(" ")) // 6)
+        elif last.isdigit():
+            count += -(-len(piece.lstrip(" ")) // 3)
+        elif last.isspace():
+            count += 1
+        else:
+            count += -(-len(piece) // 2)
+    return count
+
+
+def estimate_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    """Approximate prompt tokens of a chat request, template overhead included."""
+    return sum(
+        estimate_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    ) + MESSAGE_OVERHEAD_TOKENS
+
+
+class PromptSize(NamedTuple):
+    """
+    Estimated token counts of one test-generation prompt. total includes the
+    chat template overhead; spec_tokens and diff_tokens are the parts of
+    user_tokens taken by the spec snippet and the diff summary.
+    """
+
+    total: int
+    system_tokens: int
+    user_tokens: int
+    spec_tokens: int
+    diff_tokens: int
+
+
+class Usage(NamedTuple):
+    """
+    Token counts and timings of one completed request, as reported by Ollama
+    (prompt_eval_count, eval_count, prompt_eval_duration, eval_duration),
+    plus our estimate of the prompt for comparison.
+    """
+
+    model: str
+    estimated_prompt_tokens: int
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    prompt_eval_seconds: Optional[float]
+    eval_seconds: Optional[float]
+    total_seconds: Optional[float]
+
+
+def _seconds(nanoseconds: Any) -> Optional[float]:
+    return nanoseconds / 1e9 if isinstance(nanoseconds, (int, float)) else None
+
+
+def usage_from_response(
+    data: Dict[str, Any], model: str, estimated_prompt_tokens: int
+) -> Usage:
+    """Build a Usage from an Ollama /api/chat response (or final stream chunk)."""
+    return Usage(
+        model=data.get("model") or model,
+        estimated_prompt_tokens=estimated_prompt_tokens,
+        prompt_tokens=data.get("prompt_eval_count"),
+        completion_tokens=data.get("eval_count"),
+        prompt_eval_seconds=_seconds(data.get("prompt_eval_duration")),
+        eval_seconds=_seconds(data.get("eval_duration")),
+        total_seconds=_seconds(data.get("total_duration")),
+    )
+
+
+class UsageLog:
+    """
+    Thread-safe record of Usage entries. Share one log between clients to
+    total a whole run; pass path to also append each entry as an NDJSON line.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.entries: List[Usage] = []
+        self._lock = threading.Lock()
+
+    def record(self, usage: Usage) -> None:
+        with self._lock:
+            self.entries.append(usage)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(usage._asdict(), separators=(",", ":")) + "\n")
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals over all entries, with prefill and generation throughput."""
+        with self._lock:
+            entries = list(self.entries)
+
+        def total(field: str) -> float:
+            return sum(getattr(u, field) or 0 for u in entries)
+
+        prompt_eval = total("prompt_eval_seconds")
+        evals = total("eval_seconds")
+        return {
+            "requests": len(entries),
+            "estimated_prompt_tokens": int(total("estimated_prompt_tokens")),
+            "prompt_tokens": int(total("prompt_tokens")),
+            "completion_tokens": int(total("completion_tokens")),
+            "prompt_eval_seconds": round(prompt_eval, 3),
+            "eval_seconds": round(evals, 3),
+            "prompt_tokens_per_second": (
+                round(total("prompt_tokens") / prompt_eval, 1) if prompt_eval else None
+            ),
+            "completion_tokens_per_second": (
+                round(total("completion_tokens") / evals, 1) if evals else None
+            ),
+        }
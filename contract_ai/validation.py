@@ -0,0 +1,380 @@
+# validation.py
+"""
+Validation and repair of generated pytest modules.
+
+LLM output often fails before a single assert runs: syntax errors,
+parametrize lists that do not match the signature, fixtures that do not
+exist (see tests/test_contract_v3.py). This stage:
+
+- splits a module into shared code (imports, helpers, fixtures) and its
+  test functions
+- compiles each test function together with the shared code, then runs all
+  of them in one pytest worker process, one file per function, so a broken
+  function cannot hide the others behind a module-wide collection error
+- re-prompts the model with just the failing function and its error, splices
+  the answer back in, and revalidates, for at most max_rounds rounds
+- comments out functions that still fail, so the module always collects
+
+validate_modules() and repair_modules() process many modules concurrently,
+one pytest process per module.
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Hashable, List, NamedTuple, Optional, Protocol, Tuple, TypeVar
+
+from ai_client_ollama import OllamaError, build_repair_messages
+from metrics import VALIDATED_FUNCTIONS, VALIDATION_FAILURES
+
+DEFAULT_REPAIR_ROUNDS = 2
+DEFAULT_TIMEOUT_SECONDS = 60.0
+MAX_ERROR_CHARS = 1500
+
+K = TypeVar("K", bound=Hashable)
+
+# Top-level line that starts a new chunk when the module does not parse
+_CHUNK_START_RE = re.compile(r"^(?:@|def |async def |class |[A-Za-z_])")
+_CHUNK_NAME_RE = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)", re.MULTILINE)
+_FENCE_RE = re.compile(r"^```[\w-]*\s*$", re.MULTILINE)
+
+
+class ChatClient(Protocol):
+    """Anything that can answer a chat request (OllamaClient, HostPool)."""
+
+    def chat(self, messages: List[Dict[str, str]]) -> str: ...
+
+
+class Chunk(NamedTuple):
+    """A top-level piece of a module: a test function/class or shared code."""
+
+    name: Optional[str]
+    source: str
+    is_test: bool
+
+
+class FunctionFailure(NamedTuple):
+    """One test function that failed to compile, collect or pass."""
+
+    name: str
+    error: str
+
+
+class ModuleReport(NamedTuple):
+    """
+    Validation outcome of one module. module_error is set when the shared
+    code itself is broken (no single function to blame); failures lists the
+    failing test functions.
+    """
+
+    tests: int
+    failures: List[FunctionFailure]
+    module_error: Optional[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures and self.module_error is None
+
+
+class RepairResult(NamedTuple):
+    """Final code of a module after the repair loop, and what happened."""
+
+    code: str
+    report: ModuleReport
+    rounds: int
+    repaired: List[str]
+    disabled: List[str]
+
+
+def _is_test_name(name: Optional[str]) -> bool:
+    return bool(name) and (name.startswith("test") or name.startswith("Test"))
+
+
+def split_module(code: str) -> List[Chunk]:
+    """
+    Split module source into top-level chunks, in order. Comments and blank
+    lines before a definition belong to it. Uses the AST when the module
+    parses, and a line-based fallback when it does not.
+    """
+    lines = code.splitlines()
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        starts = [
+            i for i, line in enumerate(lines)
+            if _CHUNK_START_RE.match(line) and not (i and lines[i - 1].startswith("@"))
+        ]
+    else:
+        starts = [
+            min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+            for node in tree.body
+        ]
+
+    chunks: List[Chunk] = []
+    bounds = [0] + starts[1:] + [len(lines)] if starts else [0, len(lines)]
+    for begin, end in zip(bounds, bounds[1:]):
+        source = "\n".join(lines[begin:end]).rstrip()
+        if not source:
+            continue
+        m = _CHUNK_NAME_RE.search(source)
+        name = m.group(1) if m and not source.lstrip().startswith(("import ", "from ")) else None
+        chunks.append(Chunk(name, source, _is_test_name(name)))
+    return chunks
+
+
+def _is_import(chunk: Chunk) -> bool:
+    return chunk.source.startswith(("import ", "from "))
+
+
+def join_chunks(chunks: List[Chunk]) -> str:
+    """Reassemble chunks into module source (imports kept together)."""
+    parts: List[str] = []
+    for prev, chunk in zip([None] + chunks[:-1], chunks):
+        if parts:
+            parts.append("\n" if _is_import(prev) and _is_import(chunk) else "\n\n\n")
+        parts.append(chunk.source)
+    return "".join(parts) + "\n"
+
+
+def _short_error(text: str) -> str:
+    """Keep the informative lines of a pytest error report."""
+    lines = text.strip().splitlines()
+    picked = [
+        l for l in lines
+        if l.startswith(("E ", "In ", "SyntaxError")) or "Error" in l.split(":")[0]
+    ]
+    text = "\n".join(picked or lines[-15:])
+    return text[:MAX_ERROR_CHARS]
+
+
+def _syntax_error(exc: SyntaxError, offset: int) -> str:
+    line = (exc.lineno or 0) - offset
+    return f"SyntaxError: {exc.msg} (line {line} of the function)"
+
+
+def _run_pytest(
+    files: Dict[str, str], timeout_seconds: float
+) -> Tuple[Dict[str, str], Optional[str]]:
+    """
+    Run pytest over files (name -> source) in a scratch directory. Returns
+    ({file stem: first error}, None), or ({}, reason) if pytest itself could
+    not run.
+    """
+    with tempfile.TemporaryDirectory(prefix="contract_ai_validate_") as tmp:
+        root = Path(tmp)
+        (root / "pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+        for name, source in files.items():
+            (root / name).write_text(source, encoding="utf-8")
+        report = root / "report.xml"
+        cmd = [
+            sys.executable, "-m", "pytest", "-q",
+            "-p", "no:cacheprovider",
+            "-c", str(root / "pytest.ini"),
+            "--rootdir", str(root),
+            "--continue-on-collection-errors",
+            f"--junitxml={report}",
+            *sorted(files),
+        ]
+        try:
+            proc = subprocess.run(
+                cmd, cwd=root, capture_output=True, text=True, timeout=timeout_seconds
+            )
+        except subprocess.TimeoutExpired:
+            return {}, f"pytest timed out after {timeout_seconds}s"
+        if not report.is_file():
+            return {}, _short_error(proc.stdout + proc.stderr) or "pytest did not run"
+
+        errors: Dict[str, str] = {}
+        for case in ElementTree.parse(report).iter("testcase"):
+            problem = case.find("error")
+            if problem is None:
+                problem = case.find("failure")
+            if problem is None:
+                continue
+            # classname is "<file stem>[.<class>]", or empty for collection errors
+            stem = (case.get("classname") or case.get("name") or "").split(".")[0]
+            errors.setdefault(stem, _short_error(problem.text or problem.get("message", "")))
+        return errors, None
+
+
+def validate_module(code: str, timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS) -> ModuleReport:
+    """Compile, collect and run every test function of a module in isolation."""
+    chunks = split_module(code)
+    shared = "\n\n\n".join(c.source for c in chunks if not c.is_test)
+    tests = [c for c in chunks if c.is_test]
+
+    try:
+        compile(shared, "<shared>", "exec")
+    except SyntaxError as exc:
+        return ModuleReport(len(tests), [], f"SyntaxError in shared code: {exc.msg} (line {exc.lineno})")
+
+    failures: List[FunctionFailure] = []
+    files = {"test_shared.py": shared + "\n"}
+    names: Dict[str, str] = {}
+    # Lines before the function in its file: shared code plus two blank lines
+    offset = shared.count("\n") + 3 if shared else 0
+    for i, chunk in enumerate(tests):
+        source = (shared + "\n\n\n" if shared else "") + chunk.source + "\n"
+        try:
+            compile(source, chunk.name or "<test>", "exec")
+        except SyntaxError as exc:
+            failures.append(FunctionFailure(chunk.name or f"#{i}", _syntax_error(exc, offset)))
+            continue
+        stem = f"test_fn_{i}"
+        files[stem + ".py"] = source
+        names[stem] = chunk.name or stem
+
+    errors, run_error = _run_pytest(files, timeout_seconds)
+    if run_error is not None:
+        return ModuleReport(len(tests), failures, run_error)
+    if "test_shared" in errors:
+        return ModuleReport(len(tests), failures, errors["test_shared"])
+    for stem, name in names.items():
+        if stem in errors:
+            failures.append(FunctionFailure(name, errors[stem]))
+    return ModuleReport(len(tests), failures, None)
+
+
+def _strip_fences(text: str) -> str:
+    return _FENCE_RE.sub("", text).strip()
+
+
+def _splice(chunks: List[Chunk], name: str, answer: str) -> bool:
+    """Replace test chunk `name` with the function in answer; False if none found."""
+    new_chunks = split_module(_strip_fences(answer))
+    replacement = next((c for c in new_chunks if c.is_test and c.name == name), None)
+    if replacement is None:
+        replacement = next((c for c in new_chunks if c.is_test), None)
+        if replacement is None:
+            return False
+        # Renamed by the model: restore the name so tests don't shadow each other.
+        source = re.sub(
+            rf"\bdef\s+{re.escape(replacement.name)}\b",
+            f"def {name}",
+            replacement.source,
+            count=1,
+        )
+        replacement = Chunk(name, source, True)
+
+    for i, chunk in enumerate(chunks):
+        if chunk.is_test and chunk.name == name:
+            chunks[i] = replacement
+            break
+    # Hoist imports the fix needs.
+    existing = {line for c in chunks if not c.is_test for line in c.source.splitlines()}
+    for c in new_chunks:
+        if c.name is None and not c.is_test:
+            for line in c.source.splitlines():
+                if line.startswith(("import ", "from ")) and line not in existing:
+                    chunks.insert(0, Chunk(None, line, False))
+                    existing.add(line)
+    return True
+
+
+def disable_functions(code: str, failures: List[FunctionFailure]) -> str:
+    """Comment out failing test functions, keeping the error next to them."""
+    failed = {f.name: f.error for f in failures}
+    chunks = split_module(code)
+    for i, chunk in enumerate(chunks):
+        if chunk.is_test and chunk.name in failed:
+            error = " ".join(failed[chunk.name].split("\n", 1)[0].split())
+            body = "\n".join(f"# {line}" if line else "#" for line in chunk.source.splitlines())
+            chunks[i] = Chunk(
+                None, f"# Disabled by validation ({error}):\n{body}", False
+            )
+    return join_chunks(chunks)
+
+
+def repair_module(
+    code: str,
+    client: ChatClient,
+    max_rounds: int = DEFAULT_REPAIR_ROUNDS,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    disable_failing: bool = True,
+) -> RepairResult:
+    """
+    Validate code and re-prompt client with each failing function and its
+    error, up to max_rounds times. Failing functions are fixed
+    concurrently; passing ones are never re-sent.
+    """
+    repaired: List[str] = []
+    rounds = 0
+    report = validate_module(code, timeout_seconds)
+    initial_failures = len(report.failures)
+    VALIDATION_FAILURES.inc(initial_failures)
+    while not report.ok and report.module_error is None and rounds < max_rounds:
+        rounds += 1
+        chunks = split_module(code)
+        by_name = {c.name: c for c in chunks if c.is_test}
+        shared = "\n\n\n".join(c.source for c in chunks if not c.is_test)
+        failing = [f for f in report.failures if f.name in by_name]
+
+        def ask(failure: FunctionFailure) -> Optional[str]:
+            messages = build_repair_messages(by_name[failure.name].source, failure.error, shared)
+            try:
+                return client.chat(messages)
+            except OllamaError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(4, len(failing)))) as pool:
+            answers = list(pool.map(ask, failing))
+        changed = False
+        for failure, answer in zip(failing, answers):
+            if answer is not None and _splice(chunks, failure.name, answer):
+                changed = True
+                if failure.name not in repaired:
+                    repaired.append(failure.name)
+        if not changed:
+            break
+        code = join_chunks(chunks)
+        report = validate_module(code, timeout_seconds)
+
+    still_failing = {f.name for f in report.failures}
+    repaired = [name for name in repaired if name not in still_failing]
+    disabled: List[str] = []
+    if disable_failing and report.failures and report.module_error is None:
+        code = disable_functions(code, report.failures)
+        disabled = [f.name for f in report.failures]
+    VALIDATED_FUNCTIONS.inc(max(0, report.tests - initial_failures), outcome="passed")
+    VALIDATED_FUNCTIONS.inc(len(repaired), outcome="repaired")
+    VALIDATED_FUNCTIONS.inc(len(disabled), outcome="disabled")
+    return RepairResult(code, report, rounds, repaired, disabled)
+
+
+def validate_modules(
+    modules: Dict[K, str],
+    workers: int = 4,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+) -> Dict[K, ModuleReport]:
+    """Validate many modules concurrently (one pytest process each)."""
+    keys = list(modules)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        reports = pool.map(lambda k: validate_module(modules[k], timeout_seconds), keys)
+        return dict(zip(keys, reports))
+
+
+def repair_modules(
+    modules: Dict[K, str],
+    client: ChatClient,
+    workers: int = 4,
+    max_rounds: int = DEFAULT_REPAIR_ROUNDS,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    disable_failing: bool = True,
+) -> Dict[K, RepairResult]:
+    """Run repair_module() over many modules concurrently."""
+    keys = list(modules)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(
+            lambda k: repair_module(
+                modules[k], client, max_rounds, timeout_seconds, disable_failing
+            ),
+            keys,
+        )
+        return dict(zip(keys, results))